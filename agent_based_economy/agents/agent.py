@@ -16,87 +16,73 @@ from agent_based_economy.accounting import BalanceSheet
 
 class Agent:    
     
-    asset_keys = []
-    liability_keys = []
+    # Every class in the agent hierarchy declares __slots__, the role 
+    # mixins declare none and each concrete agent slots the attributes 
+    # its roles assign, so no agent instance carries a __dict__
+    __slots__ = ('model', 'unique_id', '_asset_keys', '_liability_keys')
+    
+    # Balance sheet key tuples, shared by every agent with the same roles
+    _shared_keys = {}
     
     def __init__(self, model):
         self.model = model
         self.unique_id = model.next_id()
-   
-    def superclasses(self):
-        return [x.__name__ for x in self.__class__.__mro__]
-    
-    @property
-    def is_firm(self):
-        return 'Firm' in self.superclasses()
-    
-    @property
-    def is_individual(self):
-        return 'Individual' in self.superclasses()
-
-    @property
-    def is_bank(self):
-        return 'Bank' in self.superclasses()
-    
-    @property
-    def is_central(self):
-        return 'CentralBank' in self.superclasses()
-    
-    @property
-    def is_commercial(self):
-        return 'CommercialBank' in self.superclasses()     
-    
-    @property
-    def is_government(self):
-        return 'Government' in self.superclasses()
-    
-    @property
-    def issues_deposits(self):
-        return 'DepositIssuer' in self.superclasses()
-    
-    @property
-    def holds_deposits(self):
-        return 'DepositHolder' in self.superclasses()    
-    
+        self.asset_keys = ()
+        self.liability_keys = ()
+        model.register_agent(self)
+        
     @property
-    def borrows(self):
-        return 'Borrower' in self.superclasses()
+    def asset_keys(self):
+        return self._asset_keys
     
+    @asset_keys.setter
+    def asset_keys(self, keys):
+        self._asset_keys = self._shared_keys.setdefault(tuple(keys), tuple(keys))
+        
     @property
-    def lends(self):
-        return 'lender' in self.superclasses()
+    def liability_keys(self):
+        return self._liability_keys
     
-    @property
-    def issues_bonds(self):
-        return 'BondIssuer' in self.superclasses()
-    
-    @property
-    def holds_bonds(self):
-        return 'BondHolder' in self.superclasses()
-    
-    @property
-    def issues_stock(self):
-        return 'StockIssuer' in self.superclasses()
-    
-    @property
-    def holds_stock(self):
-        return 'StockHolder' in self.superclasses()
-    
-    @property
-    def levies_taxes(self):
-        return 'TaxAuthority' in self.superclasses()
-    
-    @property
-    def pays_taxes(self):
-        return 'Taxpayer' in self.superclasses()
-    
-    @property
-    def is_employable(self):
-        return 'Employee' in self.superclasses()
-    
-    @property
-    def is_employer(self):
-        return 'Employer' in self.superclasses()
+    @liability_keys.setter
+    def liability_keys(self, keys):
+        self._liability_keys = self._shared_keys.setdefault(tuple(keys), tuple(keys))
+   
+    # Role flags and the class name in the hierarchy that confers each one.
+    # They are set once per class as plain class attributes, see
+    # __init_subclass__, rather than scanning the MRO on every access
+    role_flags = {
+        'is_firm':         'Firm',
+        'is_individual':   'Person',
+        'is_bank':         'Bank',
+        'is_central':      'CentralBank',
+        'is_commercial':   'CommercialBank',
+        'is_government':   'Government',
+        'issues_deposits': 'DepositIssuer',
+        'holds_deposits':  'DepositHolder',
+        'borrows':         'Borrower',
+        'lends':           'Lender',
+        'issues_bonds':    'BondIssuer',
+        'holds_bonds':     'BondHolder',
+        'issues_stock':    'StockIssuer',
+        'holds_stock':     'StockHolder',
+        'levies_taxes':    'TaxAuthority',
+        'pays_taxes':      'TaxPayer',
+        'is_employable':   'Employee',
+        'is_employer':     'Employer',
+        }
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._set_role_flags()
+        
+    @classmethod
+    def _set_role_flags(cls):
+        names = {x.__name__ for x in cls.__mro__}
+        for flag, role in cls.role_flags.items():
+            setattr(cls, flag, role in names)
+   
+    def superclasses(self):
+        return [x.__name__ for x in self.__class__.__mro__]
     
     def __str__(self):
         return f'{self.__class__.__name__}: {id(self)}'
@@ -124,4 +110,7 @@ class Agent:
         """
         Random check between 0 and 1
         """
-        return random.random() < chance
\ No newline at end of file
+        return random.random() < chance
+
+
+Agent._set_role_flags()
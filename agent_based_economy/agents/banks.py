@@ -9,7 +9,7 @@ from agent_based_economy.agents.agent import Agent
 from agent_based_economy.agents.roles import Lender, ReserveIssuer, ReserveHolder, DepositIssuer, BondHolder, Borrower
 
 class Bank(Agent, Lender, BondHolder):       
-    __slots__ = ()
+    __slots__ = ('_loan_interest_rate', '_default_loan_maturity_days')
         
     def __init__(self, model):             
         super().__init__(model)  
@@ -19,8 +19,8 @@ class Bank(Agent, Lender, BondHolder):
     
 
 class CentralBank(Bank, ReserveIssuer):
-    __slots__ = ('model', 'unique_id', '_target_interest_rate', '_deposit_interest_rate', '_loan_interest_rate', 
-                 '_interest_rate_spread')  
+    __slots__ = ('_target_interest_rate', '_deposit_interest_rate', '_lending_rate_spread', 
+                 'net_settlement', '_pending_settlements')  
     
     def __init__(self, model, target_interest_rate=2, lending_rate_spread=0.25):             
         super().__init__(model)          
@@ -68,7 +68,7 @@ class CentralBank(Bank, ReserveIssuer):
                 
 
 class CommercialBank(Bank, DepositIssuer, ReserveHolder, Borrower):  
-    __slots__ = ('model', 'unique_id', '_deposit_interest_rate', '_loan_interest_rate') 
+    __slots__ = ('_deposit_interest_rate', 'bank', 'deposit_account_number') 
     
     def __init__(self, model):   
         super().__init__(model)    
@@ -13,6 +13,7 @@ from typing import List, Tuple
 from agent_based_economy.agents.agent import Agent
 from agent_based_economy.agents.roles import DepositHolder, Lender, Borrower, BondHolder
 from agent_based_economy.utils import floor_with_precision, ceil_with_precision
+from agent_based_economy.population import Field, OptionalField, MemberField
 
 # CONFIG
 
@@ -169,18 +170,35 @@ class Firm(Agent, DepositHolder):
         """
         return rand_generator.uniform(0, cls.upsilon)
     
-    __slots__ = ('model', 'unique_id', 'goods_price', 'inventory', 'current_demand', 
-                 'wage_rate', 'worker_on_notice', 'workers', 'has_open_position', 
-                 'months_since_hire_failure', 'marginal_cost_deflator', 'raised_wage', 
-                 'lowered_wage', 'inventories_too_low', 'inventories_too_high', 
-                 'worker_on_notice', 'considered_price_change', 'recent_demand', 
-                 'current_marginal_cost', 'raised_goods_price', 'lowered_goods_price', 
-                 'profit')
+    # Scalar state is held in the model's firm_population arrays
+    __slots__ = ('bank', 'population', 'population_slot', 'workers')
+    
+    goods_price               = Field()
+    inventory                 = Field()
+    current_demand            = Field()
+    wage_rate                 = Field()
+    worker_on_notice          = MemberField('household_population')
+    has_open_position         = Field(bool, False)
+    months_since_hire_failure = Field(np.int64)
+    marginal_cost_deflator    = Field()
+    raised_wage               = Field(bool, False)
+    lowered_wage              = Field(bool, False)
+    inventories_too_low       = Field(bool, False)
+    inventories_too_high      = Field(bool, False)
+    considered_price_change   = Field(bool, False)
+    recent_demand             = Field()
+    current_marginal_cost     = Field()
+    raised_goods_price        = Field(bool, False)
+    lowered_goods_price       = Field(bool, False)
+    profit                    = Field()
+    deposit_account_number    = OptionalField()
     
     def __init__(self, model, initial_goods_price: int, initial_wage_rate: int) -> None:
         """
         Customize the agent
         """
+        self.population      = model.firm_population
+        self.population_slot = self.population.add(self)
         super().__init__(model)      
         DepositHolder.__init__(self)  
         
@@ -321,8 +339,7 @@ class Firm(Agent, DepositHolder):
             self.lowered_wage = True
             self.wage_rate = self.deposit_balance // num_workers
         
-        for hh in self.workers:
-            self.pay(hh.deposit_account_number, self.wage_rate)
+        self.pay_many([hh.deposit_account_number for hh in self.workers], self.wage_rate)
         
     def distribute_profits(self,
                             shareholding: List[Tuple],
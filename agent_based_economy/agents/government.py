@@ -9,6 +9,7 @@ from agent_based_economy.agents.agent import Agent
 from agent_based_economy.agents.roles import ReserveHolder, Lender, Borrower, BondIssuer
 
 class Government(Agent, ReserveHolder, Borrower, BondIssuer):  
+    __slots__ = ('bank', 'deposit_account_number')
     
     def __init__(self, model):      
         super().__init__(model)         
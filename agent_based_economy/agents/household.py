@@ -8,7 +8,8 @@ import math
 import random
 import numpy as np
 from operator import attrgetter
-from agent_based_economy.agents.individual import Individual 
+from agent_based_economy.agents.individual import Person
+from agent_based_economy.population import Field, OptionalField, MemberField
         
 class HouseholdConfig:
     """
@@ -79,8 +80,23 @@ def planned_consumption_amount(income, current_liquidity: int, average_price: fl
         return np.min([(current_liquidity / average_price) ** HouseholdConfig.alpha, (current_liquidity / average_price)])
 
 
+def adjust_reservation_wages(model) -> None:
+    """
+    Household.adjust_reservation_wage for every household at once
+    """
+    households = model.household_population
+    employer   = households['employer']
+    employed   = employer >= 0
+    reservation_wage = households['reservation_wage']
+    reservation_wage[~employed] *= HouseholdConfig.wage_decay_rate
+    reservation_wage[employed] = np.maximum(
+        reservation_wage[employed],
+        model.firm_population['wage_rate'][employer[employed]]
+    )
+
+
 # AGENT
-class Household(Individual):  
+class Household(Person):  
 
     """
     Household Agent
@@ -91,19 +107,38 @@ class Household(Individual):
     blackmarked_firms: firms that have failed to supply this month
     employer: The firm we're working for, None if unemployed
     current_demand: How many goods to buy each day
+    
+    Scalar state is held in the model's household_population arrays,
+    the supplier lists stay on the object.
     """
     
-    __slots__ = ('model', 'unique_id', 'reservation_wage', 'preferred_suppliers', 'employer',
-                 'blackmarked_firms', 'looked_for_cheaper_vendor', 'found_cheaper_vendor',
-                 'looked_for_better_vendor', 'found_better_vendor', 'vendor_already_replaced',
-                 'looked_for_new_job', 'found_new_job', 'average_goods_price', 'planned_consumption',
-                 'current_demand', 'planned_saving', 'poverty', 'unsatisfied_demand',
-                 'demand_constraints_suffered', 'income')
+    __slots__ = ('population', 'population_slot', 'preferred_suppliers', 'blackmarked_firms')
+    
+    reservation_wage            = Field()
+    employer                    = MemberField('firm_population')
+    looked_for_cheaper_vendor   = Field(bool, False)
+    found_cheaper_vendor        = Field(bool, False)
+    looked_for_better_vendor    = Field(bool, False)
+    found_better_vendor         = Field(bool, False)
+    vendor_already_replaced     = Field(bool, False)
+    looked_for_new_job          = Field(bool, False)
+    found_new_job               = Field(bool, False)
+    average_goods_price         = Field()
+    planned_consumption         = Field()
+    current_demand              = Field()
+    planned_saving              = Field()
+    poverty                     = Field(bool, False)
+    unsatisfied_demand          = Field()
+    demand_constraints_suffered = Field(np.int64)
+    income                      = Field()
+    deposit_account_number      = OptionalField()
 
     def __init__(self, model) -> None:
         """
         Customize the agent
         """
+        self.population      = model.household_population
+        self.population_slot = self.population.add(self)
         super().__init__(model)
         self.reservation_wage = HouseholdConfig.initial_reservation_wage
         self.preferred_suppliers = random.choices(
@@ -142,6 +177,7 @@ class Household(Individual):
     def month_end(self) -> None:
         """
         Run the month end household procedures
+        The scheduler runs the whole population with adjust_reservation_wages
         """
         self.adjust_reservation_wage()
 
@@ -7,11 +7,18 @@ Created on Wed Jul  5 15:33:55 2023
 from agent_based_economy.agents.agent import Agent
 from agent_based_economy.agents.roles import DepositHolder, Lender, Borrower, BondHolder
 
-class Individual(Agent, DepositHolder, Borrower, Lender, BondHolder):    
+class Person(Agent, DepositHolder, Borrower, Lender, BondHolder):    
+    # The deposit account number is left to the concrete class, which may
+    # hold it in a population column rather than a slot
+    __slots__ = ('bank', '_loan_interest_rate', '_default_loan_maturity_days')
+    
     def __init__(self, model):        
         super().__init__(model)           
         DepositHolder.__init__(self)            
         Borrower.__init__(self)                 
         Lender.__init__(self)      
-        BondHolder.__init__(self)      
-        
\ No newline at end of file
+        BondHolder.__init__(self)
+
+
+class Individual(Person):
+    __slots__ = ('deposit_account_number',)
@@ -13,8 +13,8 @@ class DepositIssuer:
     
     def __init__(self):
         self._deposit_interest_rate = 0          
-        self.liability_keys = self.liability_keys + ['_deposit_liabilities']
-        self.asset_keys = self.asset_keys + ['_overdraft_assets']
+        self.liability_keys = self.liability_keys + ('_deposit_liabilities',)
+        self.asset_keys = self.asset_keys + ('_overdraft_assets',)
     
     @property
     def deposit_interest_rate(self):
@@ -84,7 +84,7 @@ class DepositIssuer:
                 
                 self.debit(from_account_number, value, authenticated=True) 
                 to_bank.credit(to_account_number, value, authenticated=True)
-                self.bank.settle_payment(self.deposit_account_number, to_bank.deposit_account_number, value)
+                self.bank.settle_interbank_payment(self, to_bank, value)
                 
             elif (self.is_central and to_bank.is_commercial):
                 '''
@@ -110,6 +110,56 @@ class DepositIssuer:
         else:
             raise Exception('Insufficient funds for requested transfer')
             
+    def settle_payments(self, from_account_number, to_account_numbers, values):
+        '''
+        Settle a batch of payments from one account, e.g. a payroll.
+        Payments are grouped by the recipients' banks: each group is applied 
+        to the deposit ledger in a single call and the reserves move once 
+        per bank for the group total, following the same cases as 
+        settle_payment.
+        '''
+        ledger = self.model.deposit_ledger
+        to_account_numbers = np.asarray(to_account_numbers, dtype=np.int64)
+        values = np.broadcast_to(np.asarray(values, dtype=np.float64), to_account_numbers.shape)
+        
+        if len(to_account_numbers) == 0:
+            return
+        
+        if not (ledger.account_exists(from_account_number) and 
+                ledger.accounts_exist(to_account_numbers).all() and
+                self.authenticate_deposit_account(from_account_number)):
+            raise Exception('Specified accounts cannot be identified')
+        
+        # A negative value would reverse a payment the funds check nets off
+        if not (np.isfinite(values) & (values >= 0)).all():
+            raise ValueError('Payment values must be finite and not negative')
+            
+        if ledger.available_funds(from_account_number) < values.sum():
+            raise Exception('Insufficient funds for requested transfer')
+        
+        to_banks = ledger.issuer_ids(to_account_numbers)
+        for bank_id in np.unique(to_banks):
+            to_bank = self.model.agent(bank_id)
+            in_bank = to_banks == bank_id
+            to_accounts, to_values = to_account_numbers[in_bank], values[in_bank]
+            total = to_values.sum()
+            
+            if self == to_bank:
+                ledger.transfer_many(np.full(len(to_accounts), from_account_number), to_accounts, to_values)
+                
+            elif (self.is_commercial and to_bank.is_commercial):
+                self.debit(from_account_number, total, authenticated=True)
+                ledger.credit_many(to_accounts, to_values)
+                self.bank.settle_interbank_payment(self, to_bank, total)
+                
+            elif (self.is_central and to_bank.is_commercial):
+                ledger.credit_many(to_accounts, to_values)
+                self.settle_payment(from_account_number, to_bank.deposit_account_number, total)
+                
+            elif (self.is_commercial and to_bank.is_central):
+                self.debit(from_account_number, total, authenticated=True)
+                self.bank.settle_payment(self.deposit_account_number, to_bank.deposit_account_number, total)
+    
     def credit(self, idx, value, authenticated=False):
         if authenticated | self.authenticate_deposit_account(idx):
             self.model.deposit_ledger.credit(idx, value)
@@ -128,7 +178,7 @@ class DepositIssuer:
         self.model.deposit_ledger.apply_daily_interest(issuer=self)
         
     def get_all_issued_deposit_accounts(self, except_counterparties=[]):
-        return self.model.deposit_ledger.df.iloc[np.where((self.model.deposit_ledger.df.issuer == self)&(~self.model.deposit_ledger.df.holder.isin(except_counterparties)))[0]]
+        return self.model.deposit_ledger.records_by_issuer(self, except_holders=except_counterparties)
     
     def _deposit_liabilities(self, except_counterparties=[]):
         all_accounts = self.get_all_issued_deposit_accounts(except_counterparties=except_counterparties)
@@ -149,8 +199,8 @@ class DepositHolder:
     def __init__(self): 
         self.bank = None
         self.deposit_account_number = None            
-        self.asset_keys = self.asset_keys + ['_deposit_asset']           
-        self.liability_keys = self.liability_keys + ['_overdraft_liability']
+        self.asset_keys = self.asset_keys + ('_deposit_asset',)           
+        self.liability_keys = self.liability_keys + ('_overdraft_liability',)
     
     def open_deposit_account(self, bank, overdraft=0):
         idx = bank.open_deposit_account(self, overdraft)
@@ -166,7 +216,7 @@ class DepositHolder:
     
     @property
     def agreed_overdraft(self):
-        return self.model.deposit_ledger.df.at[self.deposit_account_number, 'overdraft'] if self.has_deposit_account else 0
+        return self.model.deposit_ledger.overdraft(self.deposit_account_number) if self.has_deposit_account else 0
     
     @property   
     def available_funds(self):
@@ -177,6 +227,9 @@ class DepositHolder:
     
     def pay(self, recipient_account_number, value):
         self.bank.settle_payment(self.deposit_account_number, recipient_account_number, value)
+        
+    def pay_many(self, recipient_account_numbers, values):
+        self.bank.settle_payments(self.deposit_account_number, recipient_account_numbers, values)
 
     def _deposit_asset(self, except_counterparties=[]):
         return ('deposit', self.deposit_balance if (self.bank not in except_counterparties) and (self.deposit_balance > 0) else 0)
@@ -192,8 +245,8 @@ class ReserveHolder(DepositHolder):
     def __init__(self): 
         self.bank = None
         self.deposit_account_number = None            
-        self.asset_keys = self.asset_keys + ['_reserve_asset']         
-        self.liability_keys = self.liability_keys + ['_overdraft_liability']
+        self.asset_keys = self.asset_keys + ('_reserve_asset',)         
+        self.liability_keys = self.liability_keys + ('_overdraft_liability',)
     
     def _reserve_asset(self, except_counterparties=[]):
         return ('reserves', self.deposit_balance if (self.bank not in except_counterparties) and (self.deposit_balance > 0) else 0)
@@ -206,8 +259,62 @@ class ReserveIssuer(DepositIssuer):
           
     def __init__(self):
         self.deposit_interest_rate = 0         
-        self.liability_keys = self.liability_keys + ['_reserve_liabilities']
-        self.asset_keys = self.asset_keys + ['_overdraft_assets']
+        self.liability_keys = self.liability_keys + ('_reserve_liabilities',)
+        self.asset_keys = self.asset_keys + ('_overdraft_assets',)
+        self.net_settlement = False
+        self._pending_settlements = {}   # (from bank, to bank) -> value
+    
+    def settle_interbank_payment(self, from_bank, to_bank, value):
+        '''
+        Move reserves between two commercial banks for a customer payment.
+        Under real time gross settlement this happens immediately. Under 
+        deferred net settlement the flow is held until settle_net_positions, 
+        and the banks' reserve overdrafts are not checked per payment.
+        '''
+        if self.net_settlement:
+            key = (from_bank, to_bank)
+            self._pending_settlements[key] = self._pending_settlements.get(key, 0) + value
+        else:
+            self.settle_payment(from_bank.deposit_account_number, to_bank.deposit_account_number, value)
+            
+    def settle_customer_payments(self, from_account_numbers, to_account_numbers, values):
+        '''
+        Settle a batch of payments between customers of commercial banks.
+        The deposit accounts are updated in one ledger call and reserves move 
+        once per pair of banks for the total flowing between them.
+        '''
+        ledger = self.model.deposit_ledger
+        values = np.asarray(values, dtype=np.float64)
+        ledger.transfer_many(from_account_numbers, to_account_numbers, values)
+        
+        from_banks = ledger.issuer_ids(from_account_numbers)
+        to_banks   = ledger.issuer_ids(to_account_numbers)
+        cross_bank = from_banks != to_banks
+        if cross_bank.any():
+            pairs, pair_index = np.unique(np.stack([from_banks[cross_bank], to_banks[cross_bank]], axis=1), 
+                                          axis=0, return_inverse=True)
+            totals = np.bincount(pair_index.ravel(), weights=values[cross_bank])
+            for (from_bank, to_bank), total in zip(pairs.tolist(), totals):
+                self.settle_interbank_payment(self.model.agent(from_bank), self.model.agent(to_bank), total)
+            
+    def settle_net_positions(self):
+        '''
+        Net the deferred flows into one reserve transfer per pair of banks
+        '''
+        pending = self._pending_settlements
+        for pair in list(pending):
+            if pair not in pending:
+                continue    # settled with the flows the other way
+            from_bank, to_bank = pair
+            net = pending[pair] - pending.get((to_bank, from_bank), 0)
+            if net > 0:
+                self.settle_payment(from_bank.deposit_account_number, to_bank.deposit_account_number, net)
+            elif net < 0:
+                self.settle_payment(to_bank.deposit_account_number, from_bank.deposit_account_number, -net)
+            # Dropped once settled, so a failed transfer leaves the pairs 
+            # not yet settled pending
+            del pending[pair]
+            pending.pop((to_bank, from_bank), None)
     
     def _reserve_liabilities(self, except_counterparties=[]):
         all_accounts = self.get_all_issued_deposit_accounts(except_counterparties=except_counterparties)
@@ -225,7 +332,7 @@ class Lender:
     def __init__(self):                 
         self._loan_interest_rate = 0 
         self._default_loan_maturity_days = self.model.schedule.days_in_year
-        self.asset_keys = self.asset_keys + ['_loan_assets']
+        self.asset_keys = self.asset_keys + ('_loan_assets',)
      
     @property
     def loan_interest_rate(self):
@@ -262,17 +369,17 @@ class Lender:
         return True if self.model.loan_ledger.holder(account_number) == self else False
     
     def has_lending_account_with_borrower(self, borrower):
-        return np.any((self.model.loan_ledger.df.holder == self)&(self.model.loan_ledger.df.issuer == borrower))
+        return len(self.model.loan_ledger.indexes_by_issuer_and_holder(borrower, self)) > 0
     
     def get_lending_account_by_borrower(self, borrower):
         account_number = self.get_lending_account_number_by_borrower(borrower)
         return self.get_lending_account_by_account_number(account_number)
         
     def get_lending_account_by_account_number(self, unique_id):
-        return self.model.loan_ledger.df.loc[unique_id]
+        return self.model.loan_ledger.get(unique_id)
         
     def get_lending_account_number_by_borrower(self, borrower):
-        return self.model.loan_ledger.df.index[np.where((self.model.loan_ledger.df.holder == self)&(self.model.loan_ledger.df.issuer == borrower))[0]][0]
+        return self.model.loan_ledger.indexes_by_issuer_and_holder(borrower, self)[0]
     
     def grant_loan_to_borrower(self, borrower, value, interest_rate, maturity_days=None):
         loan_account_number = self.get_lending_account_number_by_borrower(borrower)
@@ -312,6 +419,35 @@ class Lender:
         else:
             raise Exception("Loan and deposit account must be held at this bank")    
     
+    def grant_loans_to_borrowers(self, borrowers, values, interest_rates, maturity_days=None):
+        '''
+        grant_loan_to_borrower for several borrowers, each at most once. 
+        The loans are extended in one ledger call and the deposits credited, 
+        or paid, together, following the same cases as grant_loan.
+        '''
+        if maturity_days is None:
+            maturity_days = self.default_loan_maturity_days
+        
+        loan_account_numbers    = [self.get_lending_account_number_by_borrower(b) for b in borrowers]
+        deposit_account_numbers = np.array([b.deposit_account_number for b in borrowers], dtype=np.int64)
+        values                  = np.asarray(values, dtype=np.float64)
+        if not all(self.authenticate_lending_account(x) for x in loan_account_numbers):
+            raise Exception("Loan and deposit account must be held at this bank")
+        
+        credited = np.array([self.is_bank and (self.is_central or (self.is_commercial and not b.is_bank)) 
+                             for b in borrowers], dtype=bool)
+        if credited.any() and not all(self.authenticate_deposit_account(x) for x in deposit_account_numbers[credited]):
+            raise Exception("Loan and deposit account must be held at lending bank")
+        if not credited.all() and not self.has_deposit_account:
+            raise Exception("Funds not available to support loan")
+        
+        self.model.loan_ledger.extend_loans(loan_account_numbers, values, interest_rates, maturity_days)
+        if credited.any():
+            self.model.deposit_ledger.credit_many(deposit_account_numbers[credited], values[credited])
+        if not credited.all():
+            self.pay_many(deposit_account_numbers[~credited], values[~credited])
+        return True
+    
     def writedown_loan(self, account_number, value, authenticated=False):
         if authenticated | self.authenticate_lending_account(account_number):
             self.model.loan_ledger.writedown_loan(account_number, value)
@@ -320,7 +456,7 @@ class Lender:
             return False
         
     def get_all_held_lending_accounts(self, except_counterparties=[]):
-        return self.model.loan_ledger.df.iloc[np.where((self.model.loan_ledger.df.holder == self)&(~self.model.loan_ledger.df.issuer.isin(except_counterparties)))[0]]
+        return self.model.loan_ledger.records_by_holder(self, except_issuers=except_counterparties)
     
     def _loan_assets(self, except_counterparties=[]):
         return ('loans', self.get_all_held_lending_accounts(except_counterparties=except_counterparties).value.sum())
@@ -334,7 +470,7 @@ class Borrower:
     __slots__ = ()
     
     def __init__(self):    
-        self.liability_keys = self.liability_keys + ['_loan_liabilities']
+        self.liability_keys = self.liability_keys + ('_loan_liabilities',)
         
     def open_borrowing_account(self, lender):
         idx = lender.open_lending_account(self)
@@ -348,23 +484,23 @@ class Borrower:
             raise Exception("Agent doesn't have an existing bank account") 
     
     def has_borrowing_account_with_lender(self, lender):
-        return np.any((self.model.loan_ledger.df.issuer == self)&(self.model.loan_ledger.df.holder == lender))
+        return len(self.model.loan_ledger.indexes_by_issuer_and_holder(self, lender)) > 0
     
     def get_borrowing_account_by_lender(self, lender):
         account_number = self.get_borrowing_account_number_by_lender(lender)
         return self.get_borrowing_account_by_account_number(account_number)
         
     def get_borrowing_account_by_account_number(self, unique_id):
-        return self.model.loan_ledger.df.loc[unique_id]
+        return self.model.loan_ledger.get(unique_id)
         
     def get_borrowing_account_number_by_lender(self, lender):
-        return self.model.loan_ledger.df.index[np.where((self.model.loan_ledger.df.issuer == self)&(self.model.loan_ledger.df.holder == lender))[0]][0]
+        return self.model.loan_ledger.indexes_by_issuer_and_holder(self, lender)[0]
     
     def loan_balance_by_lender(self, lender):
         return self.get_borrowing_account_by_lender(lender).value if self.has_borrowing_account_with_lender(lender) else 0
     
     def loan_balance_by_account_number(self, unique_id):
-        return self.model.loan_ledger.df.at[unique_id, 'value']
+        return self.model.loan_ledger.current_balance(unique_id)
             
     def make_loan_repayment(self, value, lender=None, account_number=None):
         if lender is not None:
@@ -405,7 +541,7 @@ class Borrower:
     #         self.make_loan_repayment(deposit_balance)
     
     def get_all_issued_borrowing_accounts(self, except_counterparties=[]):
-        return self.model.loan_ledger.df.iloc[np.where((self.model.loan_ledger.df.issuer == self)&(~self.model.loan_ledger.df.holder.isin(except_counterparties)))[0]]
+        return self.model.loan_ledger.records_by_issuer(self, except_holders=except_counterparties)
     
     def _loan_liabilities(self, except_counterparties=[]):
         return ('loans', self.get_all_issued_borrowing_accounts(except_counterparties=except_counterparties).value.sum())
@@ -419,7 +555,7 @@ class BondIssuer:
     # Both ledgers/portfolios are called .bonds
     
     def __init__(self):
-        self.liability_keys = self.liability_keys + ['_bond_liabilities']
+        self.liability_keys = self.liability_keys + ('_bond_liabilities',)
     
     def create_bonds(self, value, rate, maturity_years):
         new_bond_references = self.model.bond_ledger.create_bulk_value(self, value, rate, maturity_years)
@@ -427,14 +563,25 @@ class BondIssuer:
         self.model.bond_exchange.register_bond_issue(example_bond['maturity_date'], rate)
         return new_bond_references
     
-    def buy_bond(self, seller, price, idx):
+    def buy_bond(self, seller, price, idx, quantity=None):
         # assume only buy back own bonds for now
-        seller.sell_bond(self, price, idx)
+        return seller.sell_bond(self, price, idx, quantity)
     
-    def sell_bond(self, buyer, price, idx):
+    def sell_bond(self, buyer, price, idx, quantity=None):
         # Only sell own bonds
-        buyer.pay(self.deposit_account_number, price)
-        self.model.bond_ledger.transfer(idx,buyer)
+        # Price is per bond, quantity defaults to the whole record
+        ledger = self.model.bond_ledger
+        quantity = ledger.quantity(idx) if quantity is None else quantity
+        ledger.check_transfer([idx], [buyer], [quantity])
+        buyer.pay(self.deposit_account_number, price*quantity)
+        return ledger.transfer(idx, buyer, quantity)
+    
+    def sell_bonds(self, buyer, price, ids, quantities=None):
+        # One payment for all the bonds, quantities default to whole records
+        ledger = self.model.bond_ledger
+        quantities = ledger.check_transfer(ids, [buyer]*len(ids), quantities)[-1]
+        buyer.pay(self.deposit_account_number, price*quantities.sum())
+        return ledger.transfer_many(ids, [buyer]*len(quantities), quantities)
         
     def offer_bonds(self, maturity_date, coupon_rate, quantity, price):
         market = self.model.bond_exchange.get_market(maturity_date, coupon_rate)
@@ -449,12 +596,13 @@ class BondIssuer:
             self.bonds.close(i)
     
     def get_all_issued_bonds(self, except_counterparties=[]):
-        return self.model.bond_ledger.df.iloc[np.where((self.model.bond_ledger.df.issuer == self)&(~self.model.bond_ledger.df.holder.isin(except_counterparties)))[0]]
+        return self.model.bond_ledger.records_by_issuer(self, except_holders=except_counterparties)
     
     def _bond_liabilities(self, except_counterparties=[]):
         all_bonds = self.get_all_issued_bonds(except_counterparties=except_counterparties)
-        return ('bonds', all_bonds.iloc[np.where(all_bonds['holder']!=self)[0]].mark_to_market_value.sum())
-        # return ('bonds', all_bonds.iloc[np.where(all_bonds['holder']!=self)[0]].hold_to_maturity_value.sum())
+        bonds = all_bonds.iloc[np.where(all_bonds['holder']!=self.unique_id)[0]]
+        return ('bonds', (bonds.mark_to_market_value*bonds.quantity).sum())
+        # return ('bonds', all_bonds.iloc[np.where(all_bonds['holder']!=self.unique_id)[0]].hold_to_maturity_value.sum())
  
 #%%
 
@@ -463,22 +611,34 @@ class BondHolder:
     
     
     def __init__(self):
-        self.asset_keys = self.asset_keys + ['_bond_assets']
-    
-    def buy_bond(self, seller, price, idx):
-        seller.sell_bond(self, price, idx)
-    
-    def sell_bond(self, buyer, price, idx):
-        buyer.pay(self.deposit_account_number, price)
-        self.model.bond_ledger.transfer(idx,buyer)
+        self.asset_keys = self.asset_keys + ('_bond_assets',)
+    
+    def buy_bond(self, seller, price, idx, quantity=None):
+        return seller.sell_bond(self, price, idx, quantity)
+    
+    def sell_bond(self, buyer, price, idx, quantity=None):
+        # Price is per bond, quantity defaults to the whole record
+        ledger = self.model.bond_ledger
+        quantity = ledger.quantity(idx) if quantity is None else quantity
+        ledger.check_transfer([idx], [buyer], [quantity])
+        buyer.pay(self.deposit_account_number, price*quantity)
+        return ledger.transfer(idx, buyer, quantity)
+    
+    def sell_bonds(self, buyer, price, ids, quantities=None):
+        # One payment for all the bonds, quantities default to whole records
+        ledger = self.model.bond_ledger
+        quantities = ledger.check_transfer(ids, [buyer]*len(ids), quantities)[-1]
+        buyer.pay(self.deposit_account_number, price*quantities.sum())
+        return ledger.transfer_many(ids, [buyer]*len(quantities), quantities)
     
     def get_all_held_bonds(self, except_counterparties=[]):
-        return self.model.bond_ledger.df.iloc[np.where((self.model.bond_ledger.df.holder == self)&(~self.model.bond_ledger.df.issuer.isin(except_counterparties)))[0]]
+        return self.model.bond_ledger.records_by_holder(self, except_issuers=except_counterparties)
     
     def _bond_assets(self, except_counterparties=[]):        
         all_bonds = self.get_all_held_bonds(except_counterparties=except_counterparties)
-        return ('bonds', all_bonds.iloc[np.where(all_bonds['issuer']!=self)[0]].mark_to_market_value.sum())
-        # return ('bonds', all_bonds.iloc[np.where(all_bonds['issuer']!=self)[0]].hold_to_maturity_value.sum())
+        bonds = all_bonds.iloc[np.where(all_bonds['issuer']!=self.unique_id)[0]]
+        return ('bonds', (bonds.mark_to_market_value*bonds.quantity).sum())
+        # return ('bonds', all_bonds.iloc[np.where(all_bonds['issuer']!=self.unique_id)[0]].hold_to_maturity_value.sum())
     
 #%%
 
@@ -15,7 +15,7 @@ class StockRegistrar(Agent, DepositHolder):
 
     """
     
-    __slots__ = ('model', 'unique_id', 'dividend_ledger')
+    __slots__ = ('bank', 'deposit_account_number', 'dividend_ledger')
 
     def __init__(self, model) -> None:
         """
@@ -30,7 +30,7 @@ class StockRegistrar(Agent, DepositHolder):
         self.dividend_ledger['Dividends due'] += values_per_household
         
     def pay_dividends(self):
-        for idx in self.dividend_ledger.index:
-            self.pay(idx.deposit_account_number, self.dividend_ledger.at[idx, 'Dividends due'])
+        self.pay_many([hh.deposit_account_number for hh in self.dividend_ledger.index], 
+                      self.dividend_ledger['Dividends due'].values)
                
         self.dividend_ledger['Dividends due'] = 0        
\ No newline at end of file
@@ -8,6 +8,9 @@ class TimeseriesAnimation(animation.TimedAnimation):
     '''
     Assumes monthly output
     Only supports line plots
+    skip_days counts on the model's own calendar, so a model restored 
+    past its warm-up with Model.load_checkpoint is stepped and plotted 
+    from the first frame, without the data it collected before skip_days
     '''
     
     def __init__(self, model, 
@@ -76,16 +79,19 @@ class TimeseriesAnimation(animation.TimedAnimation):
         else:
             [self.model.step(output_frequency='m', save_output=True) for t in range(self.model.schedule.days_in_month)]
             
+            # A model restored from a checkpoint may hold data collected during its warm-up
+            df = self.model.datacollector.df
+            df = df[df.index >= self.skip_days]
             for i,key in enumerate(self.model.datacollector.model_reporters.keys()):
-                self.lines[i].set_data(self.model.datacollector.df.index/self.model.schedule.days_in_year, self.model.datacollector.df[key])
+                self.lines[i].set_data(df.index/self.model.schedule.days_in_year, df[key])
                 if framedata>1:
-                    min_y = self.model.datacollector.df[key].min()
-                    max_y = self.model.datacollector.df[key].max()
+                    min_y = df[key].min()
+                    max_y = df[key].max()
                     range_y = max_y-min_y
                     min_y = min_y - range_y*0.1
                     max_y = max_y + range_y*0.1
                     
-                    self.axs_flat[i].set_xlim([self.model.datacollector.df.index.min(),self.model.datacollector.df.index.max()]/self.model.schedule.days_in_year)
+                    self.axs_flat[i].set_xlim([df.index.min(),df.index.max()]/self.model.schedule.days_in_year)
                     self.axs_flat[i].set_ylim([min_y, max_y])
                 
             self.fig.suptitle(f'Model year: {self.model.schedule.year}, model month:{self.model.schedule.month}', fontsize=10)
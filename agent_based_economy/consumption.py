@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 10:12:41 2026
+
+@author: andre
+"""
+
+import random
+import numpy as np
+from agent_based_economy.agents.household import HouseholdConfig
+
+class ConsumptionEngine:
+    """
+    Batched replacement for calling Household.day on every household.
+
+    Demand, balances, prices and inventories are read from the population
+    arrays and the households visit their preferred suppliers in rounds, one supplier
+    per round. Within a round each firm serves its queue in the order of the
+    (already shuffled) household list, so an earlier household sees more
+    inventory, as in the per-agent path. Supplier order is shuffled for each
+    household every day.
+
+    The rules are those of Household.buy_goods - affordability, the
+    satisfaction threshold, blackmarking and unsatisfied demand. To stay
+    close to the sequential path the households are taken in chunks, and
+    within a chunk a household's second supplier is visited after every
+    household's first, so results are statistically rather than exactly
+    equivalent. The chunk size defaults to the number of firms, which keeps
+    the queue at any one firm short; a chunk size of one reproduces the
+    sequential ordering.
+
+    All the day's purchases are posted to the deposit ledger in one batch.
+    """
+
+    __slots__ = ('model', 'rng', 'chunk_size')
+
+    def __init__(self, model, seed=None, chunk_size=None):
+        self.model = model
+        self.chunk_size = chunk_size
+        # Draw from the global generator when unseeded so that a seeded
+        # run stays reproducible
+        self.rng   = np.random.default_rng(seed if seed is not None else random.getrandbits(64))
+
+    def day(self) -> None:
+        """
+        Run the daily purchases for every household
+        """
+        households = self.model.households
+        if len(households) == 0 or len(self.model.firms) == 0:
+            return
+
+        ledger         = self.model.deposit_ledger
+        household_data = self.model.household_population
+        firm_data      = self.model.firm_population
+        
+        # Households in the order of the model's list, firms by population slot
+        slots          = np.array([hh.population_slot for hh in households], dtype=np.int64)
+        suppliers      = np.array([[firm.population_slot for firm in hh.preferred_suppliers]
+                                   for hh in households], dtype=np.int64)
+        demand         = household_data['current_demand'][slots]
+        accounts       = household_data['deposit_account_number'][slots]
+        firm_accounts  = firm_data['deposit_account_number']
+        price          = firm_data['goods_price'].copy()
+        inventory      = firm_data['inventory'].copy()
+        balance        = ledger.current_balances(accounts)
+        n_firms        = len(firm_data)
+
+        # Visit suppliers in a random order, kept by the households as
+        # buy_goods shuffles their lists in place
+        shuffle   = self.rng.random(suppliers.shape).argsort(axis=1)
+        suppliers = np.take_along_axis(suppliers, shuffle, axis=1)
+        firms     = firm_data.agents
+        for hh, order in zip(households, suppliers.tolist()):
+            hh.preferred_suppliers[:] = [firms[j] for j in order]
+
+        remaining    = demand.copy()
+        satisfaction = np.floor(demand * (1 - HouseholdConfig.satisfaction_fraction))
+        sold         = np.zeros(n_firms)
+        purchases    = []
+        blackmarks   = []
+
+        chunk_size = self.chunk_size or n_firms
+        for start in range(0, len(households), chunk_size):
+            chunk = np.arange(start, min(start + chunk_size, len(households)))
+            for k in range(suppliers.shape[1]):
+                active = chunk[remaining[chunk] > satisfaction[chunk]]
+                if len(active) == 0:
+                    break
+
+                vendor     = suppliers[active, k]
+                affordable = np.full(len(active), np.inf)
+                priced     = price[vendor] > 0
+                affordable[priced] = balance[active[priced]] // price[vendor[priced]]
+                wanted     = np.minimum(remaining[active], affordable)
+
+                # Queue at each vendor, keeping household order within a queue
+                queue     = np.argsort(vendor, kind='stable')
+                active, vendor, wanted, affordable = active[queue], vendor[queue], wanted[queue], affordable[queue]
+                capped    = np.minimum(wanted, inventory[vendor])
+                ahead     = np.cumsum(capped) - capped
+                new_queue = np.r_[True, vendor[1:] != vendor[:-1]]
+                ahead    -= np.maximum.accumulate(np.where(new_queue, ahead, 0))
+                available = np.maximum(inventory[vendor] - ahead, 0)
+                bought    = np.minimum(wanted, available)
+
+                short = (available < remaining[active]) & (available < affordable)
+                if short.any():
+                    blackmarks.append((active[short], vendor[short], remaining[active[short]] - available[short]))
+
+                balance[active]   -= bought * price[vendor]
+                remaining[active] -= bought
+                sold_now   = np.bincount(vendor, weights=bought, minlength=n_firms)
+                inventory -= sold_now
+                sold      += sold_now
+
+                made = bought > 0
+                purchases.append((active[made], vendor[made], bought[made]))
+
+        household_data['unsatisfied_demand'][slots] += np.maximum(remaining - satisfaction, 0)
+        firm_data['inventory'][:]      -= sold
+        firm_data['current_demand'][:] += sold
+
+        for buyers, vendors, shortfalls in blackmarks:
+            for i, j, shortfall in zip(buyers.tolist(), vendors.tolist(), shortfalls.tolist()):
+                households[i].blackmarked_firms.append((firm_data.agents[j], shortfall))
+
+        buyers, vendors, quantities = (np.concatenate(x) for x in zip(*purchases)) if purchases else ([], [], [])
+        if len(buyers) > 0:
+            self.model.central_bank.settle_customer_payments(accounts[buyers],
+                                                             firm_accounts[vendors],
+                                                             quantities * price[vendors])
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:12:50 2026
+
+@author: andre
+"""
+
+import numpy as np
+
+class Distribution:
+    """
+    Inequality statistics of a set of values, e.g. household deposits.
+
+    The values are sorted once and their running total kept, so every
+    statistic after that is a lookup into the running total or the sorted
+    values, without a further sort. Shares are fractions of
+    the total; population fractions run from 0 to 1, poorest first.
+    """
+
+    __slots__ = ('values', 'cumulative', 'total')
+
+    def __init__(self, values):
+        self.values     = np.sort(np.asarray(values, dtype=np.float64))
+        self.cumulative = np.r_[0.0, np.cumsum(self.values)]  # total held below each rank
+        self.total      = self.cumulative[-1]
+
+    def __len__(self):
+        return len(self.values)
+
+    def gini(self) -> float:
+        """
+        Gini coefficient, 0 when there is nothing to share
+        """
+        n = len(self.values)
+        if n == 0 or self.total == 0:
+            return 0
+        # sum of x_i*(n-i) over the sorted values is the sum of the running totals
+        B = self.cumulative.sum() / (n * self.total)
+        return 1 + (1 / n) - 2 * B
+
+    def lorenz(self, fractions=None):
+        """
+        Share of the total held by each fraction of the population, poorest
+        first. Without fractions, the curve's points from (0, 0) to (1, 1).
+        """
+        n = len(self.values)
+        if fractions is None:
+            fractions = np.arange(n + 1) / max(n, 1)
+            return fractions, self._share_below(fractions)
+        return self._share_below(np.asarray(fractions, dtype=np.float64))
+
+    def _share_below(self, fractions):
+        n = len(self.values)
+        if n == 0 or self.total == 0:
+            return np.full(np.shape(fractions), np.nan)
+        position = np.asarray(fractions, dtype=np.float64) * n
+        rank = np.clip(np.floor(position).astype(np.int64), 0, n - 1)
+        return (self.cumulative[rank] + (position - rank) * self.values[rank]) / self.total
+
+    def quantile(self, q):
+        """
+        Values at the quantiles q, interpolated as numpy.quantile does
+        """
+        n = len(self.values)
+        if n == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        position = np.asarray(q, dtype=np.float64) * (n - 1)
+        rank = np.clip(np.floor(position).astype(np.int64), 0, max(n - 2, 0))
+        upper = self.values[np.minimum(rank + 1, n - 1)]
+        return self.values[rank] + (position - rank) * (upper - self.values[rank])
+
+    def top_share(self, fraction=0.1) -> float:
+        return 1 - self._share_below(1 - fraction)
+
+    def bottom_share(self, fraction=0.4) -> float:
+        return self._share_below(fraction)
+
+    def palma(self) -> float:
+        """
+        Share of the top 10% over the share of the bottom 40%
+        """
+        bottom = self.bottom_share(0.4)
+        return self.top_share(0.1) / bottom if bottom > 0 else np.nan
@@ -6,25 +6,150 @@ Created on Fri Oct 28 20:29:11 2022
 """
 
 from __future__ import annotations
+from collections import Counter
 import pandas as pd
 import numpy as np
 
+class Calendar:
+    
+    '''
+    Date index over the records of a ledger, mapping a day to the set of 
+    record IDs falling due on it. Each record is on at most one day, so it
+    can be moved or removed without knowing its current date. Days that 
+    are not finite (NaN for no date, inf for never) are not held.
+    '''
+    
+    __slots__ = ('_by_day', '_day_of')
+    
+    def __init__(self):
+        self._by_day = {}   # day -> set of record IDs
+        self._day_of = {}   # record ID -> day
+        
+    def __len__(self):
+        return len(self._day_of)
+    
+    def add(self, unique_ids, days):
+        for unique_id, day in zip(np.atleast_1d(unique_ids).tolist(), np.atleast_1d(days).tolist()):
+            self.remove(unique_id)
+            if np.isfinite(day):
+                self._by_day.setdefault(day, set()).add(unique_id)
+                self._day_of[unique_id] = day
+    
+    def remove(self, unique_id):
+        day = self._day_of.pop(int(unique_id), None)
+        if day is not None:
+            ids = self._by_day[day]
+            ids.discard(unique_id)
+            if not ids:
+                del self._by_day[day]
+    
+    def day_of(self, unique_id):
+        return self._day_of.get(unique_id)
+    
+    def due(self, day):
+        ids = self._by_day.get(day)
+        if ids:
+            return np.sort(np.fromiter(ids, dtype=np.int64, count=len(ids)))
+        return np.empty(0, dtype=np.int64)
+    
+    def pop(self, day):
+        '''
+        Remove and return the records due on the day
+        '''
+        ids = self.due(day)
+        for unique_id in ids.tolist():
+            del self._day_of[unique_id]
+        self._by_day.pop(day, None)
+        return ids
+        
+#%%
+
 class Ledger:
     
-    __slots__ = ('model', 'df', 'counter')
+    '''
+    Records are held column-wise in preallocated NumPy arrays that grow 
+    geometrically, so appending a record is amortised O(1) rather than a 
+    copy of the whole table. Dropped records are flagged and the arrays are 
+    compacted once the dead rows outnumber the live ones.
+    
+    Record IDs are handed out by the counter and never reused. A DataFrame 
+    view of the live records is available through .df, but it is built on 
+    demand and is read only - all updates go through the ledger methods.
+    
+    Issuers and holders are stored as the agents' integer unique_id, so 
+    filtering by counterparty is a vectorised integer comparison and the 
+    ledger holds no object references. Methods accept either an agent or 
+    its ID; get, issuer and holder resolve IDs back to agents through the 
+    model registry, while .df and the records methods return the raw IDs.
+    
+    Secondary indexes map issuer, holder and (holder, issuer) to the set of 
+    record IDs. They are kept up to date on create, transfer and drop so 
+    counterparty lookups never scan the columns.
+    '''
     
-    columns = ['issuer',             # Object reference of issuer
-               'holder',             # Object reference of holder
+    __slots__ = ('model', 'counter', '_ids', '_data', '_alive', '_rows', 
+                 '_n_rows', '_n_alive', '_df_cache',
+                 '_by_issuer', '_by_holder', '_by_pair')
+    
+    columns = ['issuer',             # Unique ID of issuer
+               'holder',             # Unique ID of holder
                'value',              # Value in pounds sterling
                'interest_rate',      # Rate as percentage per annum
                ]
     
+    agent_columns    = ['issuer', 'holder']
+    initial_capacity = 64
            
     def __init__(self, model):
-        self.model   = model
-        # self.columns = type(self).columns
-        self.df      = pd.DataFrame(columns = self.columns)
-        self.counter = int(0) # for unique ID purposes, not indexing
+        self.model     = model
+        self.counter   = int(0) # for unique ID purposes, not indexing
+        self._n_rows   = 0      # rows in use, including dropped records
+        self._n_alive  = 0
+        self._ids      = np.empty(self.initial_capacity, dtype=np.int64)
+        self._alive    = np.zeros(self.initial_capacity, dtype=bool)
+        self._rows     = np.full(self.initial_capacity, -1, dtype=np.int64) # ID -> row
+        self._data     = {col: self._empty_column(col, self.initial_capacity) for col in self.columns}
+        self._df_cache = None
+        self._by_issuer = {}    # issuer ID -> set of record IDs
+        self._by_holder = {}    # holder ID -> set of record IDs
+        self._by_pair   = {}    # (holder ID, issuer ID) -> set of record IDs
+    
+    def __getstate__(self):
+        state = {key: getattr(self, key) for key in Ledger.__slots__}
+        state.update(getattr(self, '__dict__', {}))
+        state['model'] = None
+        state['_df_cache'] = None
+        return state
+    
+    def __setstate__(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+    
+    def _empty_column(self, column, size):
+        if column in self.agent_columns:
+            return np.full(size, -1, dtype=np.int64)
+        else:
+            return np.full(size, np.nan, dtype=np.float64)
+    
+    @staticmethod
+    def agent_id(agent):
+        '''
+        Ledger representation of an agent, which may already be an ID
+        '''
+        if agent is None:
+            return -1
+        elif isinstance(agent, (int, np.integer)):
+            return int(agent)
+        else:
+            return agent.unique_id
+    
+    def agent_ids(self, agents):
+        if isinstance(agents, np.ndarray) and agents.dtype.kind in 'iu':
+            return agents.astype(np.int64, copy=False)
+        return np.fromiter((self.agent_id(x) for x in agents), dtype=np.int64, count=len(agents))
+    
+    def resolve(self, agent_id):
+        return self.model.agent(agent_id) if agent_id >= 0 else None
     
     def next_id(self) -> int:
         this_id = self.counter
@@ -36,51 +161,283 @@ class Ledger:
     
     @property
     def n_records(self):
-        return self.df.shape[0]
+        return self._n_alive
+    
+    @property
+    def capacity(self):
+        return len(self._ids)
+    
+    @property
+    def df(self):
+        if self._df_cache is None:
+            self._df_cache = self._frame(self._live_rows())
+        return self._df_cache
+    
+    def _modified(self):
+        self._df_cache = None
+    
+    def _grow(self, required):
+        capacity = max(self.capacity, 1)
+        while capacity < required:
+            capacity *= 2
         
-    def create(self, **kwargs):
-        data = kwargs
+        if capacity > self.capacity:
+            n = self._n_rows
+            ids = np.empty(capacity, dtype=np.int64)
+            ids[:n] = self._ids[:n]
+            alive = np.zeros(capacity, dtype=bool)
+            alive[:n] = self._alive[:n]
+            for col in self.columns:
+                data = self._empty_column(col, capacity)
+                data[:n] = self._data[col][:n]
+                self._data[col] = data
+            self._ids   = ids
+            self._alive = alive
+    
+    def _grow_row_map(self, required):
+        size = max(len(self._rows), 1)
+        while size < required:
+            size *= 2
         
-        # validate keys with columns here?
+        if size > len(self._rows):
+            rows = np.full(size, -1, dtype=np.int64)
+            rows[:len(self._rows)] = self._rows
+            self._rows = rows
+    
+    def _append(self, n=1, **kwargs):
+        '''
+        Append n records, each column taking either a scalar or an array of 
+        length n. Columns not given are left empty. Returns the new IDs.
+        '''
+        first_id = self.counter
+        self.counter += n
+        ids = np.arange(first_id, self.counter, dtype=np.int64)
         
-        unique_id = self.next_id()    
-        new_row = pd.DataFrame(data, columns=self.columns, index=[unique_id])
-        self.df = pd.concat([self.df, new_row], ignore_index=False, axis=0)  
-        return unique_id 
+        start = self._n_rows
+        stop  = start + n
+        self._grow(stop)
+        self._grow_row_map(self.counter)
+        
+        self._ids[start:stop]   = ids
+        self._alive[start:stop] = True
+        for key, value in kwargs.items():
+            if key in self.agent_columns:
+                if isinstance(value, (list, tuple, np.ndarray)):
+                    value = self.agent_ids(value)
+                else:
+                    value = self.agent_id(value)
+            self._data[key][start:stop] = value
+        self._rows[ids] = np.arange(start, stop)
+        self._index(ids, self._issuers_at(np.arange(start, stop)), self._data['holder'][start:stop])
+        
+        self._n_rows  = stop
+        self._n_alive += n
+        self._modified()
+        return ids
+        
+    def create(self, **kwargs):
+        data = {key: value for key, value in kwargs.items() if key in self.columns}
+        return int(self._append(1, **data)[0])
     
-    def account_exists(self, unique_id):
-        return True if unique_id in self.df.index else False
+    def _live_rows(self):
+        return np.flatnonzero(self._alive[:self._n_rows])
     
-    def get(self, unique_id):
+    def _frame(self, rows):
+        return pd.DataFrame({col: self._data[col][rows] for col in self.columns}, 
+                            index=self._ids[rows])
+    
+    def _compact(self):
+        rows = self._live_rows()
+        n = len(rows)
+        self._ids[:n] = self._ids[rows]
+        self._alive[:n] = True
+        self._alive[n:self._n_rows] = False
+        for col in self.columns:
+            self._data[col][:n] = self._data[col][rows]
+            self._data[col][n:self._n_rows] = self._empty_column(col, self._n_rows-n)
+        self._rows[self._ids[:n]] = np.arange(n)
+        self._n_rows = n
+    
+    def row(self, unique_id):
         if self.account_exists(unique_id):
-            return self.df.loc[unique_id]
+            return self._rows[unique_id]
         else:
             raise ValueError(f'ID {unique_id} does not exist in this ledger')
     
+    def rows(self, unique_ids):
+        unique_ids = np.asarray(unique_ids, dtype=np.int64)
+        in_range = (unique_ids >= 0) & (unique_ids < len(self._rows))
+        rows = np.full(len(unique_ids), -1, dtype=np.int64)
+        rows[in_range] = self._rows[unique_ids[in_range]]
+        if np.any(rows < 0):
+            invalid_ids = ', '.join(str(x) for x in unique_ids[rows < 0])
+            raise ValueError(f'The following IDs do not exist in this ledger: {invalid_ids}')
+        return rows
+    
+    def account_exists(self, unique_id):
+        if isinstance(unique_id, (int, np.integer)) and not isinstance(unique_id, bool):
+            return True if (0 <= unique_id < len(self._rows)) and (self._rows[unique_id] >= 0) else False
+        else:
+            return False
+    
+    def get(self, unique_id):
+        row = self.row(unique_id)
+        record = {col: self._data[col][row] for col in self.columns}
+        for col in self.agent_columns:
+            record[col] = self.resolve(record[col])
+        return pd.Series(record, name=unique_id)
+    
+    def records(self, unique_ids):
+        return self._frame(self.rows(unique_ids))
+    
     def drop(self, unique_id):
         if self.account_exists(unique_id):
-            self.df.drop(unique_id, inplace=True)
+            row = self._rows[unique_id]
+            self._unindex(unique_id, self._issuers_at(row), self._data['holder'][row])
+            self._alive[row] = False
+            self._rows[unique_id] = -1
+            self._n_alive -= 1
+            if (self._n_rows - self._n_alive) > max(self._n_alive, self.initial_capacity):
+                self._compact()
+            self._modified()
             return True
         else:
             return False
     
+    def drop_many(self, unique_ids):
+        '''
+        Drop a batch of records in one operation, all of which must exist
+        '''
+        unique_ids = np.unique(np.asarray(unique_ids, dtype=np.int64))
+        rows = self.rows(unique_ids)
+        if len(rows) == 0:
+            return False
+        self._unindex_many(unique_ids, self._issuers_at(rows), self._data['holder'][rows])
+        self._alive[rows] = False
+        self._rows[unique_ids] = -1
+        self._n_alive -= len(rows)
+        if (self._n_rows - self._n_alive) > max(self._n_alive, self.initial_capacity):
+            self._compact()
+        self._modified()
+        return True
+    
     def issuer(self, unique_id):
-        return self.df.at[unique_id, 'issuer'] # self.get(unique_id).issuer
+        return self.resolve(self.issuer_id(unique_id))
     
     def holder(self, unique_id):
-        return self.df.at[unique_id, 'holder'] # self.get(unique_id).holder
+        return self.resolve(self.holder_id(unique_id))
+    
+    def issuer_ids(self, unique_ids):
+        return self._data['issuer'][self.rows(unique_ids)]
+    
+    def holder_ids(self, unique_ids):
+        return self._data['holder'][self.rows(unique_ids)]
+    
+    def accounts_exist(self, unique_ids):
+        unique_ids = np.asarray(unique_ids)
+        if unique_ids.dtype.kind not in 'iu':
+            return np.array([self.account_exists(x) for x in unique_ids], dtype=bool)
+        in_range = (unique_ids >= 0) & (unique_ids < len(self._rows))
+        exists = np.zeros(len(unique_ids), dtype=bool)
+        exists[in_range] = self._rows[unique_ids[in_range]] >= 0
+        return exists
+    
+    def issuer_id(self, unique_id):
+        return int(self._data['issuer'][self.row(unique_id)])
+    
+    def holder_id(self, unique_id):
+        return int(self._data['holder'][self.row(unique_id)])
+    
+    def records_by_issuer(self, issuer, except_holders=[]):
+        return self.records(self.indexes_by_issuer(issuer, except_holders=except_holders))
+    
+    def records_by_holder(self, holder, except_issuers=[]):
+        return self.records(self.indexes_by_holder(holder, except_issuers=except_issuers))
     
-    def records_by_issuer(self, issuer):
-        return self.df.loc[self.indexes_by_issuer(issuer)]
+    def indexes_by_issuer(self, issuer, except_holders=[]):
+        return self._ids[self._rows_matching('issuer', issuer, 'holder', except_holders)]
     
-    def records_by_holder(self, holder):
-        return self.df.loc[self.indexes_by_holder(holder)]
+    def indexes_by_holder(self, holder, except_issuers=[]):
+        return self._ids[self._rows_matching('holder', holder, 'issuer', except_issuers)]
     
-    def indexes_by_issuer(self, issuer):
-        return self.df.index[np.where(self.df.issuer == issuer)[0]]
+    def indexes_by_issuer_and_holder(self, issuer, holder):
+        return self._lookup(self._by_pair, (self.agent_id(holder), self.agent_id(issuer)))
     
-    def indexes_by_holder(self, holder):
-        return self.df.index[np.where(self.df.holder == holder)[0]]
+    def _issuers_at(self, rows):
+        # Ledgers without an issuer column index their records under issuer -1
+        column = self._data.get('issuer')
+        return column[rows] if column is not None else np.full(np.shape(rows), -1, dtype=np.int64)
+    
+    def _index(self, ids, issuers, holders):
+        if len(ids) > 1 and (issuers == issuers[0]).all() and (holders == holders[0]).all():
+            # Bulk issue to a single holder
+            issuer, holder = int(issuers[0]), int(holders[0])
+            ids = ids.tolist()
+            self._by_issuer.setdefault(issuer, set()).update(ids)
+            self._by_holder.setdefault(holder, set()).update(ids)
+            self._by_pair.setdefault((holder, issuer), set()).update(ids)
+        else:
+            for unique_id, issuer, holder in zip(ids.tolist(), issuers.tolist(), holders.tolist()):
+                self._by_issuer.setdefault(issuer, set()).add(unique_id)
+                self._by_holder.setdefault(holder, set()).add(unique_id)
+                self._by_pair.setdefault((holder, issuer), set()).add(unique_id)
+    
+    def _unindex(self, unique_id, issuer, holder):
+        unique_id, issuer, holder = int(unique_id), int(issuer), int(holder)
+        for index, key in ((self._by_issuer, issuer), 
+                           (self._by_holder, holder), 
+                           (self._by_pair, (holder, issuer))):
+            ids = index[key]
+            ids.discard(unique_id)
+            if not ids:
+                del index[key]
+    
+    def _unindex_many(self, ids, issuers, holders):
+        pairs, inverse = np.unique(np.stack([holders, issuers], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        for i, (holder, issuer) in enumerate(pairs.tolist()):
+            dropped = set(ids[inverse == i].tolist())
+            for index, key in ((self._by_issuer, issuer), 
+                               (self._by_holder, holder), 
+                               (self._by_pair, (holder, issuer))):
+                remaining = index[key]
+                remaining.difference_update(dropped)
+                if not remaining:
+                    del index[key]
+    
+    def _change_holder(self, unique_id, new_holder):
+        row = self._rows[unique_id]
+        issuer = self._issuers_at(row)
+        self._unindex(unique_id, issuer, self._data['holder'][row])
+        self._data['holder'][row] = new_holder
+        self._index(np.array([unique_id]), np.array([issuer]), np.array([new_holder]))
+        self._modified()
+    
+    def _change_holders(self, unique_ids, new_holders):
+        '''
+        Reassign the holders of several records in one write
+        '''
+        rows = self.rows(unique_ids)
+        issuers = self._issuers_at(rows)
+        self._unindex_many(self._ids[rows], issuers, self._data['holder'][rows])
+        self._data['holder'][rows] = new_holders
+        self._index(self._ids[rows], issuers, self._data['holder'][rows])
+        self._modified()
+    
+    @staticmethod
+    def _lookup(index, key):
+        ids = index.get(key)
+        if ids:
+            return np.sort(np.fromiter(ids, dtype=np.int64, count=len(ids)))
+        else:
+            return np.empty(0, dtype=np.int64)
+    
+    def _rows_matching(self, column, agent, except_column=None, except_agents=[]):
+        index = self._by_issuer if column == 'issuer' else self._by_holder
+        rows = self._rows[self._lookup(index, self.agent_id(agent))]
+        if len(except_agents) > 0:
+            rows = rows[~np.isin(self._data[except_column][rows], self.agent_ids(except_agents))]
+        return rows
     
 #%%
     
@@ -100,10 +457,17 @@ class DepositLedger(Ledger):
                               overdraft=overdraft)
     
     def current_balance(self, unique_id):
-        return self.df.at[unique_id,'value']
+        return self._data['value'][self.row(unique_id)]
+    
+    def current_balances(self, unique_ids):
+        return self._data['value'][self.rows(unique_ids)]
     
     def available_funds(self, unique_id):
-        return self.df.at[unique_id,'value'] + self.df.at[unique_id,'overdraft']
+        row = self.row(unique_id)
+        return self._data['value'][row] + self._data['overdraft'][row]
+    
+    def overdraft(self, unique_id):
+        return self._data['overdraft'][self.row(unique_id)]
     
     def transfer(self,from_unique_id, to_unique_id, value):
         if (self.account_exists(from_unique_id)) & (self.account_exists(to_unique_id)):
@@ -111,38 +475,85 @@ class DepositLedger(Ledger):
             self.credit(to_unique_id, value)
             return True
         else:
-            invalid_ids = [x for x in [from_unique_id, to_unique_id] if x not in self.df.index]
+            invalid_ids = [x for x in [from_unique_id, to_unique_id] if not self.account_exists(x)]
             invalid_ids = ', '.join(invalid_ids)
             raise ValueError("The following IDs do not exist in this ledger: {invalid_ids}")
     
+    def transfer_many(self, from_unique_ids, to_unique_ids, values, partial=False):
+        '''
+        Apply a batch of transfers in a single pass.
+        
+        Funds are checked against each paying account's total commitment in 
+        the batch, before any of the batch's credits arrive. By default the 
+        batch is all or nothing and raises if any payer is short. With 
+        partial=True every payment from an over-committed payer is rejected 
+        and the rest go through. 
+        
+        Returns a boolean array marking the payments applied.
+        '''
+        from_rows = self.rows(from_unique_ids)
+        to_rows   = self.rows(to_unique_ids)
+        values    = np.broadcast_to(np.asarray(values, dtype=np.float64), from_rows.shape)
+        
+        committed = np.zeros(self._n_rows)
+        np.add.at(committed, from_rows, values)
+        funds = self._data['value'][:self._n_rows] + self._data['overdraft'][:self._n_rows]
+        short = committed > funds
+        
+        applied = ~short[from_rows]
+        if not applied.all():
+            if not partial:
+                short_ids = ', '.join(str(x) for x in np.unique(self._ids[from_rows[~applied]]))
+                raise ValueError(f'Insufficient funds in the following accounts: {short_ids}')
+            from_rows, to_rows, values = from_rows[applied], to_rows[applied], values[applied]
+        
+        np.subtract.at(self._data['value'], from_rows, values)
+        np.add.at(self._data['value'], to_rows, values)
+        self._modified()
+        return applied
+    
+    def credit_many(self, unique_ids, values):
+        np.add.at(self._data['value'], self.rows(unique_ids), values)
+        self._modified()
+        return True
+    
+    def debit_many(self, unique_ids, values):
+        np.subtract.at(self._data['value'], self.rows(unique_ids), values)
+        self._modified()
+        return True
+    
     def credit(self, unique_id, value):        
         if self.account_exists(unique_id):
-            self.df.at[unique_id, 'value'] += value
+            self._data['value'][self._rows[unique_id]] += value
+            self._modified()
             return True
         else:
             raise ValueError(f'ID {unique_id} does not exist in this ledger')
         
     def debit(self, unique_id, value):      
         if self.account_exists(unique_id):
-            self.df.at[unique_id, 'value'] -= value
+            self._data['value'][self._rows[unique_id]] -= value
+            self._modified()
             return True
         else:
             raise ValueError(f'ID {unique_id} does not exist in this ledger')
     
     def apply_daily_interest(self, issuer=None):
         if issuer is None:
-            indexes = self.df.index
+            rows = self._live_rows()
         else:
-            indexes = self.df.index[np.where(self.df.issuer == issuer)[0]]
+            rows = self._rows_matching('issuer', issuer)
         
-        daily_rate = (self.df.loc[indexes, 'interest_rate']/100.0)/self.model.schedule.days_in_year
-        self.df.loc[indexes, 'value'] *= (1 + (daily_rate))
+        daily_rate = (self._data['interest_rate'][rows]/100.0)/self.model.schedule.days_in_year
+        self._data['value'][rows] *= (1 + (daily_rate))
+        self._modified()
         
     def update_interest_rate_by_issuer(self, issuer, rate):
-        indexes = self.df.index[np.where(self.df.issuer == issuer)[0]]
+        rows = self._rows_matching('issuer', issuer)
         
-        if len(indexes)>0:
-            self.df.loc[indexes, 'interest_rate'] = rate
+        if len(rows)>0:
+            self._data['interest_rate'][rows] = rate
+            self._modified()
             return True
         else:
             return False
@@ -158,6 +569,22 @@ class LoanLedger(Ledger):
         
     def __init__(self, model):
         super().__init__(model)
+        self.maturities = Calendar()
+    
+    def _append(self, n=1, **kwargs):
+        ids = super()._append(n, **kwargs)
+        self.maturities.add(ids, self._data['maturity_date'][self._rows[ids]])
+        return ids
+    
+    def drop(self, unique_id):
+        if self.account_exists(unique_id):
+            self.maturities.remove(int(unique_id))
+        return super().drop(unique_id)
+    
+    def drop_many(self, unique_ids):
+        for unique_id in self._ids[self.rows(unique_ids)].tolist():
+            self.maturities.remove(unique_id)
+        return super().drop_many(unique_ids)
     
     def create(self, issuer, holder, value, issue_date, maturity_date,
                      interest_rate=0,         # value as percentage
@@ -169,22 +596,40 @@ class LoanLedger(Ledger):
                               maturity_date=maturity_date)
     
     def current_balance(self, unique_id):
-        return self.df.at[unique_id, 'value']   
+        return self._data['value'][self.row(unique_id)]
         
     def extend_loan(self, unique_id, value, interest_rate, maturity_days):        
         if self.account_exists(unique_id):
-            self.df.at[unique_id, 'value'] += value
-            self.df.at[unique_id, 'maturity_date'] = self.model.schedule.day + maturity_days
-            self.df.at[unique_id, 'interest_rate'] = interest_rate
+            row = self._rows[unique_id]
+            self._data['value'][row] += value
+            self._data['maturity_date'][row] = self.model.schedule.day + maturity_days
+            self._data['interest_rate'][row] = interest_rate
+            self.maturities.add(unique_id, self._data['maturity_date'][row])
+            self._modified()
             return True
         else:
             raise ValueError(f'ID {unique_id} does not exist in this ledger')
             
+    def extend_loans(self, unique_ids, values, interest_rates, maturity_days):
+        '''
+        extend_loan for several accounts at once, each ID at most once
+        '''
+        rows = self.rows(unique_ids)
+        self._data['value'][rows] += values
+        self._data['maturity_date'][rows] = self.model.schedule.day + maturity_days
+        self._data['interest_rate'][rows] = interest_rates
+        self.maturities.add(self._ids[rows], self._data['maturity_date'][rows])
+        self._modified()
+        return True
+            
     def writedown_loan(self, unique_id, value):      
         if self.account_exists(unique_id):
-            self.df.at[unique_id, 'value'] -= value
-            self.df.at[unique_id, 'interest_rate'] = 0
-            self.df.at[unique_id, 'maturity_date'] = np.inf
+            row = self._rows[unique_id]
+            self._data['value'][row] -= value
+            self._data['interest_rate'][row] = 0
+            self._data['maturity_date'][row] = np.inf
+            self.maturities.remove(unique_id)
+            self._modified()
             return True
         else:
             raise ValueError(f'ID {unique_id} does not exist in this ledger')
@@ -193,36 +638,55 @@ class LoanLedger(Ledger):
         if date == None:
             date = self.model.schedule.day
         
-        return self.df.index[self.df['maturity_date'] == date]
-        
+        return self.maturities.due(date)
         
     def apply_daily_interest(self, lender=None):
         if lender is None:
-            indexes = self.df.index
+            rows = self._live_rows()
         else:
-            indexes = self.df.index[np.where(self.df.holder == lender)[0]]
+            rows = self._rows_matching('holder', lender)
         
-        daily_rate = (self.df.loc[indexes, 'interest_rate']/100.0)/self.model.schedule.days_in_year
-        self.df.loc[indexes, 'value'] *= (1 + (daily_rate))
+        daily_rate = (self._data['interest_rate'][rows]/100.0)/self.model.schedule.days_in_year
+        self._data['value'][rows] *= (1 + (daily_rate))
+        self._modified()
         
     def update_interest_rate_by_lender(self, lender, rate):
-        indexes = self.df.index[np.where(self.df.holder == lender)[0]]
+        rows = self._rows_matching('holder', lender)
 
-        if len(indexes)>0:
-            self.df.loc[indexes, 'interest_rate'] = rate
+        if len(rows)>0:
+            self._data['interest_rate'][rows] = rate
+            self._modified()
             return True
         else:
             return False
         
     def revalue_all(self):
-        self.df.mark_to_market_value   = self.df.value
-        self.df.hold_to_maturity_value = self.df.value * ((1 + (self.df.interest_rate/100))/self.model.schedule.days_in_year)**(self.maturity_date-self.model.schedule.day)
+        rows  = self._live_rows()
+        value = self._data['value'][rows]
+        rate  = self._data['interest_rate'][rows]
+        self._data['mark_to_market_value'][rows]   = value
+        self._data['hold_to_maturity_value'][rows] = value * ((1 + (rate/100))/self.model.schedule.days_in_year)**(self._data['maturity_date'][rows]-self.model.schedule.day)
+        self._modified()
           
 #%%
 
 class BondLedger(Ledger):
+    
+    '''
+    Bonds with the same issuer and terms form a series, and by default each 
+    record is a position - the quantity of one series held by one holder. 
+    Issuing, transferring, paying coupons on and redeeming bonds then costs 
+    one record update per holder rather than one per bond. The value and 
+    valuation columns are per £100 bond; multiply by quantity for the 
+    position.
+    
+    With audit=True every bond is a record of quantity one, so individual 
+    bonds can be traced at the cost of a row each.
+    '''
         
-    columns = Ledger.columns.copy() + list(['issue_date', 
+    columns = Ledger.columns.copy() + list(['series',
+                                            'quantity',
+                                            'issue_date', 
                                             'maturity_date', 
                                             'maturity_days',
                                             'days_to_maturity',
@@ -231,10 +695,195 @@ class BondLedger(Ledger):
                                             'mark_to_market_value', 
                                             'hold_to_maturity_value'])
     
+    # Terms identifying a series
+    series_columns = ['issuer', 'maturity_date', 'interest_rate', 'issue_date']
 
-    def __init__(self, model, annual_coupon_frequency=2):
+    def __init__(self, model, annual_coupon_frequency=2, audit=False):
         super().__init__(model)
         self.annual_coupon_frequency = annual_coupon_frequency
+        self.audit      = audit
+        self.series     = {}            # (issuer, maturity date, rate, issue date) -> series number
+        self._issues    = {}            # (maturity date, rate) -> series numbers with those terms
+        self._inventory = {}            # (series, holder) -> set of record IDs
+        self.maturities = Calendar()
+        self.coupons    = Calendar()    # next coupon payment of each coupon bearing bond
+        self.coupons_paid_through = -1  # last day whose coupons have been rolled on
+        self._valued_at = None          # (day, central bank rate) of the last revaluation
+        self._coupon_flows = []         # coupons paid, as arrays per payment run
+    
+    def series_number(self, terms):
+        key = tuple(float(self.agent_id(terms[col]) if col in self.agent_columns else terms[col]) 
+                    for col in self.series_columns)
+        if key not in self.series:
+            self.series[key] = len(self.series)
+            self._issues.setdefault(key[1:3], []).append(self.series[key])
+        return self.series[key]
+    
+    def quantity(self, unique_id):
+        return int(self._data['quantity'][self.row(unique_id)])
+    
+    def quantities(self, unique_ids):
+        return self._data['quantity'][self.rows(unique_ids)]
+    
+    def position(self, series, holder):
+        '''
+        ID of the holder's position in the series, if any, when not auditing
+        '''
+        ids = self._inventory.get((int(series), self.agent_id(holder)))
+        return None if (self.audit or not ids) else next(iter(ids))
+    
+    def holdings(self, holder, maturity_date, interest_rate):
+        '''
+        IDs of the holder's records, in ID order, in every series with the
+        given maturity date and interest rate
+        '''
+        holder = self.agent_id(holder)
+        ids = [self._lookup(self._inventory, (series, holder)) 
+               for series in self._issues.get((float(maturity_date), float(interest_rate)), [])]
+        return np.sort(np.concatenate(ids)) if len(ids) > 1 else (ids[0] if ids else np.empty(0, dtype=np.int64))
+    
+    def _index(self, ids, issuers, holders):
+        super()._index(ids, issuers, holders)
+        series = self._data['series'][self._rows[ids]].astype(np.int64)
+        for unique_id, key in zip(ids.tolist(), zip(series.tolist(), np.asarray(holders).tolist())):
+            self._inventory.setdefault(key, set()).add(unique_id)
+    
+    def _unindex(self, unique_id, issuer, holder):
+        super()._unindex(unique_id, issuer, holder)
+        key = (int(self._data['series'][self._rows[unique_id]]), int(holder))
+        ids = self._inventory[key]
+        ids.discard(int(unique_id))
+        if not ids:
+            del self._inventory[key]
+    
+    def _unindex_many(self, ids, issuers, holders):
+        super()._unindex_many(ids, issuers, holders)
+        series = self._data['series'][self._rows[ids]].astype(np.int64)
+        for unique_id, key in zip(ids.tolist(), zip(series.tolist(), np.asarray(holders).tolist())):
+            held = self._inventory[key]
+            held.discard(unique_id)
+            if not held:
+                del self._inventory[key]
+    
+    def _append(self, n=1, **kwargs):
+        ids  = super()._append(n, **kwargs)
+        rows = self._rows[ids]
+        self.maturities.add(ids, self._data['maturity_date'][rows])
+        
+        # A coupon is paid on each coupon day from creation until maturity,
+        # except on the issue date. Days already paid are skipped.
+        coupon_bearing = self._data['maturity_days'][rows] >= self.model.schedule.days_in_year
+        for unique_id, row in zip(ids[coupon_bearing].tolist(), rows[coupon_bearing].tolist()):
+            self._schedule_coupon(unique_id, max(self.model.schedule.day, self.coupons_paid_through + 1), row)
+        return ids
+    
+    def drop(self, unique_id):
+        if self.account_exists(unique_id):
+            self.maturities.remove(unique_id)
+            self.coupons.remove(unique_id)
+        return super().drop(unique_id)
+    
+    def drop_many(self, unique_ids):
+        for unique_id in self._ids[self.rows(unique_ids)].tolist():
+            self.maturities.remove(unique_id)
+            self.coupons.remove(unique_id)
+        return super().drop_many(unique_ids)
+    
+    def _issue(self, quantity, terms):
+        '''
+        Add newly issued bonds to the issuer's holding, as a position or one
+        record per bond when auditing. Returns the IDs of the records.
+        '''
+        terms = dict(terms, series=self.series_number(terms))
+        if self.audit:
+            return self._append(quantity, quantity=1, **terms).tolist()
+        
+        unique_id = self.position(terms['series'], terms['holder'])
+        if unique_id is None:
+            return self._append(1, quantity=quantity, **terms).tolist()
+        
+        self._data['quantity'][self._rows[unique_id]] += quantity
+        self._modified()
+        return [unique_id]
+    
+    def next_coupon_day(self, date):
+        '''
+        First coupon day on or after the date
+        '''
+        interval = self.coupon_interval_days
+        k = np.ceil(date/interval)
+        while (k*interval) % 1 != 0:
+            k += 1
+        return int(k*interval)
+    
+    def _schedule_coupon(self, unique_id, date, row):
+        day = self.next_coupon_day(date)
+        if day == self._data['issue_date'][row]:
+            day = self.next_coupon_day(day + 1)
+        if day <= self._data['maturity_date'][row]:
+            self.coupons.add(unique_id, day)
+    
+    def coupons_due(self, date=None):
+        '''
+        Bonds with a coupon payable on the date
+        '''
+        if date == None:
+            date = self.model.schedule.day
+        return self.coupons.due(date)
+    
+    def coupons_payable(self, date=None):
+        '''
+        Coupons due on the date summed by issuer and holder, leaving out
+        bonds held by their own issuer. Returns arrays of issuer IDs, holder
+        IDs, the number of bonds and the coupon value for each pair.
+        '''
+        rows    = self._rows[self.coupons_due(date)]
+        coupons = self._data['quantity'][rows]*self._data['value'][rows]*(self._data['interest_rate'][rows]/self.annual_coupon_frequency)/100.0
+        return self._sum_by_counterparty(rows, coupons)
+    
+    def principal_payable(self, date=None):
+        '''
+        Face value of the bonds maturing on the date, summed by issuer and 
+        holder as for coupons_payable
+        '''
+        rows = self._rows[self.bonds_maturing(date)]
+        return self._sum_by_counterparty(rows, self._data['quantity'][rows]*self._data['value'][rows])
+    
+    def _sum_by_counterparty(self, rows, values):
+        issuers  = self._data['issuer'][rows]
+        holders  = self._data['holder'][rows]
+        quantity = self._data['quantity'][rows]
+        
+        external = issuers != holders
+        pairs, inverse = np.unique(np.stack([issuers[external], holders[external]], axis=1), 
+                                   axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        return (pairs[:, 0], pairs[:, 1], 
+                np.bincount(inverse, weights=quantity[external], minlength=len(pairs)),
+                np.bincount(inverse, weights=values[external], minlength=len(pairs)))
+    
+    def record_coupon_flows(self, date, issuers, holders, bonds, values):
+        self._coupon_flows.append((np.full(len(issuers), date), issuers, holders, bonds, values))
+    
+    @property
+    def coupon_flows(self):
+        '''
+        Coupons paid, one row per day, issuer and holder
+        '''
+        columns = ['day', 'issuer', 'holder', 'bonds', 'value']
+        if not self._coupon_flows:
+            return pd.DataFrame(columns=columns)
+        return pd.DataFrame(dict(zip(columns, (np.concatenate(x) for x in zip(*self._coupon_flows)))))
+    
+    def roll_coupons(self, date=None):
+        '''
+        Move the bonds paid on the date on to their next coupon day
+        '''
+        if date == None:
+            date = self.model.schedule.day
+        for unique_id in self.coupons.pop(date).tolist():
+            self._schedule_coupon(unique_id, date + 1, self._rows[unique_id])
+        self.coupons_paid_through = max(self.coupons_paid_through, date)
     
     @property
     def coupon_interval_days(self):
@@ -242,13 +891,16 @@ class BondLedger(Ledger):
     
     @property 
     def is_short_term(self):
-        return self.df.maturity_days < self.model.schedule.days_in_year
+        return self._data['maturity_days'][self._live_rows()] < self.model.schedule.days_in_year
     
     @property 
     def is_long_term(self):
-        return self.df.maturity_days >= self.model.schedule.days_in_year
+        return self._data['maturity_days'][self._live_rows()] >= self.model.schedule.days_in_year
     
     def create(self, issuer, interest_rate, maturity_years):
+        return int(self._issue(1, self.bond_terms(issuer, interest_rate, maturity_years))[0])
+    
+    def bond_terms(self, issuer, interest_rate, maturity_years):
         
         holder = issuer
         value = 100
@@ -302,59 +954,163 @@ class BondLedger(Ledger):
         
         hold_to_maturity_value = value + (value * ((interest_rate/100)/self.annual_coupon_frequency) * number_of_outstanding_coupon_payments)
             
-        return super().create(issuer = issuer, 
-                              holder = holder, 
-                              value  = value,
-                              interest_rate    = interest_rate,
-                              issue_date       = issue_date, 
-                              maturity_date    = maturity_date, 
-                              maturity_days    = maturity_days, 
-                              days_to_maturity = days_to_maturity, 
-                              number_of_outstanding_coupon_payments=number_of_outstanding_coupon_payments, 
-                              next_coupon_date = next_coupon_date,
-                              mark_to_market_value   = mark_to_market_value, 
-                              hold_to_maturity_value = hold_to_maturity_value)
+        return dict(issuer = issuer, 
+                    holder = holder, 
+                    value  = value,
+                    interest_rate    = interest_rate,
+                    issue_date       = issue_date, 
+                    maturity_date    = maturity_date, 
+                    maturity_days    = maturity_days, 
+                    days_to_maturity = days_to_maturity, 
+                    number_of_outstanding_coupon_payments=number_of_outstanding_coupon_payments, 
+                    next_coupon_date = next_coupon_date,
+                    mark_to_market_value   = mark_to_market_value, 
+                    hold_to_maturity_value = hold_to_maturity_value)
     
     def create_bulk_value(self, issuer, bulk_value, interest_rate, maturity_years):
-        number_of_bonds = np.ceil(bulk_value/100.0).astype(int)       
-        reference_numbers = [self.create(issuer, interest_rate, maturity_years) for x in range(number_of_bonds)]
+        number_of_bonds = np.ceil(bulk_value/100.0).astype(int)
+        if number_of_bonds <= 0:
+            return []
+        terms = self.bond_terms(issuer, interest_rate, maturity_years)
+        reference_numbers = self._issue(number_of_bonds, terms)
         return reference_numbers
     
-    def transfer(self, idval, new_holder):
-        bond = self.get(idval)
+    def transfer(self, idval, new_holder, quantity=None):
+        '''
+        Transfer the record, or the given quantity of its bonds, to the new 
+        holder. Returns the ID of the record now holding them, which is a 
+        new or existing position of the new holder unless the whole record 
+        changes hands.
+        '''
+        row = self.row(idval)
+        new_holder = self.agent_id(new_holder)
             
-        if bond.holder != new_holder:
-            self.df.at[idval,'holder'] = new_holder            
+        if self._data['holder'][row] == new_holder:
+            raise ValueError('Bond already owned by new holder')
+        
+        held     = self._data['quantity'][row]
+        quantity = held if quantity is None else quantity
+        if not 0 < quantity <= held:
+            raise ValueError(f'Cannot transfer {quantity} of {held:g} bonds in record {idval}')
+        
+        series = self._data['series'][row]
+        target = None if self.audit else self.position(series, new_holder)
+        if quantity == held and target is None:
+            self._change_holder(idval, new_holder)
+            return idval
+        
+        if target is None:
+            record = {col: self._data[col][row] for col in self.columns}
+            target = int(self._append(1, **dict(record, holder=new_holder, quantity=quantity))[0])
         else:
+            self._data['quantity'][self._rows[target]] += quantity
+        
+        self._data['quantity'][self._rows[idval]] -= quantity
+        if quantity == held:
+            self.drop(idval)
+        self._modified()
+        return target
+    
+    def check_transfer(self, idvals, new_holders, quantities=None):
+        '''
+        Raise if the records cannot be transferred, so that a sale can be 
+        checked before it is paid for. Returns the IDs, rows, holder IDs, 
+        quantities held and quantities to transfer.
+        '''
+        ids     = np.asarray(idvals, dtype=np.int64)
+        rows    = self.rows(ids)
+        holders = self.agent_ids(new_holders) if len(ids) else np.empty(0, dtype=np.int64)
+        held    = self._data['quantity'][rows]
+        quantities = held if quantities is None else np.asarray(quantities, dtype=np.float64)
+        
+        if (self._data['holder'][rows] == holders).any():
             raise ValueError('Bond already owned by new holder')
+        if np.any((quantities <= 0) | (quantities > held)):
+            raise ValueError(f'Cannot transfer quantities {quantities} of {held} bonds in records {ids}')
+        return ids, rows, holders, held, quantities
     
-    def close(self, idval):        
+    def transfer_many(self, idvals, new_holders, quantities=None):
+        '''
+        transfer for several records, returning the target IDs. Whole 
+        records that change hands without merging into another position 
+        are reassigned in one write, the rest are transferred in turn.
+        '''
+        ids, rows, holders, held, quantities = self.check_transfer(idvals, new_holders, quantities)
+        
+        _, first, counts = np.unique(ids, return_index=True, return_counts=True)
+        whole = (quantities == held) & np.isin(np.arange(len(ids)), first[counts == 1])
+        if not self.audit:
+            # Positions of the same series and holder must merge
+            keys = list(zip(self._data['series'][rows].astype(np.int64).tolist(), holders.tolist()))
+            counts = Counter(keys)
+            whole &= np.array([counts[key] == 1 and key not in self._inventory for key in keys], dtype=bool)
+        
+        targets = ids.copy()
+        if whole.any():
+            self._change_holders(ids[whole], holders[whole])
+        for k in np.flatnonzero(~whole).tolist():
+            targets[k] = self.transfer(int(ids[k]), int(holders[k]), quantities[k])
+        return targets.tolist()
+    
+    def close(self, idval, quantity=None):        
+        '''
+        Cancel bonds held by their issuer, the whole record by default
+        '''
         if self.account_exists(idval):
-            if(self.df.at[idval, 'holder'] == self.df.at[idval, 'issuer']):
-                return self.drop(idval)
+            row = self._rows[idval]
+            if(self._data['holder'][row] == self._data['issuer'][row]):
+                if quantity is None or quantity >= self._data['quantity'][row]:
+                    return self.drop(idval)
+                self._data['quantity'][row] -= quantity
+                self._modified()
+                return True
             else:
                 return False
         else:
             return False
         
-    def recalculate(self):    
-        self.df['days_to_maturity'] = self.df.maturity_date - self.model.schedule.day
-        self.df['number_of_outstanding_coupon_payments'] = np.ceil(self.df.days_to_maturity/self.coupon_interval_days)
-        self.df['next_coupon_date'] = self.df.maturity_date - (self.df.number_of_outstanding_coupon_payments-1)*self.coupon_interval_days
+    def recalculate(self, force=False):
+        '''
+        Revalue every bond for the current day and central bank rate.
+        Bonds in a series share their terms, so each series is valued once 
+        and the results copied to its records. Records are valued when they
+        are created, so nothing needs doing if neither the day nor the rate 
+        has changed since the last call.
+        '''
+        inputs = (self.model.schedule.day, self.model.central_bank.deposit_interest_rate)
+        if inputs == self._valued_at and not force:
+            return True
+        self._valued_at = inputs
         
-        self.df.loc[self.df.index[np.where(self.is_short_term)[0]], 'number_of_outstanding_coupon_payments'] = 0
-        self.df.loc[self.df.index[np.where(self.is_short_term)[0]], 'next_coupon_date'] = np.nan
+        rows = self._live_rows()
+        series, first, inverse = np.unique(self._data['series'][rows], return_index=True, return_inverse=True)
+        data = {col: self._data[col][rows[first]] for col in ['maturity_date', 'maturity_days', 'interest_rate', 'value']}
         
-        self.df['mark_to_market_value']   = self.model.bond_exchange.yield_to_price(            
+        days_to_maturity = data['maturity_date'] - self.model.schedule.day
+        number_of_outstanding_coupon_payments = np.ceil(days_to_maturity/self.coupon_interval_days)
+        next_coupon_date = data['maturity_date'] - (number_of_outstanding_coupon_payments-1)*self.coupon_interval_days
+        
+        is_short_term = data['maturity_days'] < self.model.schedule.days_in_year
+        number_of_outstanding_coupon_payments[is_short_term] = 0
+        next_coupon_date[is_short_term] = np.nan
+        
+        mark_to_market_value = self.model.bond_exchange.yield_to_price(            
                                                     self.model.schedule.day,
-                                                    self.df['maturity_date'].values,
+                                                    data['maturity_date'],
                                                     self.model.central_bank.deposit_interest_rate, 
-                                                    self.df['interest_rate'].values,
-                                                    bond_face_value=self.df['value'].values, 
+                                                    data['interest_rate'],
+                                                    bond_face_value=data['value'], 
                                                     coupon_frequency=self.annual_coupon_frequency, 
                                                     days_in_year=self.model.schedule.days_in_year)
         
-        self.df['hold_to_maturity_value'] = self.df['value'] + self.df['value'] * ((self.df['interest_rate'].values / 100) / self.annual_coupon_frequency) * self.df['number_of_outstanding_coupon_payments']
+        hold_to_maturity_value = data['value'] + data['value'] * ((data['interest_rate'] / 100) / self.annual_coupon_frequency) * number_of_outstanding_coupon_payments
+        
+        self._data['days_to_maturity'][rows] = days_to_maturity[inverse]
+        self._data['number_of_outstanding_coupon_payments'][rows] = number_of_outstanding_coupon_payments[inverse]
+        self._data['next_coupon_date'][rows] = next_coupon_date[inverse]
+        self._data['mark_to_market_value'][rows] = mark_to_market_value[inverse]
+        self._data['hold_to_maturity_value'][rows] = hold_to_maturity_value[inverse]
+        self._modified()
         return True
     
     def coupon_due(self, date=None):
@@ -371,7 +1127,7 @@ class BondLedger(Ledger):
         if date == None:
             date = self.model.schedule.day
         
-        return self.df.index[self.df['maturity_date'] == date]
+        return self.maturities.due(date)
 
 
     # def self_owned_ids(self):
@@ -389,6 +1145,8 @@ class StockLedger(Ledger):
                'value',              # Value in pounds sterling
                ]
         
+    agent_columns = ['holder']
+        
     def __init__(self, model):
         super().__init__(model)
 
@@ -402,6 +1160,8 @@ class TaxLedger(Ledger):
                'due_date',           # Which day is tax due
                ]
         
+    agent_columns = ['holder']
+        
     def __init__(self, model):
         super().__init__(model)
 
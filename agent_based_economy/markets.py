@@ -5,6 +5,7 @@ Created on Sat Mar 16 14:52:07 2024
 @author: andre
 """
 
+import heapq
 import numpy as np
 import pandas as pd
 
@@ -40,7 +41,7 @@ INTERBANK MARKET SUBCLASS
     
 BOND MARKET SUBCLASS
     MATCH NEXT HAS BOND TRANSFER AND PAY
-    QUANTITY MUST BE MULTIPLE OF 100 AND INDIVIDUAL BONDS IDENTIFIED
+    QUANTITY MUST BE MULTIPLE OF 100, BONDS ARE MOVED BY POSITION
     
 BOND EXCHANGE OBJECT FOR MANAGING EACH MARKET
     SIMILAR FUNCTIONS TO MARKET BUT ALLOW MATURITY AND COUPON TO BE SPECIFIED
@@ -48,21 +49,113 @@ BOND EXCHANGE OBJECT FOR MANAGING EACH MARKET
 '''
 
 
+class Order:
+    
+    __slots__ = ('agent', 'quantity', 'price', 'number', 'live')
+    
+    def __init__(self, agent, quantity, price, number):
+        self.agent    = agent
+        self.quantity = quantity
+        self.price    = price
+        self.number   = number
+        self.live     = True
+
+
+class OrderBook:
+    
+    '''
+    One side of a market held as a heap in price-time priority - best price
+    first, then earliest order. Insertion is O(log n) and the best order is 
+    at the top. Filled orders are marked dead and discarded lazily when they 
+    reach the top.
+    
+    Orders registered with nothing to trade stay in the book until the next 
+    fill in the market, as they did when the book was a DataFrame.
+    '''
+    
+    __slots__ = ('agent_column', 'sign', 'counter', '_heap', '_n_live', '_empty')
+    
+    def __init__(self, agent_column, ascending):
+        self.agent_column = agent_column
+        self.sign    = 1 if ascending else -1
+        self.counter = int(0) # for unique ID purposes, not indexing
+        self._heap   = []
+        self._n_live = 0
+        self._empty  = []     # orders registered with zero quantity
+        
+    def __len__(self):
+        return self._n_live
+    
+    def add(self, agent, quantity, price):
+        self.counter += 1
+        order = Order(agent, quantity, price, self.counter)
+        heapq.heappush(self._heap, (self.sign*price, order.number, order))
+        self._n_live += 1
+        if quantity == 0:
+            self._empty.append(order)
+        return order
+    
+    def best(self):
+        heap = self._heap
+        while heap and not heap[0][2].live:
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+    
+    def remove(self, order):
+        if order.live:
+            order.live = False
+            self._n_live -= 1
+    
+    def remove_empty(self):
+        for order in self._empty:
+            if order.quantity == 0:
+                self.remove(order)
+        self._empty = [order for order in self._empty if order.live]
+    
+    def ranked(self):
+        '''
+        Live orders in priority order
+        '''
+        self._heap = sorted(entry for entry in self._heap if entry[2].live)
+        return [entry[2] for entry in self._heap]
+    
+    def clear(self):
+        for entry in self._heap:
+            entry[2].live = False
+        self._heap   = []
+        self._n_live = 0
+        self._empty  = []
+    
+    @property
+    def df(self):
+        orders = sorted(entry for entry in self._heap if entry[2].live)
+        return pd.DataFrame({self.agent_column: [x[2].agent for x in orders],
+                             'quantity': [x[2].quantity for x in orders],
+                             'price':    [x[2].price for x in orders]},
+                            index=[x[2].number for x in orders],
+                            columns=[self.agent_column, 'quantity', 'price'])
+
+
 class Market:
     
     '''
-    Quantity must be in second column as index 1 is referenced when clearing fulfilled transactions
+    Offers and bids are held in order books, see OrderBook. Each match 
+    trades the smaller of the best offer and best bid quantities, at the 
+    offered price or, if use_offered_price is False, the bid price.
+    
+    With batch_clearing the books are crossed in one pass (see cross) and 
+    the fills are passed to transact_many together, rather than matching 
+    and transacting one pair at a time.
     
     Market price is based on mean of last n transactions
         Should this be weighted by volume?
     '''
     
-    def __init__(self, model, n_price_track=50, use_offered_price=True):   
+    def __init__(self, model, n_price_track=50, use_offered_price=True, batch_clearing=False):   
         self.model             = model
-        self.offering_df       = pd.DataFrame(columns = ['offerer', 'quantity', 'price'])
-        self.seeking_df        = pd.DataFrame(columns = ['seeker',  'quantity', 'price'])
-        self.offering_counter  = int(0) # for unique ID purposes, not indexing
-        self.seeking_counter   = int(0) # for unique ID purposes, not indexing
+        self.batch_clearing    = batch_clearing
+        self.offers            = OrderBook('offerer', ascending=True)
+        self.bids              = OrderBook('seeker',  ascending=False)
         self.n_price_track     = n_price_track
         self.recent_prices     = np.full(n_price_track, np.nan)
         self.recent_quantities = np.full(n_price_track, np.nan)
@@ -72,62 +165,140 @@ class Market:
     def market_price(self):
         return np.nansum(self.recent_prices*(self.recent_quantities/np.nansum(self.recent_quantities)))
     
+    @property
+    def offering_df(self):
+        return self.offers.df
+    
+    @property
+    def seeking_df(self):
+        return self.bids.df
+    
+    @property
+    def offering_counter(self):
+        return self.offers.counter
+    
+    @property
+    def seeking_counter(self):
+        return self.bids.counter
+    
     def register_offer(self, seller, quantity, price):   
-        data = {'offerer': seller, 'quantity': quantity, 'price': price}  
-        self.offering_counter += 1    
-        new_row = pd.DataFrame(data, index=[self.offering_counter])
-        self.offering_df = pd.concat([self.offering_df, new_row], ignore_index=False, axis=0)  
-        self.offering_df.sort_values('price', ascending=True, inplace=True)
+        self.offers.add(seller, quantity, price)
     
     def register_interest(self, buyer, quantity, price):  
-        data = {'seeker': buyer, 'quantity': quantity, 'price': price}  
-        self.seeking_counter += 1    
-        new_row = pd.DataFrame(data, index=[self.seeking_counter])
-        self.seeking_df = pd.concat([self.seeking_df, new_row], ignore_index=False, axis=0)  
-        self.seeking_df.sort_values('price', ascending=False, inplace=True)
+        self.bids.add(buyer, quantity, price)
         
     def match_next(self):
-        status = False
-        if (len(self.offering_df) > 0) & (len(self.seeking_df) > 0):
-            if (self.offering_df.iloc[0]['price'] <= self.seeking_df.iloc[0]['price']):
-                seeker = self.seeking_df.iloc[0]['seeker']
-                offerer   = self.offering_df.iloc[0]['offerer']
-                quantity = np.min([self.offering_df.iloc[0]['quantity'], self.seeking_df.iloc[0]['quantity']])
-                price    = self.offering_df.iloc[0]['price'] if self.use_offered_price else self.seeking_df.iloc[0]['price']
-                self.transact(offerer, seeker, quantity, price)
-                
-                self.offering_df.iat[0, 1]   -= quantity
-                self.seeking_df.iat[0, 1] -= quantity
-                self.remove_fulfilled()
-                self.track_price(price, quantity)
-                
-                status = True
-            
-        return status
+        offer = self.offers.best()
+        bid   = self.bids.best()
+        if offer is None or bid is None or offer.price > bid.price:
+            return False
+        
+        quantity = min(offer.quantity, bid.quantity)
+        price    = offer.price if self.use_offered_price else bid.price
+        self.transact(offer.agent, bid.agent, quantity, price)
+        
+        offer.quantity -= quantity
+        bid.quantity   -= quantity
+        self.remove_fulfilled(offer, bid)
+        self.track_price(price, quantity)
+        return True
+    
+    def cross(self):
+        '''
+        Cross the books in one pass, returning the fills that matching one 
+        pair at a time would make as lists of offers and bids and arrays of
+        quantities and prices. Fills run between the breakpoints of the 
+        cumulative quantities of each side, in priority order, until the 
+        best remaining offer is priced above the best remaining bid. Only 
+        orders with a positive quantity take part.
+        '''
+        offers = [order for order in self.offers.ranked() if order.quantity > 0]
+        bids   = [order for order in self.bids.ranked() if order.quantity > 0]
+        if not offers or not bids:
+            return [], [], np.empty(0), np.empty(0)
+        
+        offered  = np.cumsum([order.quantity for order in offers], dtype=np.float64)
+        sought   = np.cumsum([order.quantity for order in bids], dtype=np.float64)
+        ask      = np.array([order.price for order in offers], dtype=np.float64)
+        bid      = np.array([order.price for order in bids], dtype=np.float64)
+        
+        cuts   = np.union1d(offered, sought)
+        cuts   = cuts[cuts <= min(offered[-1], sought[-1])]
+        starts = np.r_[0, cuts[:-1]]
+        i = np.searchsorted(offered, starts, side='right')
+        j = np.searchsorted(sought,  starts, side='right')
+        
+        crossed = ask[i] <= bid[j]
+        n = len(cuts) if crossed.all() else int(np.argmin(crossed))
+        i, j = i[:n], j[:n]
+        quantities = cuts[:n] - starts[:n]
+        prices     = ask[i] if self.use_offered_price else bid[j]
+        return [offers[x] for x in i.tolist()], [bids[x] for x in j.tolist()], quantities, prices
+    
+    def clear_market_batch(self):
+        offers, bids, quantities, prices = self.cross()
+        if len(quantities) == 0:
+            return True
+        
+        self.transact_many([order.agent for order in offers], [order.agent for order in bids], 
+                           quantities, prices)
+        
+        # Orders are filled up to the last breakpoint. Those wholly before 
+        # it are done, the one straddling it keeps the remainder.
+        for book, orders in ((self.offers, offers), (self.bids, bids)):
+            filled = {}
+            for order, quantity in zip(orders, quantities.tolist()):
+                filled[order] = filled.get(order, 0) + quantity
+            for order, quantity in filled.items():
+                order.quantity = 0 if order is not orders[-1] else order.quantity - quantity
+                if order.quantity <= 0:
+                    order.quantity = 0
+                    book.remove(order)
+            book.remove_empty()
+        
+        self.track_prices(prices, quantities)
+        return True
     
     def transact(self, offerer, seeker, quantity, price):
         # Define in subclass
         pass
+    
+    def transact_many(self, offerers, seekers, quantities, prices):
+        # Override in subclass to settle a batch of fills together
+        for offerer, seeker, quantity, price in zip(offerers, seekers, quantities.tolist(), prices.tolist()):
+            self.transact(offerer, seeker, quantity, price)
             
-    def remove_fulfilled(self):
-        self.offering_df.drop(self.offering_df.index[np.where(self.offering_df['quantity']==0)[0]], inplace=True)
-        self.seeking_df.drop(self.seeking_df.index[np.where(self.seeking_df['quantity']==0)[0]], inplace=True)
+    def remove_fulfilled(self, offer, bid):
+        for book, order in ((self.offers, offer), (self.bids, bid)):
+            if order.quantity == 0:
+                book.remove(order)
+            book.remove_empty()
         
     def track_price(self, price, quantity):
-        self.recent_prices = np.roll(self.recent_prices, 1)
+        self.recent_prices[1:] = self.recent_prices[:-1]
         self.recent_prices[0] = price
-        self.recent_quantities = np.roll(self.recent_quantities, 1)
+        self.recent_quantities[1:] = self.recent_quantities[:-1]
         self.recent_quantities[0] = quantity
     
+    def track_prices(self, prices, quantities):
+        # track_price for each fill in turn, the last fill ending up first
+        n = min(len(prices), self.n_price_track)
+        if n == 0:
+            return
+        for recent, values in ((self.recent_prices, prices), (self.recent_quantities, quantities)):
+            recent[n:] = recent[:self.n_price_track - n].copy()
+            recent[:n] = values[::-1][:n]
+    
     def clear_market(self):
-        market_active = True
-        while market_active:
-            market_active = self.match_next()
+        if self.batch_clearing:
+            return self.clear_market_batch()
+        while self.match_next():
+            pass
         return True
     
     def close_market(self):
-        self.offering_df.drop(self.offering_df.index, inplace=True)
-        self.seeking_df.drop(self.seeking_df.index, inplace=True)
+        self.offers.clear()
+        self.bids.clear()
 
 
 class InterBankMarket(Market):    
@@ -138,6 +309,26 @@ class InterBankMarket(Market):
         print(f'#############################################################')
         offerer.grant_loan_to_borrower(seeker, quantity, price, maturity_days=1)
     
+    def transact_many(self, offerers, seekers, quantities, prices):
+        # Fills between the same lender and borrower are booked as one 
+        # loan, at the rate of the last fill as extend_loan would leave it
+        loans = {}
+        for lender, borrower, quantity, rate in zip(offerers, seekers, quantities.tolist(), prices.tolist()):
+            value = loans.get((lender, borrower), (0, rate))[0]
+            loans[(lender, borrower)] = (value + quantity, rate)
+        
+        lenders = {}
+        for (lender, borrower), (value, rate) in loans.items():
+            if lender.has_lending_account_with_borrower(borrower) == False:
+                lender.open_lending_account(borrower)
+            print(f'EXTEND LOAN {value}')
+            lenders.setdefault(lender, []).append((borrower, value, rate))
+        print(f'#############################################################')
+        
+        for lender, loans in lenders.items():
+            borrowers, values, rates = zip(*loans)
+            lender.grant_loans_to_borrowers(borrowers, values, rates, maturity_days=1)
+    
 
 class BondMarket(Market):
     
@@ -155,29 +346,72 @@ class BondMarket(Market):
     price = C * (1-((1+r)^-n)/r) + 100/(1+r)^n
     '''
     
-    def __init__(self, model, maturity_date, coupon_rate, n_price_track=50, use_offered_price=True):    
-        super().__init__(model, n_price_track=n_price_track, use_offered_price=use_offered_price)
+    def __init__(self, model, maturity_date, coupon_rate, n_price_track=50, use_offered_price=True, batch_clearing=False):    
+        super().__init__(model, n_price_track=n_price_track, use_offered_price=use_offered_price, batch_clearing=batch_clearing)
         self.maturity_date = maturity_date
         self.coupon_rate   = coupon_rate
         
+    @property
+    def market_yield(self):
+        return BondExchange.price_to_yield(self.model.schedule.day, self.maturity_date, self.market_price, self.coupon_rate,
+                                           coupon_frequency=self.model.bond_ledger.annual_coupon_frequency,
+                                           days_in_year=self.model.schedule.days_in_year)
+    
     def get_bond_indexes_by_holder(self, holder):
-        holder_mask   = self.model.bond_ledger.df['holder'] == holder
-        maturity_mask = self.model.bond_ledger.df['maturity_date'] == self.maturity_date
-        coupon_mask   = self.model.bond_ledger.df['interest_rate'] == self.coupon_rate
-        records       = self.model.bond_ledger.df.loc[holder_mask & maturity_mask & coupon_mask]
-        return records
+        return self.model.bond_ledger.records(self.holdings(holder)[0])
+    
+    def holdings(self, holder):
+        '''
+        IDs and quantities of the holder's records traded in this market
+        '''
+        ledger = self.model.bond_ledger
+        ids = ledger.holdings(holder, self.maturity_date, self.coupon_rate)
+        return ids, ledger.quantities(ids).astype(int)
+    
+    def allocate(self, ids, held, n_bonds):
+        '''
+        Take whole records, or part of one, in order until n_bonds are 
+        found. Returns the IDs and quantities taken.
+        '''
+        taken = np.minimum(held, np.maximum(n_bonds - (np.cumsum(held) - held), 0))
+        return ids[taken > 0], taken[taken > 0]
     
     def transact(self, offerer, seeker, quantity, price):        
-        records = self.get_bond_indexes_by_holder(offerer)        
-        n_bonds = int((quantity)//price)
-        
-        if len(records) < n_bonds:
-            n_bonds = len(records)
+        ids, held = self.holdings(offerer)
+        ids, taken = self.allocate(ids, held, int((quantity)//price))
+        if len(ids) > 0:
+            offerer.sell_bonds(seeker, price, ids, taken)
+    
+    def transact_many(self, offerers, seekers, quantities, prices):
+        # Each fill buys as many whole bonds as it did one at a time, then
+        # every buyer pays once and the bonds move in one ledger call
+        n_bonds = (quantities//prices).astype(int)
+        seekers = np.array(seekers, dtype=object)
+        for offerer in dict.fromkeys(offerers):
+            fills = np.array([x is offerer for x in offerers], dtype=bool)
+            ids, held = self.holdings(offerer)
             
-        idxs = records.index[:(n_bonds)]
-        
-        for idx in idxs:
-            offerer.sell_bond(seeker, price, idx)
+            # Fills draw on the records in turn, so allocate their total 
+            # and split it at the fills' cumulative bond counts
+            wanted = np.cumsum(n_bonds[fills])
+            ids, taken = self.allocate(ids, held, wanted[-1])
+            if len(ids) == 0:
+                continue
+            edges = np.union1d(np.cumsum(taken), wanted)
+            edges = edges[(edges > 0) & (edges <= taken.sum())]
+            starts = np.r_[0, edges[:-1]]
+            record = np.searchsorted(np.cumsum(taken), starts, side='right')
+            fill   = np.searchsorted(wanted, starts, side='right')
+            buyers = seekers[fills][fill]
+            # Check the bonds can move before anyone pays for them
+            self.model.bond_ledger.check_transfer(ids[record], buyers, edges - starts)
+            
+            payments = {}
+            for buyer, value in zip(buyers, ((edges - starts)*prices[fills][fill]).tolist()):
+                payments[buyer] = payments.get(buyer, 0) + value
+            for buyer, value in payments.items():
+                buyer.pay(offerer.deposit_account_number, value)
+            self.model.bond_ledger.transfer_many(ids[record], buyers, edges - starts)
         
 class BondExchange:
     
@@ -246,33 +480,124 @@ class BondExchange:
         
         return individual_bond_price
     
-    def price_to_yield(price, coupon_rate, remaining_coupon_payments, bond_face_value=100, coupon_frequency=2):
-        pass
+    @staticmethod
+    def price_to_yield(settlement_date, maturity_date, price, coupon_rate, bond_face_value=100, 
+                       coupon_frequency=2, days_in_year=252, tolerance=1e-8, max_iterations=100,
+                       bounds=(-50, 1000)):
+        '''
+        Inverse of yield_to_price - the yield, in percentage points, at which
+        a bond of the given terms is worth the price. All arguments but the 
+        solver settings may be arrays and are broadcast together.
+        
+        Price falls as yield rises, so the yield is found by bisection 
+        within bounds until the bracket is narrower than the tolerance. 
+        Bills, which pay no coupon, are solved directly. Prices outside the 
+        bounds, and bonds at or past maturity, give NaN.
+        '''
+        scalar = all(np.ndim(x) == 0 for x in (settlement_date, maturity_date, price, coupon_rate, bond_face_value))
+        settlement_date, maturity_date, price, coupon_rate, bond_face_value = np.broadcast_arrays(
+            *(np.atleast_1d(np.asarray(x, dtype=np.float64)) for x in (settlement_date, maturity_date, price, coupon_rate, bond_face_value)))
+        
+        def price_at(desired_yield):
+            return BondExchange.yield_to_price(settlement_date, maturity_date, desired_yield, coupon_rate, 
+                                               bond_face_value=bond_face_value, coupon_frequency=coupon_frequency, 
+                                               days_in_year=days_in_year)
+        
+        lower = np.full(price.shape, float(bounds[0]))
+        upper = np.full(price.shape, float(bounds[1]))
+        bracketed = (price_at(upper) <= price) & (price <= price_at(lower))
+        for i in range(max_iterations):
+            middle = (lower + upper)/2
+            # yield_to_price drops the coupons at exactly zero yield
+            middle[middle == 0] = tolerance/2
+            below = price_at(middle) > price
+            lower = np.where(below, middle, lower)
+            upper = np.where(below, upper, middle)
+            if np.all(upper - lower < tolerance):
+                break
+        result = (lower + upper)/2
+        
+        years_to_maturity = (maturity_date - settlement_date)/days_in_year
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bills = coupon_rate == 0
+            result[bills] = 100*((bond_face_value[bills]/price[bills])**(1/years_to_maturity[bills]) - 1)
+            invalid = (years_to_maturity <= 0) | ~(price > 0) | ~bracketed
+        result[invalid] = np.nan
+        return float(result[0]) if scalar else result
     
-    def __init__(self, model):
+    def yield_curve(self):
+        '''
+        Market price and yield of every live issue, by maturity
+        '''
+        markets = sorted(self.markets.values(), key=lambda x: (x.maturity_date, x.coupon_rate))
+        df = pd.DataFrame({'maturity_date': [x.maturity_date for x in markets],
+                           'coupon_rate':   [x.coupon_rate for x in markets],
+                           'market_price':  [x.market_price for x in markets]}, dtype=np.float64)
+        df['market_yield'] = self.price_to_yield(self.model.schedule.day, df.maturity_date.values, 
+                                                 df.market_price.values, df.coupon_rate.values,
+                                                 coupon_frequency=self.model.bond_ledger.annual_coupon_frequency,
+                                                 days_in_year=self.model.schedule.days_in_year)
+        return df
+    
+    def __init__(self, model, batch_clearing=False):
         self.model = model
-        self.markets = []
+        self.markets = {}    # (maturity_date, coupon_rate) -> BondMarket
+        self.batch_clearing = batch_clearing
+        self._maturities = [] # heap of market keys, earliest maturity first
+        self.archive = {}     # retired markets' final prices, by key
+        
+    @staticmethod
+    def market_key(maturity_date, coupon_rate):
+        return (float(maturity_date), float(coupon_rate))
         
     def register_bond_issue(self, maturity_date, coupon_rate):
-        if not self.market_exists(maturity_date, coupon_rate):
-            self.markets.append(BondMarket(self.model, maturity_date, coupon_rate)) 
-        return self.get_market(maturity_date, coupon_rate)
+        key = self.market_key(maturity_date, coupon_rate)
+        if key not in self.markets:
+            self.markets[key] = BondMarket(self.model, maturity_date, coupon_rate, batch_clearing=self.batch_clearing)
+            heapq.heappush(self._maturities, key)
+        return self.markets[key]
         
     def list_bond_issues(self):
         # add offered and sought prices?
-        return np.array([[x.maturity_date, x.coupon_rate] for x in self.markets])
+        return np.array([[x.maturity_date, x.coupon_rate] for x in self.markets.values()])
 
     def get_market(self, maturity_date, coupon_rate):
-        boolean = [((x.maturity_date == maturity_date) & (x.coupon_rate == coupon_rate)) for x in self.markets]
-        if np.any(boolean):
-            return self.markets[np.where(boolean)[0][0]]
-        else:
-            return None
+        return self.markets.get(self.market_key(maturity_date, coupon_rate))
         
     def market_exists(self, maturity_date, coupon_rate):
-        return False if self.get_market(maturity_date, coupon_rate) is None else True
+        return self.market_key(maturity_date, coupon_rate) in self.markets
+    
+    def retire_matured_markets(self, date=None):
+        '''
+        Close the markets for issues maturing on or before the date, today 
+        by default, keeping their last tracked prices and quantities, 
+        oldest first, in the archive
+        '''
+        if date is None:
+            date = self.model.schedule.day
+        
+        retired = []
+        while self._maturities and self._maturities[0][0] <= date:
+            key = heapq.heappop(self._maturities)
+            market = self.markets.pop(key)
+            market.close_market()
+            traded = ~np.isnan(market.recent_prices)
+            self.archive[key] = {'retired':      date,
+                                 'market_price': market.market_price,
+                                 'prices':       market.recent_prices[traded][::-1].copy(),
+                                 'quantities':   market.recent_quantities[traded][::-1].copy()}
+            retired.append(key)
+        return retired
+    
+    @property
+    def archive_df(self):
+        '''
+        One row per archived trade price of each retired market
+        '''
+        rows = [(maturity_date, coupon_rate, record['retired'], price, quantity)
+                for (maturity_date, coupon_rate), record in self.archive.items()
+                for price, quantity in zip(record['prices'], record['quantities'])]
+        return pd.DataFrame(rows, columns=['maturity_date', 'coupon_rate', 'retired', 'price', 'quantity'])
     
     def __call__(self, maturity_date, coupon_rate):
         return self.get_market(maturity_date, coupon_rate)
-
-
@@ -5,21 +5,30 @@ Created on Fri Oct 21 15:31:16 2022
 @author: andre
 """
 
+import numbers
 import numpy as np
 import pandas as pd
 import objgraph
 import time
+import gzip
+import pickle
+import atexit
 from typing import List, Tuple
 # from mesa import Model as MesaModel
 # from mesa.datacollection import DataCollector
 import random
 from agent_based_economy.ledgers import DepositLedger, LoanLedger, BondLedger#, TaxLedger, StockLedger
-from agent_based_economy.agents.household import Household#, HouseholdConfig
+from agent_based_economy.agents.household import Household, adjust_reservation_wages#, HouseholdConfig
 from agent_based_economy.agents.firm  import Firm#, FirmConfig
 from agent_based_economy.agents.banks import CommercialBank, CentralBank
 from agent_based_economy.agents.government import Government
 from agent_based_economy.agents.stock_registrar import StockRegistrar
 from agent_based_economy.markets import InterBankMarket, BondExchange
+from agent_based_economy.consumption import ConsumptionEngine
+from agent_based_economy.population import Population
+from agent_based_economy.profiler import StepProfiler
+from agent_based_economy.output import OutputSink
+from agent_based_economy.reporting import Fields, reporter, distribution_reporter
 
 class Model():
     """
@@ -31,19 +40,27 @@ class Model():
     This version follows the paper as closely as possible
     """
 
-    __slots__ = ('counter','schedule','poverty_level','labour_supply',
+    __slots__ = ('counter','agents','schedule','poverty_level','labour_supply',
                  'deposit_ledger','loan_ledger','bond_ledger',
+                 'firm_population','household_population',
                  'government','central_bank','banks','firms','households', 
-                 'interbank_market', 'bond_exchange', 'datacollector', 'stock_registrar', 'real')
+                 'interbank_market', 'bond_exchange', 'datacollector', 'stock_registrar', 'real',
+                 'consumption_engine', 'profiler', 'output')
     
     def __init__(self, num_households=1000, num_firms=50, num_banks=5, 
                  firm_goods_price=Firm.initial_goods_price, # per unit
                  firm_wage_rate=Firm.initial_wage_rate,     # per month
-                 seed=None, days_in_month=21, real=True, model_reporters=None) -> None:
+                 seed=None, days_in_month=21, real=True, model_reporters=None,
+                 net_settlement=False, vectorised_consumption=False, profile=False,
+                 audit_bonds=False, batch_clearing=False) -> None:
         
         self.counter = int(0)
+        self.agents  = {}   # unique_id -> agent, as referenced by the ledgers
         self.real = real
         
+        # Optional per-phase timing of the scheduler
+        self.profiler = StepProfiler(self) if profile else None
+        
         # Set up the scheduler from the model        
         self.schedule = Scheduler(self, days_in_month=days_in_month)
         self.poverty_level = 1
@@ -52,18 +69,23 @@ class Model():
         # Set up ledgers for assets/liabilities
         self.deposit_ledger   = DepositLedger(self)
         self.loan_ledger      = LoanLedger(self)
-        self.bond_ledger      = BondLedger(self)
+        self.bond_ledger      = BondLedger(self, audit=audit_bonds)
         
         # Set up main institutions
         self.government   = Government(self)
         self.central_bank = CentralBank(self)        
+        self.central_bank.net_settlement = net_settlement
         self.banks        = [CommercialBank(self) for i in range(num_banks)]
         
         self.government.open_deposit_account(self.central_bank, overdraft=np.inf)
         self.government.open_borrowing_account(self.central_bank)
         [bank.register_with_central_bank(overdraft=np.inf) for bank in self.banks]
-        self.interbank_market = InterBankMarket(self)
-        self.bond_exchange = BondExchange(self)
+        self.interbank_market = InterBankMarket(self, batch_clearing=batch_clearing)
+        self.bond_exchange = BondExchange(self, batch_clearing=batch_clearing)
+        
+        # Array storage for firm and household state
+        self.firm_population      = Population(Firm, capacity=num_firms)
+        self.household_population = Population(Household, capacity=num_households)
         
         firm_wage_rate  = firm_wage_rate # per month
         self.firms      = [Firm(self, firm_goods_price, firm_wage_rate) for i in range(num_firms)]
@@ -74,15 +96,28 @@ class Model():
         self.stock_registrar = StockRegistrar(self)
         self.stock_registrar.open_deposit_account(self.banks[0], overdraft=0)
         
+        # Optional batched replacement for the daily household purchases
+        self.consumption_engine = ConsumptionEngine(self, seed=seed) if vectorised_consumption else None
+        
         self.datacollector = DataCollector(self,
             model_reporters=model_reporters,
         )
+        self.output = None
         
-    def next_id(self) -> str:
+    def next_id(self) -> int:
         this_id = self.counter
         self.counter += 1
         return this_id
     
+    def register_agent(self, agent) -> None:
+        self.agents[agent.unique_id] = agent
+        
+    def agent(self, unique_id):
+        """
+        Resolve an agent from the ID held in the ledgers
+        """
+        return self.agents[unique_id]
+    
     @property
     def num_firms(self) -> int:
         """
@@ -125,9 +160,18 @@ class Model():
         shareholding = [(o, o.deposit_balance) for o in self.households]
         return (shareholding, sum([x[1] for x in shareholding]))
         
-    def step(self, output_frequency='m', save_output=False, file_name=None) -> None:
+    def step(self, output_frequency='m', save_output=False, file_name=None, 
+             flush_rows=None, flush_seconds=None) -> None:
         """
-        A model step. Used for collecting data and advancing the schedule
+        A model step. Used for collecting data and advancing the schedule.
+        With a file_name the collected data is streamed to it, flushed as 
+        set by flush_rows and flush_seconds, see OutputSink. End the run 
+        with close_output to write the last rows; rows still waiting are 
+        otherwise written when the interpreter exits:
+            
+            for day in range(days):
+                model.step(save_output=True, file_name='output.csv')
+            model.close_output()
         """
         self.schedule.step()
     
@@ -138,22 +182,185 @@ class Model():
             elif output_frequency == 'd':
                 self.datacollector.collect(self.schedule.day)
                 
-            if self.schedule.is_month_start() and file_name is not None:
-                self.datacollector.df.to_csv(file_name, sep=',')
+            if file_name is not None and (self.output is None or self.output.file_name != file_name):
+                self.open_output(file_name, flush_rows=flush_rows, flush_seconds=flush_seconds)
+                
+        if self.output is not None:
+            self.output.maybe_flush()
+    
+    def open_output(self, file_name, format=None, flush_rows=None, flush_seconds=None) -> OutputSink:
+        """
+        Stream collected data to file_name as the run goes, see OutputSink
+        """
+        self.close_output()
+        self.output = OutputSink(self.datacollector, file_name, format=format, 
+                                 flush_rows=flush_rows, flush_seconds=flush_seconds)
+        # A run that ends without close_output still writes its last rows
+        atexit.register(self.output.flush)
+        return self.output
+    
+    def close_output(self) -> None:
+        """
+        Write the rows still waiting and stop streaming
+        """
+        if self.output is not None:
+            atexit.unregister(self.output.flush)
+            self.output.flush()
+            self.output = None
+    
+    # Bumped whenever a change to the model's classes makes older 
+    # checkpoints unloadable
+    checkpoint_version = 1
+    
+    def save_checkpoint(self, path) -> None:
+        """
+        Save the whole model to path: agents, ledgers, market books, the 
+        schedule, collected data and the state of the random and 
+        numpy.random generators, pickled with the highest protocol. A path 
+        ending .gz is gzip compressed, smaller but slower to save and load.
+        
+        The output sink is not saved, so models restored from the same 
+        checkpoint do not append to one file; give each its own with 
+        open_output. Custom reporters must be importable functions or 
+        DistributionReporters, not lambdas or closures.
+        """
+        output, self.output = self.output, None
+        try:
+            checkpoint = {'version':      self.checkpoint_version,
+                          'model':        self,
+                          'random':       random.getstate(),
+                          'numpy_random': np.random.get_state()}
+            with _open_checkpoint(path, 'wb') as f:
+                pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            self.output = output
+    
+    @classmethod
+    def load_checkpoint(cls, path) -> 'Model':
+        """
+        Restore a model saved with save_checkpoint, e.g. one past its 
+        warm-up, and reset the random generators to where they were when 
+        it was saved, so it runs on exactly as the saved model would have. 
+        Each load is an independent copy, to be branched into a scenario; 
+        as the generators are global, load each branch when it is to be run.
+        """
+        with _open_checkpoint(path, 'rb') as f:
+            checkpoint = pickle.load(f)
+        if checkpoint.get('version') != cls.checkpoint_version:
+            raise ValueError(f"Checkpoint {path} is version {checkpoint.get('version')}, "
+                             f"expected {cls.checkpoint_version}")
+        
+        model = checkpoint['model']
+        # Ledgers pickle without their model
+        for ledger in (model.deposit_ledger, model.loan_ledger, model.bond_ledger):
+            ledger.model = model
+        random.setstate(checkpoint['random'])
+        np.random.set_state(checkpoint['numpy_random'])
+        return model
+        
+def _open_checkpoint(path, mode):
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode, compresslevel=1)
+    return open(path, mode)
             
 class DataCollector:
+    """
+    Model reporter values, one row per collection.
+    
+    Values are written into a preallocated column per reporter, which 
+    doubles in length when full, so a collection costs the same however 
+    long the history. A column takes its type from the values collected, 
+    bool, int64 or float64, widening as later values need, and holds 
+    anything else as objects. Size it for a planned run with capacity or 
+    reserve. The DataFrame is built when df is read and cached until the 
+    next collection. Collecting an index again overwrites its row.
+    
+    Reporters declaring the agent fields they read, see reporting.reporter, 
+    are evaluated over one gathering of each field per collection. Others 
+    are called with the model.
+    """
     
-    __slots__ = ('model', 'model_reporters', 'keys', 'df')
+    __slots__ = ('model', 'model_reporters', 'keys', 'fields', 'capacity', 
+                 '_index', '_rows', '_columns', '_df_cache')
     
-    def __init__(self,model, model_reporters={}):
+    def __init__(self,model, model_reporters={}, capacity=256):
         self.model = model
         self.model_reporters = model_reporters or default_model_reporters
-        self.df = pd.DataFrame(columns=self.model_reporters.keys())
         self.keys = list(self.model_reporters.keys())
+        self.fields = list(dict.fromkeys(name for reporter in self.model_reporters.values() 
+                                         for name in getattr(reporter, 'fields', ())))
+        self.capacity  = 0
+        self._index    = []  # row -> index label
+        self._rows     = {}  # index label -> row
+        self._columns  = {key: np.empty(0, dtype=bool) for key in self.keys}
+        self._df_cache = None
+        self.reserve(capacity)
+        
+    def __len__(self):
+        return len(self._index)
+    
+    def reserve(self, capacity):
+        """
+        Make room for at least capacity collections in all
+        """
+        if capacity > self.capacity:
+            n = len(self._index)
+            for key, column in self._columns.items():
+                self._columns[key] = np.zeros(capacity, dtype=column.dtype)
+                self._columns[key][:n] = column[:n]
+            self.capacity = capacity
+    
+    def collect(self, index):
+        # Reporters declaring their fields share one gathering of each
+        data = Fields(self.model)
+        data.prefetch(self.fields)
+        
+        row = self._rows.get(index)
+        if row is None:
+            row = len(self._index)
+            if row == self.capacity:
+                self.reserve(max(2*self.capacity, 1))
+            self._rows[index] = row
+            self._index.append(index)
+            
+        for key, reporter in self.model_reporters.items():
+            self._store(key, row, reporter(self.model, data) if hasattr(reporter, 'fields') else reporter(self.model))
+        self._df_cache = None
+        
+    # Column types in order of widening
+    dtypes = [np.dtype(bool), np.dtype(np.int64), np.dtype(np.float64), np.dtype(object)]
+    
+    @staticmethod
+    def dtype_of(value) -> np.dtype:
+        if isinstance(value, (bool, np.bool_)):
+            return np.dtype(bool)
+        if isinstance(value, numbers.Integral):
+            return np.dtype(np.int64) if -2**63 <= value < 2**63 else np.dtype(object)
+        if isinstance(value, numbers.Real):
+            return np.dtype(np.float64)
+        return np.dtype(object)
     
-    def collect(self, index):        
-        for key in self.model_reporters.keys():
-            self.df.at[index, key] = self.model_reporters[key](self.model)
+    def _store(self, key, row, value):
+        column = self._columns[key]
+        if column.dtype != object:
+            dtype = self.dtype_of(value)
+            if self.dtypes.index(dtype) > self.dtypes.index(column.dtype):
+                column = self._columns[key] = column.astype(dtype)
+        column[row] = value
+    
+    def rows(self, start=0, stop=None):
+        """
+        DataFrame of the collections from start up to stop, all by default
+        """
+        start, stop, _ = slice(start, stop).indices(len(self._index))
+        return pd.DataFrame({key: column[start:stop] for key, column in self._columns.items()},
+                            index=pd.Index(self._index[start:stop]), columns=self.keys)
+    
+    @property
+    def df(self):
+        if self._df_cache is None:
+            self._df_cache = self.rows()
+        return self._df_cache
              
 class Scheduler:
     """
@@ -230,45 +437,82 @@ class Scheduler:
         """
         return (self.steps+1) % self.days_in_month == 0
 
+    # Named phases of a step, in the order they run
+    phases = ('deposit_interest', 'loan_interest', 'loan_repayments', 
+              'bond_coupons', 'bond_maturities', 'bond_revaluation',
+              'month_start', 'daily_purchases', 'daily_production', 
+              'month_end', 'interbank_market')
+
     def step(self) -> None:
+        profiler = self.model.profiler
+        if profiler is None:
+            for phase in self.phases:
+                getattr(self, phase)()
+        else:
+            for phase in self.phases:
+                profiler.run(phase, self.steps, getattr(self, phase))
         
+        self.steps += 1
+    
+    def deposit_interest(self) -> None:
         # Pay daily deposit interest 
         self.model.deposit_ledger.apply_daily_interest(issuer=self.model.central_bank)
         
         for bb in self.model.banks:
             self.model.deposit_ledger.apply_daily_interest(issuer=bb)
-        
+    
+    def loan_interest(self) -> None:
         # Apply daily loan interest
         self.model.loan_ledger.apply_daily_interest()
-        
+    
+    def loan_repayments(self) -> None:
         # repay interbank loan (with loan increment)
         due_loans = self.model.loan_ledger.loans_due()
         if len(due_loans) != 0:
-            for idx, loan in self.model.loan_ledger.df.loc[due_loans].iterrows():
+            for idx, loan in self.model.loan_ledger.records(due_loans).iterrows():
                 print(f'REPAY LOAN {loan.value}')
-                loan.issuer.make_loan_repayment(loan.value, account_number=idx)
-        
+                self.model.agent(loan.issuer).make_loan_repayment(loan.value, account_number=idx)
+    
+    def bond_coupons(self) -> None:
         # Pay bond coupons
         # Coupons are 2 yearly so this is a function of date and year length
-        if self.model.bond_ledger.coupon_due():
+        # The coupon calendar holds the bonds due today, excluding those
+        # issued today and treasury bills
+        ledger = self.model.bond_ledger
+        if ledger.coupon_due():
             print('PAYING COUPONS...')
-            for idx, bond in self.model.bond_ledger.df.iterrows():
-                if bond.issue_date != self.model.schedule.day:
-                    coupon_value = bond.value*(bond.interest_rate/self.model.bond_ledger.annual_coupon_frequency)/100.0
-                    bond.issuer.pay(bond.holder.deposit_account_number, coupon_value)
-        
+            issuers, holders, bonds, values = ledger.coupons_payable()
+            self.pay_bond_holders(issuers, holders, values)
+            ledger.record_coupon_flows(self.day, issuers, holders, bonds, values)
+        ledger.roll_coupons()
+    
+    def bond_maturities(self) -> None:
         # maturing bonds
-        maturing_bonds = self.model.bond_ledger.bonds_maturing()
+        # Principal is repaid to each holder in one payment and the matured
+        # bonds are cancelled together, then their markets are retired
+        ledger = self.model.bond_ledger
+        maturing_bonds = ledger.bonds_maturing()
         if len(maturing_bonds) != 0:
             print(f'REPAYING MATURING BOND PRINCIPAL...')
-            for idx, bond in self.model.bond_ledger.df.loc[maturing_bonds].iterrows():
-                if bond.issuer != bond.holder:
-                    bond.issuer.buy_bond(bond.holder, bond.value, idx)
-                bond.issuer.close_bond(idx)
-        
+            issuers, holders, bonds, values = ledger.principal_payable()
+            self.pay_bond_holders(issuers, holders, values)
+            ledger.drop_many(maturing_bonds)
+        self.model.bond_exchange.retire_matured_markets(self.day)
+    
+    def pay_bond_holders(self, issuers, holders, values) -> None:
+        """
+        Each issuer pays what it owes its holders in a single batch
+        """
+        for issuer_id in np.unique(issuers).tolist():
+            paid = (issuers == issuer_id) & (values > 0)
+            accounts = [self.model.agent(x).deposit_account_number for x in holders[paid].tolist()]
+            self.model.agent(issuer_id).pay_many(accounts, values[paid])
+    
+    def bond_revaluation(self) -> None:
         # revalue bonds
         self.model.bond_ledger.recalculate()
 
+    def month_start(self) -> None:
         if self.model.real:
             # Shuffle the household list once per step
             # self.model.random.shuffle(self.households)
@@ -281,14 +525,24 @@ class Scheduler:
                     firm.month_start()
                 for household in self.model.households:
                     household.month_start()
-           
+    
+    def daily_purchases(self) -> None:
+        if self.model.real:
             # Lapse of a day
             # Households first  
-            for hh in self.model.households:
-                hh.day()
+            if self.model.consumption_engine is not None:
+                self.model.consumption_engine.day()
+            else:
+                for hh in self.model.households:
+                    hh.day()
+    
+    def daily_production(self) -> None:
+        if self.model.real:
             for firm in self.model.firms:
                 firm.day()
-                
+    
+    def month_end(self) -> None:
+        if self.model.real:
             # End of a month
             # Firms first
             if self.is_month_end():
@@ -304,10 +558,12 @@ class Scheduler:
                 
                 self.model.stock_registrar.pay_dividends()
                 
-                for hh in self.model.households:
-                    hh.month_end()
-        
+                adjust_reservation_wages(self.model)
+    
+    def interbank_market(self) -> None:
         # Close of business inter bank market
+        # Settle any deferred interbank payments first
+        self.model.central_bank.settle_net_positions()
         
         self.model.central_bank.open_standing_lending_facility()
         
@@ -330,121 +586,113 @@ class Scheduler:
         self.model.interbank_market.clear_market()
         self.model.interbank_market.close_market() # this remove all offers and bids
         
-        self.steps += 1
-        
 # # FUNCTIONS
         
-def count_poverty(model) -> int:
+@reporter('households.poverty')
+def count_poverty(model, data) -> int:
     """
     Number of households employed
     """
-    return sum(
-        [hh.poverty for hh in model.households]
-    )
+    return np.count_nonzero(data['households.poverty'])
 
 
-def count_employed(model) -> int:
+@reporter('households.employer')
+def count_employed(model, data) -> int:
     """
     Number of households employed
     """
-    return sum(
-        [hh.employer is not None for hh in model.households]
-    )
+    return np.count_nonzero(data['households.employer'] >= 0)
 
 
-def count_notice(model) -> int:
+@reporter('firms.worker_on_notice')
+def count_notice(model, data) -> int:
     """
     Number of firms with worker on notice
     """
-    return sum(
-        [f.worker_on_notice is not None for f in model.firms]
-    )
+    return np.count_nonzero(data['firms.worker_on_notice'] >= 0)
 
 
-def sum_expected_demand(model) -> float:
+@reporter('households.current_demand')
+def sum_expected_demand(model, data) -> float:
     """
     Total expected demand over month
     """
-    return sum([hh.current_demand for hh in model.households]) * model.schedule.days_in_month
+    return data['households.current_demand'].sum() * model.schedule.days_in_month
 
 
-def percent_unsatisfied_demand(model) -> float:
+@reporter('households.current_demand', 'households.unsatisfied_demand')
+def percent_unsatisfied_demand(model, data) -> float:
     """
     percentage of unsatisfied demand over expected demand
     """
-    try:
-        return (
-            sum([hh.unsatisfied_demand for hh in model.households]) * 100
-            / sum_expected_demand(model)
-        )
-    except ZeroDivisionError:
+    expected_demand = sum_expected_demand(model, data)
+    if expected_demand == 0:
         return 0
+    return data['households.unsatisfied_demand'].sum() * 100 / expected_demand
 
 
-def compute_gini(model) -> float:
+@reporter('households.deposit_balance')
+def compute_gini(model, data) -> float:
     """
     Calculate the gini coefficient based upon household liquidity
     """
-    try:
-        x = sorted([hh.deposit_balance for hh in model.households])
-        N = len(x)
-        B = sum(xi * (N - i) for i, xi in enumerate(x)) / (N * sum(x))
-        return 1 + (1 / N) - 2 * B
-    except ZeroDivisionError:
-        return 0
+    return data.distribution('households.deposit_balance').gini()
 
 
-def sum_hh_saving(model) -> float:
+@reporter('households.planned_saving')
+def sum_hh_saving(model, data) -> float:
     """
     How much money households expect to save
     """
-    return sum([hh.planned_saving for hh in model.households])
+    return data['households.planned_saving'].sum()
 
 
-def sum_hh_liquidity(model) -> int:
+@reporter('households.deposit_balance')
+def sum_hh_liquidity(model, data) -> int:
     """
     How much money households have
     """
-    return sum([hh.deposit_balance for hh in model.households])
+    return data['households.deposit_balance'].sum()
 
 
-def sum_firm_liquidity(model) -> int:
+@reporter('firms.deposit_balance')
+def sum_firm_liquidity(model, data) -> int:
     """
     How much money firms have
     """
-    return sum([firm.deposit_balance for firm in model.firms])
+    return data['firms.deposit_balance'].sum()
 
 
-def sum_liquidity(model) -> int:
+@reporter('households.deposit_balance', 'firms.deposit_balance')
+def sum_liquidity(model, data) -> int:
     """
     How much money is in the system
     """
-    return sum_firm_liquidity(model) + sum_hh_liquidity(model)
+    return sum_firm_liquidity(model, data) + sum_hh_liquidity(model, data)
 
 
-def sum_inventory(model) -> int:
+@reporter('firms.inventory')
+def sum_inventory(model, data) -> int:
     """
     Total stock in hand
     """
-    return sum(
-        [f.inventory for f in model.firms]
-    )
+    return data['firms.inventory'].sum()
 
 
-def average_goods_price(model) -> float:
+@reporter('firms.goods_price')
+def average_goods_price(model, data) -> float:
     """
     Average price of goods
     """
-    prices = [f.goods_price for f in model.firms]
-    return sum(prices) / len(prices)
+    return data['firms.goods_price'].mean()
 
 
-def average_wage_rate(model) -> float:
+@reporter('firms.wage_rate')
+def average_wage_rate(model, data) -> float:
     """
     Average wage rate
     """
-    wage_rates = [f.wage_rate for f in model.firms]
-    return sum(wage_rates) / len(wage_rates) / model.schedule.days_in_month
+    return data['firms.wage_rate'].mean() / model.schedule.days_in_month
 
 def model_date(model) -> float:
     """
@@ -463,3 +711,15 @@ default_model_reporters={
     "Gini": compute_gini,
 }
 
+# Inequality of household deposits, wages and planned consumption, one 
+# sort of each per collection
+inequality_reporters = {
+    f'{label} {name}': distribution_reporter(field, statistic, *args)
+    for label, field in [('Deposit',     'households.deposit_balance'),
+                         ('Wage',        'households.wage'),
+                         ('Consumption', 'households.planned_consumption')]
+    for name, statistic, args in [('Gini',          'gini',      ()),
+                                  ('top 10% share', 'top_share', (0.1,)),
+                                  ('Palma',         'palma',     ())]
+}
+
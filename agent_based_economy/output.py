@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:05:43 2026
+
+@author: andre
+"""
+
+import os
+import time
+
+class OutputSink:
+    """
+    Appends the rows a DataCollector gathers to a file as the run goes, 
+    rather than rewriting the whole history.
+
+    Each flush writes only the rows collected since the last one. With the 
+    csv format they are appended to file_name, the header written by the 
+    first flush. With parquet each flush writes a numbered part file in the 
+    directory file_name, which pandas.read_parquet reads back as one frame; 
+    this needs pyarrow or fastparquet installed. The first flush replaces 
+    any earlier output.
+
+    maybe_flush, called by Model.step, flushes once flush_rows rows are 
+    waiting or flush_seconds have passed since the last flush, whichever 
+    comes first, so a crash loses at most one flush interval. With neither 
+    set these are default_flush_rows, a year of monthly rows, and 
+    default_flush_seconds. Rows still waiting at the end of a run are 
+    written by flush, or Model.close_output; a sink opened by the Model 
+    also flushes when the interpreter exits. Rows collected again after 
+    they have been flushed are not rewritten.
+    """
+
+    __slots__ = ('collector', 'file_name', 'format', 'flush_rows', 'flush_seconds', 
+                 'clock', 'flushed', 'parts', '_last_flush')
+
+    formats = ('csv', 'parquet')
+    
+    default_flush_rows    = 12
+    default_flush_seconds = 60
+
+    def __init__(self, collector, file_name, format=None, flush_rows=None, flush_seconds=None,
+                 clock=time.monotonic):
+        if format is None:
+            format = 'parquet' if str(file_name).endswith('.parquet') else 'csv'
+        if format not in self.formats:
+            raise ValueError(f'Output format must be one of {self.formats}, not {format}')
+        
+        self.collector     = collector
+        self.file_name     = file_name
+        self.format        = format
+        if flush_rows is None and flush_seconds is None:
+            flush_rows, flush_seconds = self.default_flush_rows, self.default_flush_seconds
+        self.flush_rows    = flush_rows
+        self.flush_seconds = flush_seconds
+        self.clock         = clock
+        self.flushed       = 0    # rows of the collector already written
+        self.parts         = 0    # parquet part files written
+        self._last_flush   = clock()
+
+    @property
+    def pending(self) -> int:
+        return len(self.collector) - self.flushed
+
+    def maybe_flush(self) -> bool:
+        """
+        Flush if enough rows are waiting or enough time has passed
+        """
+        if self.pending == 0:
+            return False
+        if ((self.flush_rows is not None and self.pending >= self.flush_rows) or
+            (self.flush_seconds is not None and self.clock() - self._last_flush >= self.flush_seconds)):
+            return self.flush()
+        return False
+
+    def flush(self) -> bool:
+        """
+        Write the rows collected since the last flush
+        """
+        self._last_flush = self.clock()
+        if self.pending == 0:
+            return False
+        
+        df = self.collector.rows(self.flushed)
+        if self.format == 'csv':
+            first = self.flushed == 0
+            with open(self.file_name, 'w' if first else 'a', newline='') as f:
+                df.to_csv(f, sep=',', header=first)
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            os.makedirs(self.file_name, exist_ok=True)
+            if self.parts == 0:
+                # Start afresh, as the csv file is truncated
+                for name in os.listdir(self.file_name):
+                    if name.startswith('part-') and name.endswith('.parquet'):
+                        os.remove(os.path.join(self.file_name, name))
+            df.to_parquet(os.path.join(self.file_name, f'part-{self.parts:05d}.parquet'))
+            self.parts += 1
+        
+        self.flushed += len(df)
+        return True
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 14:05:22 2026
+
+@author: andre
+"""
+
+import numpy as np
+
+class Field:
+    """
+    Per-agent value held in a column of the agent's Population.
+    Declared on the agent class in place of a plain attribute, so
+    agent.field reads and writes the array element for that agent.
+    """
+
+    __slots__ = ('name', 'dtype', 'default')
+
+    def __init__(self, dtype=np.float64, default=0):
+        self.dtype   = dtype
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, agent, owner=None):
+        if agent is None:
+            return self
+        return agent.population.columns[self.name][agent.population_slot].item()
+
+    def __set__(self, agent, value):
+        agent.population.columns[self.name][agent.population_slot] = value
+
+
+class OptionalField(Field):
+    """
+    Integer field where None is held as -1, e.g. an account number
+    """
+
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__(np.int64, -1)
+
+    def __get__(self, agent, owner=None):
+        if agent is None:
+            return self
+        value = agent.population.columns[self.name][agent.population_slot]
+        return None if value < 0 else int(value)
+
+    def __set__(self, agent, value):
+        agent.population.columns[self.name][agent.population_slot] = -1 if value is None else value
+
+
+class MemberField(Field):
+    """
+    Reference to a member of another population, held as that member's slot.
+    population names the model attribute holding the other population.
+    """
+
+    __slots__ = ('population',)
+
+    def __init__(self, population):
+        super().__init__(np.int64, -1)
+        self.population = population
+
+    def __get__(self, agent, owner=None):
+        if agent is None:
+            return self
+        slot = agent.population.columns[self.name][agent.population_slot]
+        return None if slot < 0 else getattr(agent.model, self.population).agents[slot]
+
+    def __set__(self, agent, value):
+        agent.population.columns[self.name][agent.population_slot] = -1 if value is None else value.population_slot
+
+
+class Population:
+    """
+    Struct-of-arrays store for one class of agent.
+    Every Field declared on the class is a NumPy column indexed by the
+    agent's population slot, so the state of the whole population can be
+    read and updated with array operations. Columns grow geometrically
+    as agents join.
+    """
+
+    __slots__ = ('fields', 'columns', 'agents')
+
+    def __init__(self, agent_class, capacity=64):
+        self.fields = {}
+        for klass in reversed(agent_class.__mro__):
+            self.fields.update({name: field for name, field in vars(klass).items() if isinstance(field, Field)})
+        self.columns = {name: np.full(max(capacity, 1), field.default, dtype=field.dtype)
+                        for name, field in self.fields.items()}
+        self.agents  = []
+
+    def __len__(self):
+        return len(self.agents)
+
+    def __getitem__(self, name):
+        """
+        View of a column over the current members
+        """
+        return self.columns[name][:len(self.agents)]
+
+    @property
+    def capacity(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def add(self, agent) -> int:
+        """
+        Give the agent the next slot and return it
+        """
+        slot = len(self.agents)
+        if slot >= self.capacity:
+            self._grow(2 * self.capacity)
+        self.agents.append(agent)
+        return slot
+
+    def _grow(self, capacity):
+        for name, field in self.fields.items():
+            column = np.full(capacity, field.default, dtype=field.dtype)
+            column[:len(self.agents)] = self.columns[name][:len(self.agents)]
+            self.columns[name] = column
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:41:26 2026
+
+@author: andre
+"""
+
+import json
+import time
+import pandas as pd
+
+class StepProfiler:
+    """
+    Wall time per named phase of Scheduler.step.
+
+    For every phase run the profiler records the step, the elapsed time,
+    how many times the phase ran within the step and the number of live
+    records in each ledger once it finished. Attach one with
+    Model(profile=True) or by setting model.profiler; when model.profiler
+    is None the scheduler calls the phases directly and nothing is recorded.
+    """
+
+    __slots__ = ('model', 'clock', '_records')
+
+    ledgers = ('deposit_ledger', 'loan_ledger', 'bond_ledger')
+    columns = ['step', 'phase', 'seconds', 'calls'] + [f'{name}_rows' for name in ledgers]
+
+    def __init__(self, model, clock=time.perf_counter):
+        self.model    = model
+        self.clock    = clock
+        self._records = {}   # (step, phase) -> [seconds, calls, ledger rows...]
+
+    def run(self, phase, step, func, *args):
+        """
+        Call func(*args) as the named phase of the step
+        """
+        started = self.clock()
+        result  = func(*args)
+        elapsed = self.clock() - started
+
+        record = self._records.get((step, phase))
+        if record is None:
+            record = self._records[(step, phase)] = [0.0, 0]
+        record[0] += elapsed
+        record[1] += 1
+        record[2:] = [len(getattr(self.model, name)) for name in self.ledgers]
+        return result
+
+    def reset(self) -> None:
+        self._records.clear()
+
+    @property
+    def records(self):
+        return [[step, phase] + values for (step, phase), values in self._records.items()]
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """
+        One row per step and phase
+        """
+        return pd.DataFrame(self.records, columns=self.columns).set_index(['step', 'phase'])
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Totals by phase, slowest first
+        """
+        df = self.df.groupby(level='phase', sort=False).agg(seconds=('seconds', 'sum'),
+                                                             calls=('calls', 'sum'),
+                                                             steps=('calls', 'size'))
+        df['mean_seconds'] = df.seconds / df.steps
+        df['share']        = df.seconds / df.seconds.sum() if len(df) else df.seconds
+        return df.sort_values('seconds', ascending=False)
+
+    def to_json(self, file_name=None):
+        """
+        Records as a JSON list of objects, written to file_name if given
+        """
+        data = [dict(zip(self.columns, record)) for record in self.records]
+        if file_name is None:
+            return json.dumps(data)
+        with open(file_name, 'w') as f:
+            json.dump(data, f)
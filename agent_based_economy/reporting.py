@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:02:27 2026
+
+@author: andre
+"""
+
+import functools
+import numpy as np
+from agent_based_economy.distribution import Distribution
+
+def population_balances(model, population) -> np.ndarray:
+    """
+    Deposit balances of a population, zero for those without an account
+    """
+    accounts = population['deposit_account_number']
+    balances = np.zeros(len(accounts))
+    has_account = accounts >= 0
+    balances[has_account] = model.deposit_ledger.current_balances(accounts[has_account])
+    return balances
+
+
+def population_wages(model, population) -> np.ndarray:
+    """
+    Monthly wage of each member - the employer's wage rate for households,
+    zero for those out of work, or a firm's own wage rate
+    """
+    if 'employer' not in population.columns:
+        return population['wage_rate'].astype(np.float64)
+    employers = population['employer']
+    wages = np.zeros(len(employers))
+    employed = employers >= 0
+    wages[employed] = model.firm_population['wage_rate'][employers[employed]]
+    return wages
+
+
+class Fields:
+    """
+    Agent fields gathered once per collection and shared by the reporters.
+
+    A field is named '<group>.<name>', the group being households or firms.
+    The name is a population column, a derived field such as
+    deposit_balance, or else an attribute of each agent - methods are
+    called - gathered into an array in population order. Arrays are
+    gathered on first use and must not be modified by reporters. 
+    distribution gives a field's sorted Distribution, also made once.
+    """
+
+    __slots__ = ('model', '_arrays', '_distributions')
+
+    groups  = {'households': 'household_population',
+               'firms':      'firm_population'}
+    derived = {'deposit_balance': population_balances,
+               'wage':            population_wages}
+
+    def __init__(self, model):
+        self.model   = model
+        self._arrays = {}
+        self._distributions = {}
+
+    def __getitem__(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            array = self._arrays[name] = self.gather(name)
+        return array
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    def gather(self, name) -> np.ndarray:
+        group, field = name.split('.', 1)
+        if group not in self.groups:
+            raise KeyError(f'Unknown field group {group} in {name}, expected one of {list(self.groups)}')
+        population = getattr(self.model, self.groups[group])
+
+        if field in self.derived:
+            return self.derived[field](self.model, population)
+        if field in population.columns:
+            return population[field]
+        values = [getattr(agent, field) for agent in population.agents]
+        if values and callable(values[0]):
+            values = [value() for value in values]
+        return np.array(values)
+
+    def distribution(self, name) -> Distribution:
+        distribution = self._distributions.get(name)
+        if distribution is None:
+            distribution = self._distributions[name] = Distribution(self[name])
+        return distribution
+
+    def prefetch(self, names) -> None:
+        for name in names:
+            self[name]
+
+
+def reporter(*fields):
+    """
+    Declare the agent fields a reporter reads. The reporter is called as
+    func(model, data) with data a Fields, shared by every reporter in a
+    DataCollector collection, and can still be called with the model alone.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(model, data=None):
+            return func(model, Fields(model) if data is None else data)
+        wrapper.fields = fields
+        return wrapper
+    return decorate
+
+
+class DistributionReporter:
+    """
+    Reporter of a Distribution statistic of a field, e.g.
+    DistributionReporter('households.deposit_balance', 'top_share', 0.1).
+    Reporters of the same field share one sort. A class rather than a
+    closure so that a model holding one can be pickled.
+    """
+
+    __slots__ = ('field', 'statistic', 'args', 'fields', '__name__')
+
+    def __init__(self, field, statistic, *args):
+        self.field     = field
+        self.statistic = statistic
+        self.args      = args
+        self.fields    = (field,)
+        self.__name__  = f"{statistic}_of_{field.replace('.', '_')}"
+
+    def __call__(self, model, data=None):
+        data = Fields(model) if data is None else data
+        return getattr(data.distribution(self.field), self.statistic)(*self.args)
+
+    def __getstate__(self):
+        return (self.field, self.statistic, self.args)
+
+    def __setstate__(self, state):
+        self.__init__(state[0], state[1], *state[2])
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.field!r}, {self.statistic!r}{"".join(", " + repr(x) for x in self.args)})'
+
+
+def distribution_reporter(field, statistic, *args) -> DistributionReporter:
+    """
+    Reporter of a Distribution statistic of a field, see DistributionReporter
+    """
+    return DistributionReporter(field, statistic, *args)
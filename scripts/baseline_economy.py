@@ -12,6 +12,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import agent_based_economy
 from agent_based_economy.model import Model
+from agent_based_economy.reporting import reporter
 from agent_based_economy.agents.firm import Firm
 from agent_based_economy.agents.household import Household
 from agent_based_economy.animate import TimeseriesAnimation
@@ -25,44 +26,57 @@ plt.ion()
 
 #%%
 
-def household_planned_consumption_units(model):
-    return np.sum([h.planned_consumption for h in model.households])
+@reporter('households.planned_consumption')
+def household_planned_consumption_units(model, data):
+    return data['households.planned_consumption'].sum()
 
-def household_planned_consumption_cost(model):
-    return np.sum([h.planned_consumption*h.average_goods_price/1000 for h in model.households])
+@reporter('households.planned_consumption', 'households.average_goods_price')
+def household_planned_consumption_cost(model, data):
+    return np.sum(data['households.planned_consumption']*data['households.average_goods_price']/1000)
 
-def current_demand_units(model):
-    return np.sum([f.current_demand for f in model.firms])
+@reporter('firms.current_demand')
+def current_demand_units(model, data):
+    return data['firms.current_demand'].sum()
 
-def current_demand_cost(model):
-    return np.sum([f.current_demand*f.goods_price/1000 for f in model.firms])
+@reporter('firms.current_demand', 'firms.goods_price')
+def current_demand_cost(model, data):
+    return np.sum(data['firms.current_demand']*data['firms.goods_price']/1000)
 
-def mean_months_since_hire_failure(model):
-    return np.mean([f.months_since_hire_failure for f in model.firms])
+@reporter('firms.months_since_hire_failure')
+def mean_months_since_hire_failure(model, data):
+    return data['firms.months_since_hire_failure'].mean()
 
-def has_lowered_wage(model):
-    return np.sum([f.lowered_wage for f in model.firms])
+@reporter('firms.lowered_wage')
+def has_lowered_wage(model, data):
+    return data['firms.lowered_wage'].sum()
 
-def has_raised_wage(model):
-    return np.sum([f.raised_wage for f in model.firms])
+@reporter('firms.raised_wage')
+def has_raised_wage(model, data):
+    return data['firms.raised_wage'].sum()
 
-def has_lowered_goods_price(model):
-    return np.sum([f.lowered_goods_price for f in model.firms])
+@reporter('firms.lowered_goods_price')
+def has_lowered_goods_price(model, data):
+    return data['firms.lowered_goods_price'].sum()
 
-def has_raised_goods_price(model):
-    return np.sum([f.raised_goods_price for f in model.firms])
+@reporter('firms.raised_goods_price')
+def has_raised_goods_price(model, data):
+    return data['firms.raised_goods_price'].sum()
 
-def has_inventories_too_low(model):
-    return np.sum([f.inventories_too_low for f in model.firms])
+@reporter('firms.inventories_too_low')
+def has_inventories_too_low(model, data):
+    return data['firms.inventories_too_low'].sum()
 
-def has_inventories_too_high(model):
-    return np.sum([f.inventories_too_high for f in model.firms])
+@reporter('firms.inventories_too_high')
+def has_inventories_too_high(model, data):
+    return data['firms.inventories_too_high'].sum()
 
-def is_unhappy_at_work(model):
-    return np.sum([h.is_unhappy_at_work() for h in model.households])
+@reporter('households.is_unhappy_at_work')
+def is_unhappy_at_work(model, data):
+    return data['households.is_unhappy_at_work'].sum()
 
-def total_profit(model):
-    return np.sum([f.profit for f in model.firms])
+@reporter('firms.profit')
+def total_profit(model, data):
+    return data['firms.profit'].sum()
 
 #%%
 
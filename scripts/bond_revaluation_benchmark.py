@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 12:20:44 2026
+
+@author: andre
+
+Cost of the daily bond revaluation against the number of bonds outstanding.
+Bonds are issued across a handful of series and spread over many holders,
+then revalued as the day moves on. Times are given for pricing every record,
+as revaluation did before, for pricing once per series, and for a repeated
+call on the same day, which is skipped. Audit mode holds a record per bond;
+position mode a record per holder of each series.
+
+Usage: python scripts/bond_revaluation_benchmark.py [bond counts...]
+"""
+
+#%%
+
+import sys
+import time
+import numpy as np
+from agent_based_economy.model import Model
+from agent_based_economy.ledgers import BondLedger
+from agent_based_economy.agents.individual import Individual
+
+#%%
+
+def bond_book(num_bonds, audit, num_holders=200, maturities=(1, 2, 5, 10, 30)):
+    model  = Model(num_households=0, num_firms=0, num_banks=1, real=False)
+    ledger = model.bond_ledger = BondLedger(model, audit=audit)
+    holders = [Individual(model) for i in range(num_holders)]
+    per_series = num_bonds // len(maturities)
+    per_holder = per_series // num_holders
+    for years in maturities:
+        ids = ledger.create_bulk_value(model.government, 100*per_series, 2, years)
+        for i, holder in enumerate(holders):
+            if audit:
+                for idx in ids[i*per_holder:(i+1)*per_holder]:
+                    ledger.transfer(idx, holder)
+            else:
+                ledger.transfer(ids[0], holder, per_holder)
+    return model, ledger
+
+def row_by_row(ledger):
+    '''
+    The previous revaluation, pricing every record
+    '''
+    model = ledger.model
+    rows  = ledger._live_rows()
+    data  = {col: ledger._data[col][rows] for col in ['maturity_date', 'maturity_days', 'interest_rate', 'value']}
+    
+    days_to_maturity = data['maturity_date'] - model.schedule.day
+    number_of_outstanding_coupon_payments = np.ceil(days_to_maturity/ledger.coupon_interval_days)
+    next_coupon_date = data['maturity_date'] - (number_of_outstanding_coupon_payments-1)*ledger.coupon_interval_days
+    
+    is_short_term = data['maturity_days'] < model.schedule.days_in_year
+    number_of_outstanding_coupon_payments[is_short_term] = 0
+    next_coupon_date[is_short_term] = np.nan
+    
+    ledger._data['days_to_maturity'][rows] = days_to_maturity
+    ledger._data['number_of_outstanding_coupon_payments'][rows] = number_of_outstanding_coupon_payments
+    ledger._data['next_coupon_date'][rows] = next_coupon_date
+    ledger._data['mark_to_market_value'][rows] = model.bond_exchange.yield_to_price(
+                                                    model.schedule.day,
+                                                    data['maturity_date'],
+                                                    model.central_bank.deposit_interest_rate, 
+                                                    data['interest_rate'],
+                                                    bond_face_value=data['value'], 
+                                                    coupon_frequency=ledger.annual_coupon_frequency, 
+                                                    days_in_year=model.schedule.days_in_year)
+    ledger._data['hold_to_maturity_value'][rows] = data['value'] + data['value'] * ((data['interest_rate'] / 100) / ledger.annual_coupon_frequency) * number_of_outstanding_coupon_payments
+
+def seconds_per_call(func, repeats=20):
+    started = time.perf_counter()
+    for i in range(repeats):
+        func()
+    return (time.perf_counter() - started) / repeats
+
+def timings(num_bonds, audit):
+    model, ledger = bond_book(num_bonds, audit)
+    
+    def next_day():
+        model.schedule.steps += 1
+        ledger.recalculate()
+        
+    return (len(ledger), 
+            seconds_per_call(lambda: row_by_row(ledger)),
+            seconds_per_call(next_day),
+            seconds_per_call(ledger.recalculate))
+
+#%%
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10_000, 100_000, 500_000]
+
+    print(f"{'bonds':>9} {'mode':>9} {'records':>9} {'per row ms':>11} {'series ms':>10} {'same day ms':>12}")
+    for n in sizes:
+        for audit in [True, False]:
+            records, per_row, per_series, same_day = timings(n, audit)
+            print(f"{n:>9,} {'audit' if audit else 'position':>9} {records:>9,} "
+                  f"{1000*per_row:>11.2f} {1000*per_series:>10.2f} {1000*same_day:>12.4f}")
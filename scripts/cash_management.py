@@ -161,7 +161,8 @@ For 4 years this increases to 10.8%
 
 bond_issues = model.bond_exchange.list_bond_issues()
 print(bond_issues)
-model.bond_exchange(*bond_issues[1]).market_price
-# we need to clean out the earlier one as its lapsed
+model.bond_exchange(*bond_issues[-1]).market_price
+# lapsed issues are retired at maturity, their last prices are archived
+print(model.bond_exchange.archive_df.groupby(['maturity_date', 'coupon_rate']).price.last())
 
 #%%
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:32:10 2026
+
+@author: andre
+
+Bytes per household for the slotted, population backed Household against
+the previous layout, where every instance carried a __dict__ holding its
+scalar state and its own balance sheet key lists. The previous layout is
+reproduced by shadowing those attributes with plain class attributes in a
+subclass without __slots__.
+
+Usage: python scripts/household_memory_benchmark.py [sizes...]
+"""
+
+#%%
+
+import gc
+import sys
+import time
+import tracemalloc
+from agent_based_economy.model import Model
+from agent_based_economy.agents.household import Household
+from agent_based_economy.population import Population
+
+legacy_attributes = list(Population(Household).fields) + ['asset_keys', 'liability_keys']
+LegacyHousehold = type('LegacyHousehold', (Household,), {name: None for name in legacy_attributes})
+
+#%%
+
+def bytes_per_household(household_class, num_households, num_firms=50):
+    '''
+    Memory allocated creating the households, including their population 
+    columns. The legacy class keeps its state in __dict__ and gets an 
+    empty population.
+    '''
+    model = Model(num_households=0, num_firms=num_firms)
+    stored_class = Household if household_class is Household else object
+
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    model.household_population = Population(stored_class, capacity=num_households)
+    model.households = [household_class(model) for i in range(num_households)]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    return used / num_households
+
+#%%
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+
+    print(f"{'households':>12} {'before':>10} {'after':>10} {'saving':>8} {'seconds':>8}")
+    for n in sizes:
+        started = time.time()
+        before  = bytes_per_household(LegacyHousehold, n)
+        after   = bytes_per_household(Household, n)
+        print(f'{n:>12,} {before:>10.0f} {after:>10.0f} {1 - after/before:>8.0%} {time.time() - started:>8.1f}')
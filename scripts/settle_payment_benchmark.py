@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:05:37 2026
+
+@author: andre
+
+settle_payment throughput with the cached role flags against the previous
+properties, which rebuilt the list of MRO class names on every access. The
+previous behaviour is restored for the comparison by putting the old
+properties back on every class in the agent hierarchy.
+
+Usage: python scripts/settle_payment_benchmark.py [payments]
+"""
+
+#%%
+
+import sys
+import time
+import random
+from contextlib import contextmanager
+from agent_based_economy.model import Model
+from agent_based_economy.agents.agent import Agent
+
+#%%
+
+def agent_classes(cls=Agent):
+    yield cls
+    for subclass in cls.__subclasses__():
+        yield from agent_classes(subclass)
+
+@contextmanager
+def scanning_role_flags():
+    saved = {cls: {flag: vars(cls)[flag] for flag in Agent.role_flags} for cls in agent_classes()}
+    for cls in saved:
+        for flag, role in Agent.role_flags.items():
+            setattr(cls, flag, property(lambda self, role=role: role in self.superclasses()))
+    try:
+        yield
+    finally:
+        for cls, flags in saved.items():
+            for flag, value in flags.items():
+                setattr(cls, flag, value)
+
+def payments_per_second(num_payments, num_households=1000, num_banks=3):
+    '''
+    Random payments of 1 between households spread over the commercial 
+    banks, so most of them settle across banks
+    '''
+    random.seed(0)
+    model = Model(num_households=num_households, num_firms=1, num_banks=num_banks)
+    model.randomly_allocate_banks(model.households)
+    model.government_helicopter_drop(model.households, num_payments)
+    pairs = [random.sample(model.households, 2) for i in range(num_payments)]
+
+    started = time.perf_counter()
+    for payer, payee in pairs:
+        payer.bank.settle_payment(payer.deposit_account_number, payee.deposit_account_number, 1)
+    return num_payments / (time.perf_counter() - started)
+
+#%%
+
+if __name__ == '__main__':
+    num_payments = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    with scanning_role_flags():
+        before = payments_per_second(num_payments)
+    after = payments_per_second(num_payments)
+    print(f"{'payments':>10} {'before/s':>10} {'after/s':>10} {'speedup':>8}")
+    print(f'{num_payments:>10,} {before:>10,.0f} {after:>10,.0f} {after/before:>8.2f}')
@@ -13,6 +13,8 @@ from agent_based_economy.model import Model
 from agent_based_economy.agents.agent import Agent
 from agent_based_economy.agents.individual import Individual
 from agent_based_economy.agents.firm  import Firm
+from agent_based_economy.agents.household import Household
+from agent_based_economy.population import Field
 from agent_based_economy.agents.banks import CommercialBank, CentralBank, Bank
 from agent_based_economy.agents.government import Government
 
@@ -129,4 +131,26 @@ def test_government_introspective_properties():
     
     
     
-    
\ No newline at end of file
+    
+def test_agents_have_no_instance_dict():
+    model = Model(num_households=3, num_firms=2, num_banks=2)
+    model.randomly_allocate_banks(model.households)
+    agents = list(model.agents.values()) + [Agent(model), Individual(model), Bank(model)]
+    assert len({type(agent) for agent in agents}) == 9
+    for agent in agents:
+        assert not hasattr(agent, '__dict__'), type(agent).__name__
+
+def test_population_fields_are_not_slots():
+    for cls in [Household, Firm]:
+        fields = {name for klass in cls.__mro__ for name, value in vars(klass).items() if isinstance(value, Field)}
+        slots  = {name for klass in cls.__mro__ for name in getattr(klass, '__slots__', ())}
+        assert not fields & slots, cls.__name__
+    assert Household.is_individual and Individual.is_individual
+
+def test_role_flags_are_class_attributes():
+    for cls in [Agent, Individual, Firm, Government, Bank, CentralBank, CommercialBank]:
+        names = [x.__name__ for x in cls.__mro__]
+        for flag, role in Agent.role_flags.items():
+            assert getattr(cls, flag) is (role in names), (cls.__name__, flag)
+    assert Individual.lends and Bank.lends and not Firm.lends
+    assert CommercialBank.borrows and CentralBank.issues_deposits
@@ -12,9 +12,11 @@ import numpy as np
 import re
 from agent_based_economy.ledgers import Ledger, BondLedger
 from agent_based_economy.model import Model
+from agent_based_economy.markets import BondExchange
 from agent_based_economy.agents.agent import Agent
 from agent_based_economy.agents.individual import Individual
 from agent_based_economy.agents.government import Government
+from agent_based_economy.agents.banks import CentralBank
    
 def test_basic_properties():    
     model = Model()
@@ -44,7 +46,7 @@ def test_bond_ledger_create():
     model = Model()
     government = Government(model)
     
-    ledger = BondLedger(model)
+    ledger = BondLedger(model, audit=True)
     assert len(ledger) == 0
     
     reference_number = ledger.create(government, 2, 1)
@@ -63,7 +65,7 @@ def test_bond_ledger_drop():
     model = Model()
     government = Government(model)
     
-    ledger = BondLedger(model)
+    ledger = BondLedger(model, audit=True)
     
     ledger.create(government, 2, 1)
     ledger.create(government, 2, 1)
@@ -80,7 +82,7 @@ def test_bond_ledger_drop_invalid_index():
     model = Model()
     government = Government(model)
     
-    ledger = BondLedger(model)
+    ledger = BondLedger(model, audit=True)
     
     ledger.create(government, 2, 1)
     ledger.create(government, 2, 1)
@@ -97,7 +99,7 @@ def test_bond_ledger_close():
     model = Model()
     government = Government(model)
     
-    ledger = BondLedger(model)
+    ledger = BondLedger(model, audit=True)
     
     ledger.create(government, 2, 1)
     ledger.create(government, 2, 1)
@@ -114,7 +116,7 @@ def test_bond_ledger_close_invalid_index():
     model = Model()
     government = Government(model)
     
-    ledger = BondLedger(model)
+    ledger = BondLedger(model, audit=True)
     
     ledger.create(government, 2, 1)
     ledger.create(government, 2, 1)
@@ -131,7 +133,7 @@ def test_bond_ledger_close_non_self_owned():
     model = Model()
     government = Government(model)
     
-    ledger = BondLedger(model)
+    ledger = BondLedger(model, audit=True)
     
     ledger.create(government, 2, 1)
     ledger.create(government, 2, 1)
@@ -409,7 +411,7 @@ def test_bulk_create():
     model = Model()
     government = model.government
     
-    ledger = BondLedger(model)    
+    ledger = BondLedger(model, audit=True)    
     
     assert len(ledger) == 0
     reference_numbers = ledger.create_bulk_value(government, 1000, 2, 1)
@@ -458,6 +460,10 @@ def test_transfer_ownership():
     assert record_2.holder == neil
     assert record_3.holder == rich
     
+    assert list(ledger.indexes_by_holder(andy)) == [reference_number_1]
+    assert list(ledger.indexes_by_holder(government)) == []
+    assert list(ledger.indexes_by_issuer_and_holder(government, rich)) == [reference_number_3]
+    
 def test_cant_transfer_ownership_to_eixsting_holder():       
     model = Model()
     government = model.government
@@ -818,20 +824,285 @@ def test_short_term_bond_hold_to_maturity_value_larger_time_shift():
     assert record_2['hold_to_maturity_value'] == 100 
     assert record_3['hold_to_maturity_value'] == 100 
 
+def test_maturity_calendar():
+    model = Model()
+    government = model.government
+    
+    ledger = BondLedger(model, audit=True)
+    bill   = ledger.create(government, 0, 1/12)
+    bond_1 = ledger.create(government, 2, 1)
+    bulk   = ledger.create_bulk_value(government, 300, 2, 2)
+    
+    assert ledger.bonds_maturing(21).tolist() == [bill]
+    assert ledger.bonds_maturing(252).tolist() == [bond_1]
+    assert ledger.bonds_maturing(504).tolist() == bulk
+    assert len(ledger.bonds_maturing(100)) == 0
+    
+    ledger.close(bulk[1])
+    assert ledger.bonds_maturing(504).tolist() == [bulk[0], bulk[2]]
+    
+    with pytest.raises(ValueError):
+        ledger.drop_many([bulk[0], 999])
+    assert ledger.bonds_maturing(504).tolist() == [bulk[0], bulk[2]]
+    assert ledger.coupons.day_of(bulk[0]) is not None
+    
+def test_coupon_calendar():
+    model = Model()
+    government = model.government
+    
+    ledger = BondLedger(model, audit=True)
+    bill = ledger.create(government, 0, 1/4)
+    bond = ledger.create(government, 2, 1)
+    assert len(ledger.coupons_due(0)) == 0     # issue date
+    assert ledger.coupons_due(126).tolist() == [bond]
+    assert ledger.coupons.day_of(bill) is None
+    
+    # Issued on a coupon day before and after that day's coupons are paid
+    model.schedule.steps = 126
+    before = ledger.create(government, 2, 1)
+    ledger.roll_coupons()
+    after  = ledger.create(government, 2, 1)
+    assert len(ledger.coupons_due(126)) == 0
+    assert ledger.coupons_due(252).tolist() == [bond, before, after]
+    
+    ledger.roll_coupons(252)
+    assert len(ledger.coupons) == 0
+    
+    ledger.create(government, 2, 5)
+    ledger.drop(ledger.counter - 1)
+    assert len(ledger.coupons) == 0
+
+def test_positions_merge_and_split():
+    model = Model()
+    government = model.government
+    neil  = Individual(model)
+    andy  = Individual(model)
+    
+    ledger = BondLedger(model)
+    [position] = ledger.create_bulk_value(government, 1000, 2, 1)
+    assert ledger.create(government, 2, 1) == position
+    assert ledger.quantity(position) == 11
+    assert len(ledger) == 1
+    
+    andys = ledger.transfer(position, andy, 4)
+    assert ledger.transfer(position, andy, 3) == andys
+    assert [ledger.quantity(position), ledger.quantity(andys)] == [4, 7]
+    assert ledger.position(ledger.get(andys).series, andy) == andys
+    
+    assert ledger.transfer(andys, neil) == andys
+    assert ledger.holder(andys) == neil
+    assert ledger.position(0, andy) is None
+    
+    with pytest.raises(ValueError):
+        ledger.transfer(position, andy, 5)
+    
+    ledger.close(position, 1)
+    assert ledger.quantity(position) == 3
+    assert ledger.transfer(andys, government) == position
+    assert ledger.quantity(position) == 10
+    assert not ledger.account_exists(andys)
+    assert ledger.close(position)
+    assert len(ledger) == 0
+    
+@pytest.mark.parametrize('audit', [False, True])
+def test_holdings_by_terms(audit):
+    model = Model()
+    government = model.government
+    neil  = Individual(model)
+    andy  = Individual(model)
+    
+    ledger = BondLedger(model, audit=audit)
+    first  = ledger.create_bulk_value(government, 300, 2, 1)
+    other  = ledger.create_bulk_value(government, 300, 3, 1)
+    # Same terms, another issuer's series
+    second = ledger.create_bulk_value(andy, 300, 2, 1)
+    assert ledger.transfer_many(second, [government]*len(second)) == second
+    maturity_date = ledger.get(first[0]).maturity_date
+    
+    held = ledger.holdings(government, maturity_date, 2)
+    assert held.tolist() == sorted(first + second)
+    assert ledger.quantities(held).sum() == 6
+    
+    targets = ledger.transfer_many(held[:2], [neil, andy], [1, 1])
+    assert ledger.holdings(neil, maturity_date, 2).tolist() == targets[:1]
+    assert ledger.quantities(ledger.holdings(government, maturity_date, 2)).sum() == 4
+    assert ledger.holdings(andy, maturity_date, 3).tolist() == []
+    assert len(ledger.series) == 3
+    
+    ledger.drop_many(ledger.holdings(government, maturity_date, 2))
+    assert len(ledger.holdings(government, maturity_date, 2)) == 0
+    assert ledger.holdings(government, maturity_date, 3).tolist() == other
+
+def test_transfer_many_moves_whole_records_together():
+    model = Model()
+    government = model.government
+    neil  = Individual(model)
+    andy  = Individual(model)
+    
+    ledger = BondLedger(model, audit=True)
+    bonds = ledger.create_bulk_value(government, 500, 2, 1)
+    assert ledger.transfer_many(bonds[:3], [neil, andy, neil]) == bonds[:3]
+    assert ledger.indexes_by_holder(neil).tolist() == [bonds[0], bonds[2]]
+    assert ledger.holder(bonds[1]) == andy
+    
+    with pytest.raises(ValueError):
+        ledger.transfer_many(bonds[:2], [neil, andy])
+    with pytest.raises(ValueError):
+        ledger.transfer_many(bonds[3:], [neil, andy], [1, 2])
+    
+    # Positions of the same series still merge when not auditing
+    ledger = BondLedger(model)
+    [position] = ledger.create_bulk_value(government, 500, 2, 1)
+    neils = ledger.transfer(position, neil, 1)
+    targets = ledger.transfer_many([position, position], [neil, andy], [2, 1])
+    assert targets[0] == neils
+    assert [ledger.quantity(x) for x in [position] + targets] == [1, 3, 1]
+    assert ledger.transfer_many([neils], [andy]) == [targets[1]]
+    assert ledger.quantity(targets[1]) == 4
+    
+def test_failed_bond_sale_is_not_paid_for():
+    model = Model(num_banks=1, real=False)
+    government, bank = model.government, model.banks[0]
+    government.pay(bank.deposit_account_number, 10000)
+    [position] = model.bond_ledger.create_bulk_value(government, 500, 2, 1)
+    balances = [government.deposit_balance, bank.deposit_balance]
+    
+    with pytest.raises(ValueError):
+        government.sell_bond(bank, 99, position, 0)
+    with pytest.raises(ValueError):
+        government.sell_bond(bank, 99, position, 6)
+    with pytest.raises(ValueError):
+        government.sell_bonds(government, 99, [position])
+    assert [government.deposit_balance, bank.deposit_balance] == balances
+    assert model.bond_ledger.quantity(position) == 5
+    
+    government.sell_bond(bank, 99, position, 2)
+    assert [government.deposit_balance, bank.deposit_balance] == [balances[0] + 198, balances[1] - 198]
+    
+def test_series_are_keyed_by_terms():
+    model = Model()
+    government = model.government
+    
+    ledger = BondLedger(model)
+    first  = ledger.create(government, 2, 1)
+    second = ledger.create(government, 3, 1)
+    model.schedule.steps = 252
+    third  = ledger.create(government, 2, 1)
+    assert [ledger.get(x).series for x in [first, second, third]] == [0, 1, 2]
+    assert len(ledger.series) == 3
+    
+def bond_sale_and_redemption(audit):
+    model = Model(num_banks=2, real=False, audit_bonds=audit)
+    government = model.government
+    bank = model.banks[0]
+    government.pay(bank.deposit_account_number, 10000)
+    
+    bonds = government.create_bonds(5000, 2, 1)
+    maturity_date = model.bond_ledger.get(bonds[0]).maturity_date
+    government.offer_bonds(maturity_date, 2, 5000, 98)
+    model.bond_exchange(maturity_date, 2).register_interest(bank, 3000, 99)
+    model.bond_exchange(maturity_date, 2).clear_market()
+    held = bank.balance_sheet().assets
+    
+    for i in range(253):
+        model.step()
+    return held, bank.deposit_balance, government.deposit_balance, len(model.bond_ledger)
+    
+def test_positions_and_audit_records_agree():
+    audit_held, *audit_balances, audit_records = bond_sale_and_redemption(True)
+    held, *balances, records = bond_sale_and_redemption(False)
+    assert held == audit_held
+    assert balances == pytest.approx(audit_balances)
+    assert audit_records == records == 0
+
+def test_recalculate_values_each_series_once():
+    model = Model()
+    government = model.government
+    
+    ledger = BondLedger(model, audit=True)
+    ledger.create_bulk_value(government, 300, 2, 1)
+    ledger.create_bulk_value(government, 200, 5, 3)
+    ledger.create_bulk_value(government, 200, 0, 1/4)
+    model.schedule.steps = 30
+    model.central_bank.target_interest_rate = 4
+    ledger.recalculate()
+    
+    df = ledger.df
+    expected = BondExchange.yield_to_price(30, df.maturity_date.values, model.central_bank.deposit_interest_rate, 
+                                           df.interest_rate.values, days_in_year=252)
+    assert df.mark_to_market_value.values == pytest.approx(expected)
+    assert df.days_to_maturity.tolist() == [222]*3 + [726]*2 + [33]*2
+    
+    # Unchanged inputs are not revalued unless forced
+    ledger._data['mark_to_market_value'][:] = 0
+    ledger._modified()
+    ledger.recalculate()
+    assert ledger.df.mark_to_market_value.sum() == 0
+    ledger.recalculate(force=True)
+    assert ledger.df.mark_to_market_value.values == pytest.approx(expected)
+
+def test_coupons_paid_once_per_holder(monkeypatch):
+    model = Model(num_households=0, num_firms=0, num_banks=5, real=False, audit_bonds=True)
+    government = model.government
+    ledger = model.bond_ledger
+    
+    ids = ledger.create_bulk_value(government, 1_000_000, 2, 1)
+    for i, bank in enumerate(model.banks):
+        for idx in ids[i*1500:(i+1)*1500]:
+            ledger.transfer(idx, bank)
+    
+    batches = []
+    settle_payments = CentralBank.settle_payments
+    monkeypatch.setattr(CentralBank, 'settle_payments', lambda self, *args: batches.append(args) or settle_payments(self, *args))
+    model.schedule.steps = 126
+    model.schedule.step()
+    
+    assert len(batches) == 1 and len(batches[0][1]) == 5
+    assert [bank.deposit_balance for bank in model.banks] == [1500]*5
+    
+    flows = ledger.coupon_flows
+    assert flows.holder.tolist() == [bank.unique_id for bank in model.banks]
+    assert flows.bonds.tolist() == [1500]*5
+    assert flows.value.sum() == 7500
+    assert (flows.day == 126).all()
+
+def test_maturing_bonds_redeemed_together(monkeypatch):
+    model = Model(num_households=0, num_firms=0, num_banks=3, real=False, audit_bonds=True)
+    government = model.government
+    ledger = model.bond_ledger
+    
+    ids = ledger.create_bulk_value(government, 100_000, 0, 1)
+    ledger.create_bulk_value(government, 1000, 0, 2)
+    for i, bank in enumerate(model.banks):
+        for idx in ids[i*300:(i+1)*300]:
+            ledger.transfer(idx, bank)
+    
+    batches = []
+    settle_payments = CentralBank.settle_payments
+    monkeypatch.setattr(CentralBank, 'settle_payments', lambda self, *args: batches.append(args) or settle_payments(self, *args))
+    model.schedule.steps = 252
+    model.schedule.step()
+    
+    assert len(batches) == 1
+    assert [bank.deposit_balance for bank in model.banks] == [30000]*3
+    assert len(ledger) == 10
+    assert len(ledger.maturities) == 10
+    assert ledger.indexes_by_holder(model.banks[0]).tolist() == []
+
 # def test_retrieve_issuer_by_index():     
-#     ledger = BondLedger(model)    
+#     ledger = BondLedger(model, audit=True)    
 #     acc1 = ledger.create(neil, andy, 100, 1, 240)
     
 #     assert ledger.issuer(acc1) == neil
     
 # def test_retrieve_holder_by_index():     
-#     ledger = BondLedger(model)    
+#     ledger = BondLedger(model, audit=True)    
 #     acc1 = ledger.create(neil, andy, 100, 1, 240)
     
 #     assert ledger.holder(acc1) == andy
     
 # def test_loan_ledger_extend():    
-#     ledger = BondLedger(model)    
+#     ledger = BondLedger(model, audit=True)    
 #     acc1 = ledger.create(neil, andy, 0, 0, 0)
 #     acc2 = ledger.create(andy, rich, 0, 0, 0)
 #     acc3 = ledger.create(rich, andy, 0, 0, 0)
@@ -856,7 +1127,7 @@ def test_short_term_bond_hold_to_maturity_value_larger_time_shift():
     
    
 # def test_loan_ledger_credit_invalid_account():   
-#     ledger = BondLedger(model)    
+#     ledger = BondLedger(model, audit=True)    
 #     acc1 = ledger.create(neil, andy, 0, 0, 0)
 #     acc2 = ledger.create(andy, rich, 0, 0, 0)
 #     acc3 = ledger.create(rich, andy, 0, 0, 0)
@@ -872,7 +1143,7 @@ def test_short_term_bond_hold_to_maturity_value_larger_time_shift():
 #         ledger.extend_loan('andy', 39, 240)
     
 # def test_loan_ledger_writedown():    
-#     ledger = BondLedger(model)    
+#     ledger = BondLedger(model, audit=True)    
 #     acc1 = ledger.create(neil, andy, 100, 1, 240)
 #     acc2 = ledger.create(andy, rich, 50, 1, 240)
 #     acc3 = ledger.create(rich, andy, 20, 1, 240)
@@ -889,7 +1160,7 @@ def test_short_term_bond_hold_to_maturity_value_larger_time_shift():
 
 # def test_loan_ledger_writedown_overdraft():   
 #     # Overdraft constraints to reside on loanIssuer role
-#     ledger = BondLedger(model)    
+#     ledger = BondLedger(model, audit=True)    
 #     acc1 = ledger.create(neil, andy, 100, 1, 240)
 #     acc2 = ledger.create(andy, rich, 50, 1, 240)
 #     acc3 = ledger.create(rich, andy, 20, 1, 240)
@@ -905,7 +1176,7 @@ def test_short_term_bond_hold_to_maturity_value_larger_time_shift():
 #     assert ledger.get(acc3).value == 20
    
 # def test_loan_ledger_extend_invalid_accout():    
-#     ledger = BondLedger(model)    
+#     ledger = BondLedger(model, audit=True)    
 #     acc1 = ledger.create(neil, andy, 100, 1, 240)
 #     acc2 = ledger.create(andy, rich, 50, 1, 240)
 #     acc3 = ledger.create(rich, andy, 20, 1, 240)
@@ -921,7 +1192,7 @@ def test_short_term_bond_hold_to_maturity_value_larger_time_shift():
 #         ledger.extend_loan('andy', 39, 240)
     
 # def test_loan_ledger_apply_interest():       
-#     ledger = BondLedger(model)    
+#     ledger = BondLedger(model, audit=True)    
 #     acc1 = ledger.create(neil, andy, 100, 1, 240, 1)
 #     acc2 = ledger.create(andy, rich,  50, 1, 240, 2)
 #     acc3 = ledger.create(rich, andy,  20, 1, 240, 3)
@@ -937,7 +1208,7 @@ def test_short_term_bond_hold_to_maturity_value_larger_time_shift():
 #     assert ledger.get(acc3).value == 20 * (1 + ((3/100)/240))
         
 # def test_get_records_by_holder():          
-#     ledger = BondLedger(model)    
+#     ledger = BondLedger(model, audit=True)    
 #     acc1 = ledger.create(neil, andy, 100, 1, 240, 1)
 #     acc2 = ledger.create(andy, rich,  50, 1, 240, 2)
 #     acc3 = ledger.create(rich, andy,  20, 1, 240, 3)
@@ -955,7 +1226,7 @@ def test_short_term_bond_hold_to_maturity_value_larger_time_shift():
 #     assert records.value.sum() == 0
     
 # def test_get_records_by_issuer():          
-#     ledger = BondLedger(model)    
+#     ledger = BondLedger(model, audit=True)    
 #     acc1 = ledger.create(neil, andy, 100, 1, 240, 1)
 #     acc2 = ledger.create(neil, rich,  50, 1, 240, 2)
 #     acc3 = ledger.create(rich, andy,  20, 1, 240, 3)
@@ -973,7 +1244,7 @@ def test_short_term_bond_hold_to_maturity_value_larger_time_shift():
 #     assert records.value.sum() == 0
     
 # def test_update_interest_rate_by_lender():
-#     ledger = BondLedger(model)    
+#     ledger = BondLedger(model, audit=True)    
 #     acc1 = ledger.create(neil, andy, 100, 1, 240, 1)
 #     acc2 = ledger.create(neil, rich,  50, 1, 240, 2)
 #     acc3 = ledger.create(rich, andy,  20, 1, 240, 3)
@@ -115,6 +115,101 @@ def test_transfer_deposit_between_banks():
     assert barclays.deposit_balance == 76
     assert natwest.deposit_balance == 24
 
+def test_pay_many_across_banks():
+    model = Model(num_banks=2, num_households=3, num_firms=10)
+    barclays = model.banks[0]
+    natwest  = model.banks[1]
+    firm = model.firms[0]
+    neil, andy, rich = model.households
+    barclays.open_deposit_account(firm)
+    barclays.credit(firm.deposit_account_number, 100)
+    barclays.open_deposit_account(neil)
+    natwest.open_deposit_account(andy)
+    natwest.open_deposit_account(rich)
+    
+    firm.pay_many([x.deposit_account_number for x in [neil, andy, rich]], [10, 20, 30])
+    
+    assert firm.deposit_balance == 40
+    assert neil.deposit_balance == 10
+    assert andy.deposit_balance == 20
+    assert rich.deposit_balance == 30
+    assert barclays.deposit_balance == -50
+    assert natwest.deposit_balance == 50
+    
+    with pytest.raises(Exception):
+        firm.pay_many([neil.deposit_account_number, andy.deposit_account_number], 25)
+    assert firm.deposit_balance == 40
+    
+def test_pay_many_rejects_negative_values():
+    model = Model(num_banks=1, num_households=2, num_firms=10)
+    bank = model.banks[0]
+    firm = model.firms[0]
+    neil, andy = model.households
+    for agent in [firm, neil, andy]:
+        bank.open_deposit_account(agent)
+    bank.credit(firm.deposit_account_number, 100)
+    bank.credit(andy.deposit_account_number, 100)
+    
+    # Within the firm's funds in total, but taking 50 from andy
+    for values in [[80, -50], [10, np.nan], [10, np.inf]]:
+        with pytest.raises(ValueError):
+            firm.pay_many([neil.deposit_account_number, andy.deposit_account_number], values)
+    assert [x.deposit_balance for x in [firm, neil, andy]] == [100, 0, 100]
+
+def test_deferred_net_settlement():
+    model = Model(num_banks=2, num_households=2, num_firms=10, net_settlement=True)
+    barclays = model.banks[0]
+    natwest  = model.banks[1]
+    neil  = model.households[0]
+    andy  = model.households[1]    
+    barclays.open_deposit_account(neil)
+    barclays.credit(neil.deposit_account_number, 100)
+    natwest.open_deposit_account(andy)
+    natwest.credit(andy.deposit_account_number, 100)
+    
+    neil.pay(andy.deposit_account_number, 24)
+    andy.pay(neil.deposit_account_number, 10)
+    neil.pay(andy.deposit_account_number, 6)
+    
+    assert neil.deposit_balance == 80
+    assert andy.deposit_balance == 120
+    assert barclays.deposit_balance == 0
+    assert natwest.deposit_balance == 0
+    
+    model.central_bank.settle_net_positions()
+    
+    assert barclays.deposit_balance == -20
+    assert natwest.deposit_balance == 20
+    
+    model.central_bank.settle_net_positions()
+    assert barclays.deposit_balance == -20
+
+def test_failed_net_settlement_stays_pending(monkeypatch):
+    model = Model(num_banks=3, num_households=3, num_firms=10, net_settlement=True)
+    central_bank = model.central_bank
+    households = model.households
+    for bank, household in zip(model.banks, households):
+        bank.open_deposit_account(household)
+        bank.credit(household.deposit_account_number, 100)
+    households[0].pay(households[1].deposit_account_number, 30)
+    households[0].pay(households[2].deposit_account_number, 20)
+    
+    # The first net transfer settles, the second fails
+    settle_payment = CentralBank.settle_payment
+    def settle_once(self, *args):
+        monkeypatch.setattr(CentralBank, 'settle_payment', failing)
+        return settle_payment(self, *args)
+    def failing(self, *args):
+        raise ValueError('Reserves short')
+    monkeypatch.setattr(CentralBank, 'settle_payment', settle_once)
+    with pytest.raises(ValueError):
+        central_bank.settle_net_positions()
+    assert [bank.deposit_balance for bank in model.banks] == [-30, 30, 0]
+    
+    monkeypatch.setattr(CentralBank, 'settle_payment', settle_payment)
+    central_bank.settle_net_positions()
+    assert [bank.deposit_balance for bank in model.banks] == [-50, 30, 20]
+    
 #test overdraft
 #test sectoral balance sheet
 
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 11:40:05 2026
+
+@author: andre
+"""
+
+
+import pytest
+import numpy as np
+from agent_based_economy.model import Model
+from agent_based_economy.consumption import ConsumptionEngine
+
+def shopping_model(**kwargs):
+    model = Model(num_households=4, num_firms=2, num_banks=2, **kwargs)
+    firm_a, firm_b = model.firms
+    model.firms[0].open_deposit_account(model.banks[0])
+    model.firms[1].open_deposit_account(model.banks[1])
+    for i, hh in enumerate(model.households):
+        hh.open_deposit_account(model.banks[i % 2])
+    model.government_helicopter_drop(model.households, 1000)
+
+    firm_a.goods_price, firm_a.inventory = 10, 50
+    firm_b.goods_price, firm_b.inventory = 20, 100
+    for hh, demand in zip(model.households, [40, 30, 20, 60]):
+        hh.preferred_suppliers = [firm_a] * 7
+        hh.current_demand = demand
+    model.households[3].preferred_suppliers = [firm_b] * 7
+    return model
+
+def test_engine_matches_sequential_purchases():
+    sequential = shopping_model()
+    for hh in sequential.households:
+        hh.day()
+
+    batched = shopping_model()
+    ConsumptionEngine(batched, seed=0, chunk_size=1).day()
+
+    for model in [sequential, batched]:
+        assert [firm.inventory for firm in model.firms] == [0, 50]
+        assert [firm.deposit_balance for firm in model.firms] == [500, 1000]
+        assert [hh.deposit_balance for hh in model.households] == [600, 900, 1000, 0]
+        assert [hh.unsatisfied_demand for hh in model.households] == [0, 19, 19, 7]
+        assert [len(hh.blackmarked_firms) for hh in model.households] == [0, 7, 7, 0]
+        assert model.banks[1].deposit_balance == 1900
+
+def test_engine_conserves_money_and_goods():
+    model = shopping_model()
+    model.households[1].preferred_suppliers = [model.firms[0], model.firms[1]] * 3 + [model.firms[1]]
+    goods = sum(firm.inventory + firm.current_demand for firm in model.firms)
+    ConsumptionEngine(model, seed=3).day()
+
+    assert sum(firm.inventory + firm.current_demand for firm in model.firms) == goods
+    assert sum(agent.deposit_balance for agent in model.households + model.firms) == 4000
+    assert all(hh.deposit_balance >= 0 for hh in model.households)
+
+def test_engine_shuffles_preferred_suppliers():
+    model = Model(num_households=50, num_firms=7)
+    model.randomly_allocate_banks(model.firms + model.households)
+    for hh in model.households:
+        hh.preferred_suppliers = list(model.firms)
+    lists = [hh.preferred_suppliers for hh in model.households]
+    ConsumptionEngine(model, seed=1).day()
+
+    assert all(hh.preferred_suppliers is order for hh, order in zip(model.households, lists))
+    assert all(sorted(order, key=id) == sorted(model.firms, key=id) for order in lists)
+    # Every supplier comes last for someone, so each can be price tested
+    assert {order[-1] for order in lists} == set(model.firms)
+
+def test_model_uses_engine_when_requested():
+    model = Model(num_households=10, num_firms=2, vectorised_consumption=True)
+    assert isinstance(model.consumption_engine, ConsumptionEngine)
+    assert Model(num_households=10, num_firms=2).consumption_engine is None
@@ -292,6 +292,38 @@ def test_deposit_ledger_transfer_invalid_sender_and_recipient():
     with pytest.raises(TypeError):
         ledger.debit(18, 'andy', 39)
     
+def test_deposit_ledger_transfer_many():    
+    ledger = DepositLedger(model)    
+    acc1 = ledger.create(neil, andy, 100)
+    acc2 = ledger.create(andy, rich, 50)
+    acc3 = ledger.create(rich, andy, 20)
+    
+    applied = ledger.transfer_many([acc1, acc1, acc2], [acc2, acc3, acc3], [30, 40, 50])
+    assert applied.all()
+    assert ledger.get(acc1).value == 30
+    assert ledger.get(acc2).value == 30
+    assert ledger.get(acc3).value == 110
+    
+    with pytest.raises(ValueError):
+        ledger.transfer_many([acc1, acc1], [acc2, acc3], [20, 20])
+    assert ledger.get(acc1).value == 30
+    
+    with pytest.raises(ValueError):
+        ledger.transfer_many([acc1], [12], [1])
+
+def test_deposit_ledger_transfer_many_partial():    
+    ledger = DepositLedger(model)    
+    acc1 = ledger.create(neil, andy, 100)
+    acc2 = ledger.create(andy, rich, 50, overdraft=100)
+    acc3 = ledger.create(rich, andy, 20)
+    
+    applied = ledger.transfer_many([acc1, acc2, acc1, acc3], [acc3, acc1, acc2, acc1], [60, 120, 60, 5], 
+                                   partial=True)
+    assert list(applied) == [False, True, False, True]
+    assert ledger.get(acc1).value == 225
+    assert ledger.get(acc2).value == -70
+    assert ledger.get(acc3).value == 15
+    
 def test_deposit_ledger_apply_interest():       
     ledger = DepositLedger(model)    
     acc1 = ledger.create(neil, andy, 100, 1)
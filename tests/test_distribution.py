@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:40:05 2026
+
+@author: andre
+"""
+
+
+import pytest
+import numpy as np
+from agent_based_economy.distribution import Distribution
+from agent_based_economy.model import Model, DataCollector, inequality_reporters
+import agent_based_economy.reporting as reporting
+
+def test_statistics_match_direct_calculation():
+    rng = np.random.default_rng(1)
+    x = rng.lognormal(3, 1, 1001)
+    d = Distribution(rng.permutation(x))
+    s = np.sort(x)
+    N = len(s)
+    
+    B = np.sum(s * (N - np.arange(N))) / (N * s.sum())
+    assert d.gini() == pytest.approx(1 + (1 / N) - 2 * B)
+    assert d.quantile([0.1, 0.5, 0.99]) == pytest.approx(np.quantile(x, [0.1, 0.5, 0.99]))
+    assert d.quantile(0.5) == pytest.approx(np.median(x))
+    
+    population, shares = d.lorenz()
+    assert (population[0], shares[0], population[-1], shares[-1]) == (0, 0, 1, pytest.approx(1))
+    assert np.all(np.diff(shares) >= 0)
+    assert d.lorenz([0.5]) == pytest.approx(s[:N//2].sum()/s.sum() + 0.5*s[N//2]/s.sum())
+    
+    assert Distribution(np.arange(1, 11)).top_share(0.1) == pytest.approx(10/55)
+    assert Distribution(np.arange(1, 11)).bottom_share(0.4) == pytest.approx(10/55)
+    assert Distribution(np.arange(1, 11)).palma() == pytest.approx(1)
+    
+def test_degenerate_distributions():
+    assert Distribution([]).gini() == 0
+    assert Distribution([0, 0, 0]).gini() == 0
+    assert np.isnan(Distribution([]).quantile(0.5))
+    assert np.isnan(Distribution([0, 0, 5]).palma())
+    assert Distribution([1, 1, 1, 1]).gini() == pytest.approx(0)
+    
+def test_inequality_reporters_sort_each_field_once(monkeypatch):
+    model = Model(num_households=30, num_firms=3)
+    model.randomly_allocate_banks(model.firms + model.households)
+    for i, hh in enumerate(model.households):
+        model.government.pay(hh.deposit_account_number, 10 * i)
+        hh.planned_consumption = i % 7
+    model.firms[0].wage_rate = 100
+    model.firms[1].wage_rate = 200
+    for i, hh in enumerate(model.households[:10]):
+        model.firms[i // 5].hire(hh)
+    
+    sorted_fields = []
+    class CountingDistribution(Distribution):
+        def __init__(self, values):
+            sorted_fields.append(len(values))
+            super().__init__(values)
+    monkeypatch.setattr(reporting, 'Distribution', CountingDistribution)
+    
+    collector = DataCollector(model, inequality_reporters)
+    collector.collect(0)
+    assert sorted_fields == [30, 30, 30]
+    
+    row = collector.df.loc[0]
+    wages = [hh.employer.wage_rate if hh.employer else 0 for hh in model.household_population.agents]
+    assert sorted(wages)[-10:] == [100]*5 + [200]*5
+    assert row['Wage Gini'] == pytest.approx(Distribution(wages).gini())
+    assert row['Deposit top 10% share'] == pytest.approx(sum(10 * i for i in range(27, 30)) / sum(10 * i for i in range(30)))
+    assert row['Consumption Palma'] == pytest.approx(Distribution([i % 7 for i in range(30)]).palma())
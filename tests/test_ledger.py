@@ -9,7 +9,7 @@ Created on Sat Nov  5 18:34:16 2022
 import pytest
 import pandas as pd
 import numpy as np
-from agent_based_economy.ledgers import Ledger, DepositLedger, BondLedger, LoanLedger
+from agent_based_economy.ledgers import Ledger, DepositLedger, BondLedger, LoanLedger, StockLedger, TaxLedger
 from agent_based_economy.model import Model
 from agent_based_economy.agents.agent import Agent
 
@@ -112,6 +112,100 @@ def test_ledger_options():
     
     rec1 = ledger.get(acc1)
     assert rec1['interest_rate'] == 2
+
+def test_ledger_grows_past_capacity():
+    ledger = Ledger(model)
+    for i in range(3 * Ledger.initial_capacity):
+        ledger.create(issuer=neil, holder=andy, value=i)
+    assert len(ledger) == 3 * Ledger.initial_capacity
+    assert ledger.get(150).value == 150
+    assert ledger.records_by_holder(andy).value.sum() == sum(range(3 * Ledger.initial_capacity))
+
+def test_ledger_drop_keeps_ids_after_compaction():
+    ledger = Ledger(model)
+    for i in range(4 * Ledger.initial_capacity):
+        ledger.create(issuer=neil, holder=andy, value=i)
+    for i in range(0, 4 * Ledger.initial_capacity, 4):
+        ledger.drop(i)
+    for i in range(1, 4 * Ledger.initial_capacity, 4):
+        ledger.drop(i)
+    assert len(ledger) == 2 * Ledger.initial_capacity
+    assert ledger.account_exists(0) == False
+    assert ledger.get(2).value == 2
+    assert ledger.get(255).value == 255
+    assert ledger.create(issuer=rich, holder=andy, value=7) == 4 * Ledger.initial_capacity
+    
+def test_ledger_stores_agent_ids():
+    ledger = Ledger(model)
+    acc = ledger.create(issuer=neil, holder=andy, value=100)
+    assert ledger.df.holder.dtype == np.int64
+    assert ledger.holder_id(acc) == andy.unique_id
+    assert ledger.holder(acc) is andy
+    assert model.agent(neil.unique_id) is neil
+    assert list(ledger.indexes_by_holder(andy.unique_id)) == [acc]
+    
+def test_ledger_pickle():
+    import pickle
+    ledger = Ledger(model)
+    ledger.create(issuer=neil, holder=andy, value=100)
+    ledger.create(issuer=rich, holder=andy, value=50)
+    copy = pickle.loads(pickle.dumps(ledger))
+    assert copy.model is None
+    assert len(copy) == 2
+    assert copy.df.equals(ledger.df)
+    assert copy.records_by_holder(andy.unique_id, except_issuers=[rich.unique_id]).value.sum() == 100
+    
+def test_ledger_indexes_match_scan():
+    ledger = Ledger(model)
+    agents = [neil, andy, rich]
+    for i in range(200):
+        ledger.create(issuer=agents[i % 3], holder=agents[(i // 3) % 3], value=i)
+    for i in range(0, 200, 7):
+        ledger.drop(i)
+    df = ledger.df
+    for issuer in agents:
+        scan = df.index[df.issuer == issuer.unique_id]
+        assert (ledger.indexes_by_issuer(issuer) == scan).all()
+        for holder in agents:
+            scan = df.index[(df.issuer == issuer.unique_id) & (df.holder == holder.unique_id)]
+            assert (ledger.indexes_by_issuer_and_holder(issuer, holder) == scan).all()
+    scan = df.index[(df.holder == andy.unique_id) & (df.issuer != neil.unique_id)]
+    assert (ledger.indexes_by_holder(andy, except_issuers=[neil]) == scan).all()
+    
+def test_ledger_bulk_append():
+    ledger = Ledger(model)
+    ids = ledger._append(5, issuer=neil, holder=rich, value=10)
+    assert list(ids) == [0, 1, 2, 3, 4]
+    assert (ledger.df.holder == rich.unique_id).all()
+    assert ledger.records([1, 3]).value.sum() == 20
+    
+def test_ledger_drop_many():
+    ledger = Ledger(model)
+    agents = [neil, andy, rich]
+    for i in range(300):
+        ledger.create(issuer=agents[i % 3], holder=agents[(i // 3) % 3], value=i)
+    ledger.drop_many(list(range(0, 300, 2)) + [4])
+    assert len(ledger) == 150
+    assert ledger.df.index.tolist() == list(range(1, 300, 2))
+    df = ledger.df
+    for issuer in agents:
+        for holder in agents:
+            scan = df.index[(df.issuer == issuer.unique_id) & (df.holder == holder.unique_id)]
+            assert (ledger.indexes_by_issuer_and_holder(issuer, holder) == scan).all()
+    with pytest.raises(ValueError):
+        ledger.drop_many([0, 1])
+    
+@pytest.mark.parametrize('ledger_class', [StockLedger, TaxLedger])
+def test_holder_only_ledgers(ledger_class):
+    ledger = ledger_class(model)
+    first  = ledger.create(holder=neil, value=1)
+    second = ledger.create(holder=andy, value=2)
+    assert ledger.get(first).holder is neil
+    assert ledger.indexes_by_holder(andy).tolist() == [second]
+    assert ledger.drop(first)
+    ledger.drop_many([second])
+    assert len(ledger) == 0
+    assert len(ledger.indexes_by_holder(neil)) == 0
     
     
     
@@ -226,6 +226,23 @@ def test_loan_ledger_extend_invalid_accout():
     with pytest.raises(ValueError):
         ledger.extend_loan('andy', 39, 1, 240)
     
+def test_loan_ledger_extend_many():
+    ledger = LoanLedger(model)    
+    acc1 = ledger.create(neil, andy, 100, 1, 240)
+    acc2 = ledger.create(andy, rich, 50, 1, 240)
+    acc3 = ledger.create(rich, andy, 20, 1, 240)
+    day = model.schedule.day
+    
+    ledger.extend_loans([acc1, acc3], [10, 30], [2, 3], np.array([100, 300]))
+    assert ledger.df.value.tolist() == [110, 50, 50]
+    assert ledger.loans_due(day + 100).tolist() == [acc1]
+    assert ledger.loans_due(day + 300).tolist() == [acc3]
+    assert ledger.loans_due(240).tolist() == [acc2]
+    
+    ledger.extend_loans([acc1, acc2], [1, 1], [2, 2], 50)
+    assert ledger.loans_due(day + 50).tolist() == [acc1, acc2]
+    assert len(ledger.loans_due(day + 100)) == 0
+    
 def test_loan_ledger_apply_interest():       
     ledger = LoanLedger(model)    
     acc1 = ledger.create(neil, andy, 100, 1, 240, 1)
@@ -295,4 +312,16 @@ def test_update_interest_rate_by_lender():
     
     assert records.loc[0].interest_rate == 5
     assert records.loc[1].interest_rate == 2
-    
\ No newline at end of file
+    
+def test_loans_due_follow_changes():
+    ledger = LoanLedger(model)    
+    acc1 = ledger.create(neil, andy, 100, 1, 240, 1)
+    acc2 = ledger.create(neil, rich,  50, 1, 240, 2)
+    acc3 = ledger.create(rich, andy,  20, 1, 300, 3)
+    assert ledger.loans_due(240).tolist() == [acc1, acc2]
+    
+    ledger.extend_loan(acc1, 10, 1, 300)
+    ledger.writedown_loan(acc3, 20)
+    ledger.drop(acc2)
+    assert len(ledger.loans_due(240)) == 0
+    assert ledger.loans_due(model.schedule.day + 300).tolist() == [acc1]
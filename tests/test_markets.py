@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:35:52 2026
+
+@author: andre
+"""
+
+
+import random
+import pytest
+import numpy as np
+import pandas as pd
+from agent_based_economy.markets import Market, BondExchange
+from agent_based_economy.model import Model
+
+class DataFrameMarket(Market):
+    '''
+    The previous order book, re-sorting a DataFrame on every order, kept 
+    as a reference for the fills
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.offering_df_ = pd.DataFrame(columns = ['offerer', 'quantity', 'price'])
+        self.seeking_df_  = pd.DataFrame(columns = ['seeker',  'quantity', 'price'])
+        self.fills = []
+        
+    def register_offer(self, seller, quantity, price):   
+        new_row = pd.DataFrame({'offerer': seller, 'quantity': quantity, 'price': price}, index=[len(self.offering_df_)])
+        self.offering_df_ = pd.concat([self.offering_df_, new_row]) if len(self.offering_df_) else new_row
+        self.offering_df_.sort_values('price', ascending=True, inplace=True)
+    
+    def register_interest(self, buyer, quantity, price):  
+        new_row = pd.DataFrame({'seeker': buyer, 'quantity': quantity, 'price': price}, index=[len(self.seeking_df_)])
+        self.seeking_df_ = pd.concat([self.seeking_df_, new_row]) if len(self.seeking_df_) else new_row
+        self.seeking_df_.sort_values('price', ascending=False, inplace=True)
+        
+    def match_next(self):
+        if (len(self.offering_df_) > 0) & (len(self.seeking_df_) > 0):
+            if (self.offering_df_.iloc[0]['price'] <= self.seeking_df_.iloc[0]['price']):
+                seeker   = self.seeking_df_.iloc[0]['seeker']
+                offerer  = self.offering_df_.iloc[0]['offerer']
+                quantity = np.min([self.offering_df_.iloc[0]['quantity'], self.seeking_df_.iloc[0]['quantity']])
+                price    = self.offering_df_.iloc[0]['price'] if self.use_offered_price else self.seeking_df_.iloc[0]['price']
+                self.transact(offerer, seeker, quantity, price)
+                self.offering_df_.iat[0, 1] -= quantity
+                self.seeking_df_.iat[0, 1]  -= quantity
+                self.offering_df_ = self.offering_df_[self.offering_df_['quantity'] != 0]
+                self.seeking_df_  = self.seeking_df_[self.seeking_df_['quantity'] != 0]
+                self.track_price(price, quantity)
+                return True
+        return False
+    
+    def transact(self, offerer, seeker, quantity, price):
+        self.fills.append((offerer, seeker, quantity, price))
+    
+class RecordingMarket(Market):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fills = []
+        
+    def transact(self, offerer, seeker, quantity, price):
+        self.fills.append((offerer, seeker, quantity, price))
+
+def random_orders(seed, n):
+    rng = random.Random(seed)
+    prices = rng.sample(range(1, 1000), 2*n)
+    return ([('offer', f'o{i}', rng.choice([0, rng.randint(1, 50)]), prices[i]) for i in range(n)] + 
+            [('bid',   f'b{i}', rng.choice([0, rng.randint(1, 50)]), prices[n+i]) for i in range(n)])
+
+@pytest.mark.parametrize('use_offered_price', [True, False])
+@pytest.mark.parametrize('seed', range(5))
+def test_order_book_matches_dataframe_book(seed, use_offered_price):
+    orders = random_orders(seed, 40)
+    random.Random(seed).shuffle(orders)
+    # Ties in price are kept in order of arrival
+    orders += [('offer', 'tie0', 5, 1), ('offer', 'tie1', 5, 1), ('bid', 'tie2', 7, 999), ('bid', 'tie3', 7, 999)]
+    
+    markets = [DataFrameMarket(None, use_offered_price=use_offered_price), 
+               RecordingMarket(None, use_offered_price=use_offered_price)]
+    for market in markets:
+        for i, (side, agent, quantity, price) in enumerate(orders):
+            if side == 'offer':
+                market.register_offer(agent, quantity, price)
+            else:
+                market.register_interest(agent, quantity, price)
+            if i % 10 == 9:
+                market.clear_market()
+        market.clear_market()
+    
+    reference, book = markets
+    assert book.fills == reference.fills
+    assert len(book.fills) > 10
+    assert book.market_price == pytest.approx(reference.market_price)
+    assert book.offering_df.quantity.tolist() == reference.offering_df_.quantity.tolist()
+    assert book.seeking_df.seeker.tolist() == reference.seeking_df_.seeker.tolist()
+
+def test_close_market_empties_book():
+    market = RecordingMarket(None)
+    market.register_offer('a', 10, 5)
+    market.register_interest('b', 4, 3)
+    assert len(market.offers) == len(market.bids) == 1
+    market.close_market()
+    assert len(market.offering_df) == len(market.seeking_df) == 0
+    assert market.match_next() == False
+
+@pytest.mark.parametrize('use_offered_price', [True, False])
+@pytest.mark.parametrize('seed', range(5))
+def test_batch_clearing_matches_sequential(seed, use_offered_price):
+    orders = random_orders(seed, 40)
+    random.Random(seed).shuffle(orders)
+    
+    markets = [RecordingMarket(None, use_offered_price=use_offered_price), 
+               RecordingMarket(None, use_offered_price=use_offered_price, batch_clearing=True)]
+    for market in markets:
+        for i, (side, agent, quantity, price) in enumerate(orders):
+            if side == 'offer':
+                market.register_offer(agent, quantity, price)
+            else:
+                market.register_interest(agent, quantity, price)
+            if i % 10 == 9:
+                market.clear_market()
+        market.clear_market()
+    
+    # Orders registered with nothing to trade give empty fills one at a time
+    sequential, batch = markets
+    assert batch.fills == [fill for fill in sequential.fills if fill[2] > 0]
+    assert len(batch.fills) > 10
+    assert batch.market_price == pytest.approx(sequential.market_price)
+    assert batch.offering_df.quantity.tolist() == sequential.offering_df.quantity.tolist()
+    assert batch.seeking_df.seeker.tolist() == sequential.seeking_df.seeker.tolist()
+
+def test_cross_stops_where_prices_part():
+    market = RecordingMarket(None)
+    market.register_offer('a', 5, 10)
+    market.register_offer('b', 5, 12)
+    market.register_offer('c', 5, 20)
+    market.register_interest('x', 7, 15)
+    market.register_interest('y', 6, 11)
+    offers, bids, quantities, prices = market.cross()
+    assert [(o.agent, b.agent) for o, b in zip(offers, bids)] == [('a', 'x'), ('b', 'x')]
+    assert quantities.tolist() == [5, 2]
+    assert prices.tolist() == [10, 12]
+
+def bond_auction(batch_clearing, audit):
+    model = Model(num_banks=3, real=False, audit_bonds=audit, batch_clearing=batch_clearing)
+    government = model.government
+    for bank in model.banks:
+        government.pay(bank.deposit_account_number, 10000)
+    
+    bonds = government.create_bonds(5000, 2, 1)
+    maturity_date = model.bond_ledger.get(bonds[0]).maturity_date
+    market = model.bond_exchange(maturity_date, 2)
+    # Too little for a bond at the first price
+    market.register_interest(model.banks[0], 50, 99.5)
+    government.offer_bonds(maturity_date, 2, 2000, 97)
+    government.offer_bonds(maturity_date, 2, 3000, 98)
+    for i, bank in enumerate(model.banks):
+        market.register_interest(bank, 1500 + 1000*i, 99 - i)
+    market.clear_market()
+    
+    ledger = model.bond_ledger
+    held = [ledger.records_by_holder(x).quantity.sum() for x in [government] + model.banks]
+    return held, [x.deposit_balance for x in [government] + model.banks], market.market_price
+
+@pytest.mark.parametrize('audit', [False, True])
+def test_batch_bond_sales_match_sequential(audit):
+    held, balances, price = bond_auction(True, audit)
+    expected_held, expected_balances, expected_price = bond_auction(False, audit)
+    assert held == expected_held
+    assert sum(held) == 50
+    assert balances == pytest.approx(expected_balances)
+    assert price == pytest.approx(expected_price)
+
+@pytest.mark.parametrize('audit', [False, True])
+def test_bond_indexes_by_holder(audit):
+    model = Model(num_banks=1, real=False, audit_bonds=audit)
+    government, bank = model.government, model.banks[0]
+    government.pay(bank.deposit_account_number, 10000)
+    
+    bonds = government.create_bonds(5000, 2, 1)
+    maturity_date = model.bond_ledger.get(bonds[0]).maturity_date
+    market = model.bond_exchange(maturity_date, 2)
+    government.offer_bonds(maturity_date, 2, 3000, 98)
+    market.register_interest(bank, 1000, 99)
+    market.clear_market()
+    
+    records = market.get_bond_indexes_by_holder(bank)
+    assert records.quantity.sum() == 10
+    assert (records.holder == bank.unique_id).all()
+    assert market.get_bond_indexes_by_holder(government).quantity.sum() == 40
+
+def test_failed_batch_bond_sale_is_not_paid_for():
+    model = Model(num_banks=2, real=False, batch_clearing=True)
+    government, seller, buyer = model.government, *model.banks
+    for bank in model.banks:
+        government.pay(bank.deposit_account_number, 10000)
+    bonds = government.create_bonds(5000, 2, 1)
+    maturity_date = model.bond_ledger.get(bonds[0]).maturity_date
+    government.sell_bonds(seller, 100, bonds, [30])
+    market = model.bond_exchange(maturity_date, 2)
+    balances = [bank.deposit_balance for bank in model.banks]
+    
+    # The seller cannot buy its own bonds, so no fill is settled
+    with pytest.raises(ValueError):
+        market.transact_many([seller, seller], [buyer, seller], np.array([1000.0, 1000.0]), np.array([100.0, 100.0]))
+    assert [bank.deposit_balance for bank in model.banks] == balances
+    assert market.holdings(seller)[1].sum() == 30
+
+def interbank_day(batch_clearing):
+    model = Model(num_banks=4, real=False, batch_clearing=batch_clearing)
+    model.government.pay(model.banks[0].deposit_account_number, 1000)
+    model.government.pay(model.banks[1].deposit_account_number, 300)
+    model.deposit_ledger.debit(model.banks[2].deposit_account_number, 700)
+    model.deposit_ledger.debit(model.banks[3].deposit_account_number, 900)
+    model.schedule.interbank_market()
+    return model.loan_ledger.df[['issuer', 'holder', 'value', 'interest_rate', 'maturity_date']]
+
+def test_batch_interbank_loans_match_sequential():
+    loans = interbank_day(True)
+    expected = interbank_day(False)
+    pd.testing.assert_frame_equal(loans, expected)
+    # Surplus banks lend 1300 and the central bank the other 300
+    assert loans.value.sum() == pytest.approx(1600)
+
+@pytest.mark.parametrize('n_fills', [0, 3, 50, 70])
+def test_track_prices_matches_track_price(n_fills):
+    one_at_a_time, together = RecordingMarket(None), RecordingMarket(None)
+    for market in [one_at_a_time, together]:
+        market.track_price(1.5, 2)
+    prices, quantities = np.arange(n_fills) + 10.0, np.arange(n_fills) + 1.0
+    for price, quantity in zip(prices, quantities):
+        one_at_a_time.track_price(price, quantity)
+    together.track_prices(prices, quantities)
+    np.testing.assert_array_equal(together.recent_prices, one_at_a_time.recent_prices)
+    np.testing.assert_array_equal(together.recent_quantities, one_at_a_time.recent_quantities)
+
+def test_bond_markets_retire_at_maturity():
+    model = Model(num_banks=1, real=False)
+    government, bank = model.government, model.banks[0]
+    government.pay(bank.deposit_account_number, 10000)
+    
+    bonds = government.create_bonds(5000, 2, 1)
+    maturity_date = model.bond_ledger.get(bonds[0]).maturity_date
+    exchange = model.bond_exchange
+    assert exchange(maturity_date, 2) is exchange.register_bond_issue(maturity_date, 2.0)
+    assert exchange.market_exists(np.float64(maturity_date), 2)
+    
+    government.offer_bonds(maturity_date, 2, 3000, 98)
+    exchange(maturity_date, 2).register_interest(bank, 1000, 99)
+    exchange(maturity_date, 2).clear_market()
+    price = exchange(maturity_date, 2).market_price
+    
+    while model.schedule.day <= maturity_date:
+        model.step()
+    assert len(exchange.markets) == len(exchange.list_bond_issues()) == 0
+    assert exchange(maturity_date, 2) is None
+    assert exchange.archive[(maturity_date, 2)]['market_price'] == price
+    assert exchange.archive_df[['price', 'quantity']].values.tolist() == [[98, 1000]]
+
+def test_price_to_yield_inverts_yield_to_price():
+    rng = np.random.default_rng(0)
+    n = 5000
+    maturity_date  = rng.integers(1, 2520, n).astype(float)
+    desired_yield  = rng.uniform(-5, 30, n)
+    coupon_rate    = rng.choice([0, 0.5, 2, 5], n)
+    price = BondExchange.yield_to_price(0, maturity_date, desired_yield, coupon_rate)
+    
+    solved = BondExchange.price_to_yield(0, maturity_date, price, coupon_rate)
+    assert solved == pytest.approx(desired_yield, abs=1e-6)
+    assert BondExchange.yield_to_price(0, maturity_date, solved, coupon_rate) == pytest.approx(price)
+    
+def test_price_to_yield_edge_cases():
+    assert BondExchange.price_to_yield(0, 252, 95, 0) == pytest.approx(100*(100/95 - 1))
+    assert BondExchange.price_to_yield(0, 252, 100, 2) == pytest.approx(2, abs=0.05)
+    assert np.isnan(BondExchange.price_to_yield(252, 252, 100, 2))
+    assert np.isnan(BondExchange.price_to_yield(0, 252, 0, 2))
+    assert np.isnan(BondExchange.price_to_yield(0, 252, 1e9, 2))
+    assert BondExchange.price_to_yield(0, [252, 504], 99, 2).shape == (2,)
+
+def test_market_yields():
+    model = Model(num_banks=1, real=False)
+    government, bank = model.government, model.banks[0]
+    government.pay(bank.deposit_account_number, 10000)
+    
+    bonds = government.create_bonds(5000, 2, 2)
+    maturity_date = model.bond_ledger.get(bonds[0]).maturity_date
+    market = model.bond_exchange(maturity_date, 2)
+    assert np.isnan(market.market_yield)
+    
+    government.offer_bonds(maturity_date, 2, 3000, 98)
+    market.register_interest(bank, 1000, 99)
+    market.clear_market()
+    assert market.market_yield > 2
+    assert BondExchange.yield_to_price(0, maturity_date, market.market_yield, 2,
+                                       days_in_year=model.schedule.days_in_year) == pytest.approx(98)
+    
+    curve = model.bond_exchange.yield_curve()
+    assert curve.maturity_date.tolist() == [maturity_date]
+    assert curve.market_yield.tolist() == [market.market_yield]
@@ -7,9 +7,10 @@ Created on Mon Jun 26 19:09:38 2023
 
 
 import pytest
+import random
 import pandas as pd
 import numpy as np
-from agent_based_economy.model import Model
+from agent_based_economy.model import Model, DataCollector, inequality_reporters
 from agent_based_economy.agents.government import Government
 from agent_based_economy.agents.banks import CentralBank
 from agent_based_economy.ledgers import DepositLedger, LoanLedger
@@ -81,4 +82,104 @@ def test_model_calendar():
     assert model.schedule.year_day == 35
     assert model.schedule.month_day == 14
     assert model.schedule.start_of_this_year == 1008
-    assert model.schedule.start_of_this_month == 1029
\ No newline at end of file
+    assert model.schedule.start_of_this_month == 1029
+    
+def test_datacollector_buffers_grow_and_overwrite():
+    model = Model(num_households=10, num_firms=2)
+    collector = DataCollector(model, {'Day':  lambda m: m.schedule.day,
+                                      'Half': lambda m: m.schedule.day/2}, capacity=2)
+    for day in range(5):
+        model.schedule.steps = day
+        collector.collect(day)
+    df = collector.df
+    assert df is collector.df
+    assert collector.capacity == 8
+    assert df.index.tolist() == [0, 1, 2, 3, 4]
+    assert df.Half.tolist() == [0, 0.5, 1, 1.5, 2]
+    
+    model.schedule.steps = 10
+    collector.collect(2)
+    assert len(collector) == 5
+    assert collector.df.loc[2].tolist() == [10, 5]
+    
+def test_datacollector_column_types_follow_values():
+    model = Model(num_households=10, num_firms=2)
+    collector = DataCollector(model, {'Day':   lambda m: m.schedule.day,
+                                      'Odd':   lambda m: m.schedule.day % 2 == 1,
+                                      'Ratio': lambda m: m.schedule.day if m.schedule.day < 3 else m.schedule.day / 2,
+                                      'Label': lambda m: f'day {m.schedule.day}'}, capacity=2)
+    for day in range(5):
+        model.schedule.steps = day
+        collector.collect(day)
+    df = collector.df
+    assert df.dtypes.tolist() == [np.int64, bool, np.float64, object]
+    assert df.Day.tolist() == [0, 1, 2, 3, 4]
+    assert df.Ratio.tolist() == [0, 1, 2, 1.5, 2]
+    assert df.Label.tolist() == [f'day {day}' for day in range(5)]
+    assert df.to_csv().splitlines()[1] == '0,0,False,0.0,day 0'
+    
+def warmed_up_model(days, **kwargs):
+    random.seed(3)
+    np.random.seed(3)
+    model = Model(num_households=100, num_firms=10, num_banks=2, **kwargs)
+    model.randomly_allocate_banks(model.firms + model.households)
+    model.government_helicopter_drop(model.households, 2500)
+    for day in range(days):
+        model.step(save_output=True)
+    return model
+    
+def test_checkpoint_restores_identical_branches(tmp_path):
+    model = warmed_up_model(42, model_reporters=inequality_reporters, vectorised_consumption=True)
+    path = tmp_path / 'warm.pkl.gz'
+    model.save_checkpoint(path)
+    
+    branches = [model]
+    for branch in range(3):
+        for day in range(42):
+            branches[-1].step(save_output=True)
+        # The random generators are global, so load each branch as it is run
+        branches.append(Model.load_checkpoint(path))
+    restored = branches.pop()
+    assert restored is not branches[1]
+    assert restored.deposit_ledger.model is restored
+    assert restored.agent(restored.households[0].unique_id) is restored.households[0]
+    
+    for branch in branches[1:]:
+        assert branch.schedule.day == model.schedule.day
+        pd.testing.assert_frame_equal(branch.datacollector.df, model.datacollector.df)
+        pd.testing.assert_frame_equal(branch.deposit_ledger.df, model.deposit_ledger.df)
+        for name in model.household_population.columns:
+            np.testing.assert_array_equal(branch.household_population[name], model.household_population[name])
+    
+def test_checkpoint_restores_bond_markets(tmp_path):
+    model = Model(num_banks=2, real=False)
+    government = model.government
+    for bank in model.banks:
+        government.pay(bank.deposit_account_number, 5000)
+    bonds = government.create_bonds(100 * 100, 2, 1)
+    maturity_date = model.bond_ledger.get(bonds[0])['maturity_date']
+    government.offer_bonds(maturity_date, 2, 100 * 100, 99)
+    model.bond_exchange(maturity_date, 2).register_interest(model.banks[0], 5000, 99)
+    
+    path = tmp_path / 'bonds.pkl'
+    model.save_checkpoint(path)
+    restored = Model.load_checkpoint(path)
+    
+    assert restored.bond_ledger.model is restored
+    assert list(restored.bond_exchange.markets) == list(model.bond_exchange.markets)
+    for branch in (model, restored):
+        branch.bond_exchange(maturity_date, 2).clear_market()
+        
+    assert restored.banks[0].deposit_balance == model.banks[0].deposit_balance < 5000
+    holdings = [branch.bond_ledger.holdings(branch.banks[0], maturity_date, 2) for branch in (model, restored)]
+    assert holdings[0].tolist() == holdings[1].tolist()
+    assert restored.bond_ledger.quantities(holdings[1]).sum() == model.bond_ledger.quantities(holdings[0]).sum() > 0
+    
+def test_checkpoint_leaves_output_behind(tmp_path):
+    model = warmed_up_model(0)
+    model.open_output(tmp_path / 'out.csv')
+    path = tmp_path / 'model.pkl'
+    model.save_checkpoint(path)
+    assert model.output is not None
+    assert Model.load_checkpoint(path).output is None
+    model.close_output()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:31:09 2026
+
+@author: andre
+"""
+
+
+import atexit
+import pytest
+import numpy as np
+import pandas as pd
+from agent_based_economy.model import Model, DataCollector
+from agent_based_economy.output import OutputSink
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+        
+    def __call__(self):
+        return self.now
+
+def collector_of_days():
+    model = Model(num_households=10, num_firms=2)
+    return model, DataCollector(model, {'Day': lambda m: m.schedule.day})
+
+def collect(model, collector, days):
+    for day in days:
+        model.schedule.steps = day
+        collector.collect(day)
+
+def test_csv_sink_appends_new_rows(tmp_path):
+    model, collector = collector_of_days()
+    file_name = tmp_path / 'output.csv'
+    file_name.write_text('left over from an earlier run\n')
+    sink = OutputSink(collector, file_name, flush_rows=3)
+    
+    collect(model, collector, range(2))
+    assert not sink.maybe_flush()
+    assert sink.pending == 2
+    collect(model, collector, range(2, 7))
+    assert sink.maybe_flush()
+    assert sink.pending == 0
+    collect(model, collector, [7])
+    assert sink.flush()
+    assert not sink.flush()
+    
+    written = pd.read_csv(file_name, index_col=0)
+    pd.testing.assert_frame_equal(written, collector.df, check_dtype=False)
+
+def test_sink_flushes_by_time(tmp_path):
+    model, collector = collector_of_days()
+    clock = Clock()
+    sink = OutputSink(collector, tmp_path / 'output.csv', flush_seconds=10, clock=clock)
+    collect(model, collector, range(5))
+    assert not sink.maybe_flush()
+    clock.now = 10
+    assert sink.maybe_flush()
+    assert sink.flushed == 5
+    
+def test_model_streams_output(tmp_path):
+    file_name = str(tmp_path / 'output.csv')
+    model = Model(num_households=0, num_firms=0, num_banks=1, real=False, 
+                  model_reporters={'Day': lambda m: m.schedule.day})
+    for i in range(2*model.schedule.days_in_month + 1):
+        model.step(output_frequency='d', save_output=True, file_name=file_name)
+    
+    assert model.output.file_name == file_name
+    model.close_output()
+    assert model.output is None
+    written = pd.read_csv(file_name, index_col=0)
+    assert len(written) == len(model.datacollector) == 2*model.schedule.days_in_month + 1
+    assert written.index.tolist() == model.datacollector.df.index.tolist()
+
+def test_model_output_flushed_at_exit(tmp_path, monkeypatch):
+    hooks = []
+    monkeypatch.setattr(atexit, 'register', hooks.append)
+    monkeypatch.setattr(atexit, 'unregister', hooks.remove)
+    file_name = str(tmp_path / 'output.csv')
+    model = Model(num_households=0, num_firms=0, num_banks=1, real=False, 
+                  model_reporters={'Day': lambda m: m.schedule.day})
+    for i in range(15):
+        model.step(output_frequency='d', save_output=True, file_name=file_name)
+    assert len(pd.read_csv(file_name, index_col=0)) == OutputSink.default_flush_rows
+    
+    # The run ends without close_output
+    [hook] = hooks
+    hook()
+    assert len(pd.read_csv(file_name, index_col=0)) == 15
+    model.close_output()
+    assert hooks == []
+
+def test_model_passes_flush_settings(tmp_path):
+    file_name = str(tmp_path / 'output.csv')
+    model = Model(num_households=0, num_firms=0, num_banks=1, real=False, 
+                  model_reporters={'Day': lambda m: m.schedule.day})
+    for i in range(7):
+        model.step(output_frequency='d', save_output=True, file_name=file_name, flush_rows=3)
+    assert (model.output.flush_rows, model.output.flush_seconds) == (3, None)
+    assert len(pd.read_csv(file_name, index_col=0)) == 6
+    
+    model.close_output()
+    
+    sink = OutputSink(model.datacollector, file_name)
+    assert (sink.flush_rows, sink.flush_seconds) == (OutputSink.default_flush_rows, OutputSink.default_flush_seconds)
+
+def test_parquet_sink_writes_parts(tmp_path):
+    pytest.importorskip('pyarrow')
+    model, collector = collector_of_days()
+    sink = OutputSink(collector, tmp_path / 'output.parquet', flush_rows=2)
+    for day in range(5):
+        collect(model, collector, [day])
+        sink.maybe_flush()
+    sink.flush()
+    assert sink.parts == 3
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / 'output.parquet'), collector.df)
+
+def test_unknown_format():
+    model, collector = collector_of_days()
+    with pytest.raises(ValueError):
+        OutputSink(collector, 'output.txt', format='xlsx')
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:21:48 2026
+
+@author: andre
+"""
+
+
+import pytest
+import numpy as np
+from agent_based_economy.model import Model, count_employed, sum_inventory, compute_gini
+from agent_based_economy.agents.household import Household, adjust_reservation_wages
+
+def test_population_columns_follow_fields():
+    model = Model(num_households=3, num_firms=2)
+    households = model.household_population
+    assert len(households) == 3
+    assert households.agents == model.households
+
+    hh = model.households[1]
+    hh.reservation_wage = 42
+    assert households['reservation_wage'][1] == 42
+    households['current_demand'][:] = [1, 2, 3]
+    assert hh.current_demand == 2
+    assert hh.deposit_account_number is None
+    assert hh.employer is None
+
+def test_population_grows():
+    model = Model(num_households=2, num_firms=1)
+    extra = [Household(model) for i in range(10)]
+    assert len(model.household_population) == 12
+    assert model.household_population.capacity >= 12
+    extra[-1].income = 5
+    model.households[0].income = 7
+    assert model.household_population['income'][[0, 11]].tolist() == [7, 5]
+
+def test_member_fields_resolve_agents():
+    model = Model(num_households=3, num_firms=2)
+    firm = model.firms[1]
+    worker = model.households[2]
+    firm.hire(worker)
+    assert worker.employer is firm
+    assert model.household_population['employer'].tolist() == [-1, -1, 1]
+    firm.give_notice()
+    assert firm.worker_on_notice is worker
+    assert count_employed(model) == 1
+
+def test_reporters_match_agents():
+    model = Model(num_households=20, num_firms=4)
+    model.randomly_allocate_banks(model.households)
+    for i, hh in enumerate(model.households):
+        model.government.pay(hh.deposit_account_number, 10 * i)
+    for i, firm in enumerate(model.firms):
+        firm.inventory = i
+    assert sum_inventory(model) == 6
+
+    x = sorted([hh.deposit_balance for hh in model.households])
+    N = len(x)
+    B = sum(xi * (N - i) for i, xi in enumerate(x)) / (N * sum(x))
+    assert compute_gini(model) == pytest.approx(1 + (1 / N) - 2 * B)
+
+def test_vectorised_reservation_wages_match_agents():
+    model = Model(num_households=4, num_firms=2)
+    expected = Model(num_households=4, num_firms=2)
+    for m in [model, expected]:
+        m.firms[0].wage_rate = 100
+        m.firms[0].hire(m.households[0])
+        m.firms[0].hire(m.households[1])
+        m.households[1].reservation_wage = 150
+        m.households[2].reservation_wage = 50
+
+    for hh in expected.households:
+        hh.month_end()
+    adjust_reservation_wages(model)
+
+    assert [hh.reservation_wage for hh in model.households] == \
+           [hh.reservation_wage for hh in expected.households]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:02:14 2026
+
+@author: andre
+"""
+
+
+import json
+import itertools
+import pytest
+from agent_based_economy.model import Model, Scheduler
+from agent_based_economy.profiler import StepProfiler
+
+def test_profiler_records_every_phase():
+    model = Model(num_households=20, num_firms=10, num_banks=2, profile=True)
+    model.randomly_allocate_banks(model.firms + model.households)
+    for i in range(3):
+        model.step()
+
+    df = model.profiler.df
+    assert len(df) == 3 * len(Scheduler.phases)
+    assert list(df.loc[0].index) == list(Scheduler.phases)
+    assert (df.calls == 1).all()
+    assert (df.seconds >= 0).all()
+    assert (df.deposit_ledger_rows == len(model.deposit_ledger)).all()
+
+    summary = model.profiler.summary()
+    assert set(summary.index) == set(Scheduler.phases)
+    assert (summary.steps == 3).all()
+    assert summary.share.sum() == pytest.approx(1)
+
+def test_profiler_uses_clock_and_exports_json(tmp_path):
+    model = Model(num_households=0, num_firms=0, num_banks=1, real=False)
+    ticks = itertools.count()
+    model.profiler = StepProfiler(model, clock=lambda: next(ticks))
+    model.step()
+    model.profiler.run('extra', 0, lambda: None)
+    model.profiler.run('extra', 0, lambda: None)
+
+    records = json.loads(model.profiler.to_json())
+    assert records[0] == {'step': 0, 'phase': 'deposit_interest', 'seconds': 1, 'calls': 1,
+                          'deposit_ledger_rows': 3, 'loan_ledger_rows': 1, 'bond_ledger_rows': 0}
+    assert records[-1]['calls'] == 2 and records[-1]['seconds'] == 2
+
+    model.profiler.to_json(tmp_path / 'profile.json')
+    assert json.load(open(tmp_path / 'profile.json')) == records
+    model.profiler.reset()
+    assert len(model.profiler.df) == 0
+
+def test_profiler_off_by_default():
+    assert Model(num_households=2, num_firms=1).profiler is None
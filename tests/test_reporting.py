@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:40:12 2026
+
+@author: andre
+"""
+
+
+import pytest
+import numpy as np
+from agent_based_economy.model import Model, DataCollector, default_model_reporters, compute_gini, sum_liquidity
+from agent_based_economy.reporting import Fields, reporter, distribution_reporter
+
+def funded_model():
+    model = Model(num_households=20, num_firms=4)
+    model.randomly_allocate_banks(model.firms + model.households)
+    for i, hh in enumerate(model.households):
+        model.government.pay(hh.deposit_account_number, 10 * i)
+    model.government.pay(model.firms[0].deposit_account_number, 50)
+    return model
+
+def test_fields_gather_once():
+    model = funded_model()
+    data = Fields(model)
+    balances = data['households.deposit_balance']
+    assert balances.tolist() == [hh.deposit_balance for hh in model.household_population.agents]
+    assert data['households.deposit_balance'] is balances
+    assert data['firms.deposit_balance'].sum() == 50
+    assert np.shares_memory(data['firms.inventory'], model.firm_population.columns['inventory'])
+    assert data['households.is_unemployed'].tolist() == [hh.is_unemployed() for hh in model.household_population.agents]
+    with pytest.raises(KeyError):
+        data['banks.deposit_balance']
+
+def test_reporters_share_fields(monkeypatch):
+    model = funded_model()
+    calls = []
+    balances = Fields.derived['deposit_balance']
+    monkeypatch.setitem(Fields.derived, 'deposit_balance', lambda m, p: calls.append(p) or balances(m, p))
+    
+    @reporter('households.reservation_wage')
+    def top_reservation_wage(model, data):
+        return data['households.reservation_wage'].max()
+    
+    reporters = dict(default_model_reporters, Liquidity=sum_liquidity, 
+                     Top=top_reservation_wage, Day=lambda m: m.schedule.day)
+    collector = DataCollector(model, reporters)
+    assert 'households.deposit_balance' in collector.fields
+    collector.collect(0)
+    assert len(calls) == 2   # households and firms, once each
+    
+    row = collector.df.loc[0]
+    assert row.Gini == pytest.approx(compute_gini(model))
+    assert row.Liquidity == pytest.approx(sum(10 * i for i in range(20)) + 50)
+    assert row.Top == max(hh.reservation_wage for hh in model.households)
+    assert row.Day == 0
+    
+    
+def test_distribution_reporter_pickles():
+    import pickle
+    model = funded_model()
+    top_share = distribution_reporter('households.deposit_balance', 'top_share', 0.1)
+    assert top_share.fields == ('households.deposit_balance',)
+    assert top_share.__name__ == 'top_share_of_households_deposit_balance'
+    
+    copy = pickle.loads(pickle.dumps(top_share))
+    expected = Fields(model).distribution('households.deposit_balance').top_share(0.1)
+    assert copy(model) == top_share(model, Fields(model)) == expected